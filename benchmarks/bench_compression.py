@@ -0,0 +1,95 @@
+"""
+benchmarks/bench_compression.py
+
+Measures what gzip compression of dynamic responses costs and saves:
+response bytes, compression ratio and CPU time per request for a large
+task page, a JSON task list and a CSV export, uncompressed and at
+several COMPRESS_LEVEL settings.
+
+Usage:
+
+    python benchmarks/bench_compression.py --tasks 20000 --page-size 100 --repeat 50
+
+Tyler Huntington, 2018
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from project import app, db
+from loadtest import seed, PASSWORD
+
+ROUTES = [
+    '/tasks/',
+    '/api/v1/tasks/?per_page={page_size}',
+    '/api/v1/tasks/export/?format=csv',
+]
+
+
+"""
+measure(client, url, repeat, gzip)
+
+Requests a url `repeat` times and returns the body size and the average
+CPU milliseconds per request.
+"""
+def measure(client, url, repeat, gzip):
+    headers = {'Accept-Encoding': 'gzip'} if gzip else {}
+    size = 0
+    start = time.process_time()
+    for i in range(repeat):
+        response = client.get(url, headers=headers)
+        size = len(response.data)
+    elapsed = time.process_time() - start
+    return size, elapsed * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'compression.db')
+        seed(path, args.users, args.tasks, 4, 2018)
+
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+        app.config['LOGIN_THROTTLE_ENABLED'] = False
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['OPEN_TASKS_PER_PAGE'] = args.page_size
+        app.config['MAX_TASKS_PER_PAGE'] = args.page_size
+        client = app.test_client()
+        client.post('/', data=dict(name='user0000001', password=PASSWORD))
+        client.get('/tasks/')
+
+        print("{0:<40} {1:>6} {2:>10} {3:>7} {4:>9}".format(
+            'route', 'level', 'bytes', 'ratio', 'cpu/req'))
+        for route in ROUTES:
+            url = route.format(page_size=args.page_size)
+            plain, plain_ms = measure(client, url, args.repeat, False)
+            print("{0:<40} {1:>6} {2:>10} {3:>7} {4:>7.2f}ms".format(
+                url, '-', plain, '', plain_ms))
+            for level in args.levels:
+                app.config['COMPRESS_LEVEL'] = level
+                size, cpu_ms = measure(client, url, args.repeat, True)
+                print("{0:<40} {1:>6} {2:>10} {3:>6.1f}x {4:>7.2f}ms "
+                        "({5:+.2f}ms)".format('', level, size,
+                            float(plain) / size, cpu_ms, cpu_ms - plain_ms))
+        db.engine.dispose()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
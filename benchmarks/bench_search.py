@@ -0,0 +1,98 @@
+"""
+benchmarks/bench_search.py
+
+Measures task search latency on a freshly seeded database: p50, p95
+and p99 of search_tasks() for a few searches, with and without
+filters, and the plan of the index query of the first one. The seeded
+task names come from a small vocabulary, so every word matches a large
+share of the tasks, which is the worst case for the search.
+
+Usage:
+
+    python benchmarks/bench_search.py --users 10000 --tasks 1000000 --repeat 200
+
+Tyler Huntington, 2018
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from project import app, db
+from project.tasks.search import parse_query, search_tasks
+from loadtest import seed, percentile
+
+# (label, search text, filters)
+SEARCHES = [
+    ('word', 'dentist', {}),
+    ('prefix', 'groc', {}),
+    ('two words', 'quarterly rev', {}),
+    ('common word', 'the', {}),
+    ('open only', 'taxes', {'status': 1}),
+    ('priority', 'flights', {'priority': 5}),
+    ('owner', 'budget', {'user_id': 1}),
+    ('owner, open', 'the', {'user_id': 1, 'status': 1}),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=25)
+    parser.add_argument('--db', help='reuse a database seeded by an '
+            'earlier run')
+    args = parser.parse_args()
+
+    directory = None
+    if args.db is None:
+        directory = tempfile.mkdtemp()
+        args.db = os.path.join(directory, 'search.db')
+        start = time.time()
+        seed(args.db, args.users, args.tasks, 4, 2018)
+        print("seeded {0} users and {1} tasks in {2:.1f}s".format(
+            args.users, args.tasks, time.time() - start))
+
+    try:
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + args.db
+        with app.app_context():
+            plan = db.session.execute("""EXPLAIN QUERY PLAN SELECT rowid
+                FROM tasks_fts WHERE tasks_fts MATCH :match
+                ORDER BY rowid DESC LIMIT :candidates""",
+                {'match': parse_query(SEARCHES[0][1]),
+                    'candidates': app.config['SEARCH_CANDIDATES']})
+            for row in plan:
+                print("plan: {}".format(row[-1]))
+
+            print("{0:<14} {1:<15} {2:>8} {3:>10} {4:>10} {5:>10}".format(
+                'search', 'text', 'results', 'p50', 'p95', 'p99'))
+            for label, text, filters in SEARCHES:
+                timings = []
+                for i in range(args.repeat):
+                    start = time.time()
+                    results = search_tasks(text, limit=args.limit,
+                            candidates=app.config['SEARCH_CANDIDATES'],
+                            **filters)
+                    timings.append(time.time() - start)
+                    db.session.remove()
+                timings.sort()
+                print("{0:<14} {1:<15} {2:>8} {3:>8.2f}ms {4:>8.2f}ms "
+                        "{5:>8.2f}ms".format(label, text, len(results),
+                            percentile(timings, 0.5) * 1000,
+                            percentile(timings, 0.95) * 1000,
+                            percentile(timings, 0.99) * 1000))
+            db.engine.dispose()
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
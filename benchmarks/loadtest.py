@@ -0,0 +1,314 @@
+"""
+benchmarks/loadtest.py
+
+Load test of the Docket web app. Seeds a scratch database with
+--users users and --tasks tasks (see project/datagen.py), then runs --clients client processes
+against the WSGI app for --seconds seconds. Each client logs in as its
+own seeded user and keeps sending a weighted mix of register, login,
+/tasks/, /add/, /complete/ and /delete/ requests, one at a time, like a
+sync gunicorn worker serving one user each.
+
+Throughput and p50/p95/p99 latency are reported per route and can be
+saved as JSON. A later run can be compared against saved results with
+--baseline; the script exits with status 1 when a route's p95 latency
+or throughput is worse than the baseline by more than --max-regression.
+
+Everything runs in-process through the Flask test client, so no server
+or network is involved.
+
+Usage:
+
+    python benchmarks/loadtest.py --users 10000 --tasks 1000000 \\
+            --clients 8 --seconds 30 --output results.json
+    python benchmarks/loadtest.py ... --baseline results.json
+
+Tyler Huntington, 2018
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from project import app, bcrypt, db
+from project.datagen import generate
+
+PASSWORD = 'benchmark'
+
+# relative frequency of each route in a client's request mix
+ROUTE_WEIGHTS = [
+    ('GET /tasks/', 50),
+    ('POST /add/', 15),
+    ('GET /complete/<id>/', 10),
+    ('GET /delete/<id>/', 10),
+    ('POST / (login)', 10),
+    ('POST /register/', 5),
+]
+
+
+"""
+seed(path, users, tasks, rounds, random_seed)
+
+Creates the schema in a new database and fills it with synthetic users
+and tasks. Every user's password is PASSWORD.
+"""
+def seed(path, users, tasks, rounds, random_seed):
+    engine = db.create_engine('sqlite:///' + path, {})
+    db.metadata.create_all(engine)
+    pw_hash = bcrypt.generate_password_hash(PASSWORD, rounds)
+    if not isinstance(pw_hash, str):
+        pw_hash = pw_hash.decode('utf-8')
+    generate(engine, users, tasks, pw_hash, seed=random_seed)
+    engine.dispose()
+
+
+"""
+owned_tasks(path, user_id)
+
+Returns the ids of the open tasks of a user.
+"""
+def owned_tasks(path, user_id):
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute("""SELECT task_id
+            FROM tasks WHERE user_id = ? AND status = 1""", (user_id,))]
+    finally:
+        connection.close()
+
+
+"""
+percentile(values, fraction)
+
+Nearest-rank percentile of a sorted list.
+"""
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Client(object):
+    """
+    One simulated user: a test client with its own session cookie,
+    logged in as seeded user `user_id`.
+    """
+
+    def __init__(self, index, user_id, task_ids, rng):
+        self.index = index
+        self.user_id = user_id
+        self.rng = rng
+        self.http = app.test_client()
+        self.name = 'user{:07d}'.format(user_id)
+        self.registered = 0
+        self.task_ids = task_ids
+        rng.shuffle(self.task_ids)
+
+    def login(self):
+        return self.http.post('/', data=dict(name=self.name,
+            password=PASSWORD))
+
+    def request(self, route):
+        if route == 'GET /tasks/':
+            return self.http.get('/tasks/')
+        if route == 'POST /add/':
+            due = datetime.date.today() + datetime.timedelta(
+                    days=self.rng.randint(0, 365))
+            return self.http.post('/add/', data=dict(
+                name='Benchmark task', due_date=due.strftime('%m/%d/%Y'),
+                priority=str(self.rng.randint(1, 10))))
+        if route == 'GET /complete/<id>/':
+            task_id = self.rng.choice(self.task_ids) if self.task_ids else 0
+            return self.http.get('/complete/{}/'.format(task_id))
+        if route == 'GET /delete/<id>/':
+            task_id = self.task_ids.pop() if self.task_ids else 0
+            return self.http.get('/delete/{}/'.format(task_id))
+        if route == 'POST / (login)':
+            return self.login()
+        if route == 'POST /register/':
+            self.registered += 1
+            name = 'c{0:04d}r{1:06d}'.format(self.index, self.registered)
+            return self.http.post('/register/', data=dict(name=name,
+                email=name + '@docket.test', password=PASSWORD,
+                confirm=PASSWORD))
+        raise ValueError(route)
+
+
+"""
+client_process(index, args, results)
+
+Runs one client until time runs out and puts its samples, a dict of
+route -> list of (latency, ok), on the results queue.
+"""
+def client_process(index, args, results):
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + args.db
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['LOGIN_THROTTLE_ENABLED'] = False
+    app.config['BCRYPT_LOG_ROUNDS'] = args.bcrypt_rounds
+
+    rng = random.Random('{0}-{1}'.format(args.seed, index))
+    routes = [route for route, weight in ROUTE_WEIGHTS]
+    weights = [weight for route, weight in ROUTE_WEIGHTS]
+    user_id = index % args.users + 1
+    client = Client(index, user_id, owned_tasks(args.db, user_id), rng)
+    client.login()
+
+    samples = dict((route, []) for route in routes)
+    started = time.time()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.seconds
+    while True:
+        route = rng.choices(routes, weights)[0]
+        before = time.time()
+        if before >= deadline:
+            break
+        response = client.request(route)
+        after = time.time()
+        if before >= measure_from:
+            samples[route].append((after - before,
+                response.status_code < 400))
+
+    db.engine.dispose()
+    results.put(samples)
+
+
+"""
+summarize(samples, seconds)
+
+Reduces the samples of every client to per-route statistics.
+"""
+def summarize(samples, seconds):
+    routes = {}
+    for route, weight in ROUTE_WEIGHTS:
+        rows = [row for client in samples for row in client[route]]
+        latencies = sorted(latency for latency, ok in rows)
+        routes[route] = {
+            'requests': len(rows),
+            'errors': sum(1 for latency, ok in rows if not ok),
+            'per_second': len(rows) / float(seconds),
+            'p50_ms': ms(percentile(latencies, 0.50)),
+            'p95_ms': ms(percentile(latencies, 0.95)),
+            'p99_ms': ms(percentile(latencies, 0.99)),
+        }
+    return routes
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+"""
+compare(results, baseline, max_regression)
+
+Prints the change of every route against a baseline run.
+
+Returns:
+    the routes whose p95 latency or throughput regressed by more than
+    `max_regression` (a fraction)
+"""
+def compare(results, baseline, max_regression):
+    regressions = []
+    print("\n{0:<22} {1:>14} {2:>14}".format('vs baseline', 'req/s',
+        'p95'))
+    for route, current in sorted(results['routes'].items()):
+        before = baseline['routes'].get(route)
+        if not before or not before['requests'] or not current['requests']:
+            continue
+        throughput = current['per_second'] / before['per_second'] - 1
+        p95 = current['p95_ms'] / before['p95_ms'] - 1
+        print("{0:<22} {1:>+13.1%} {2:>+13.1%}".format(route, throughput,
+            p95))
+        if throughput < -max_regression or p95 > max_regression:
+            regressions.append(route)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=20,
+            help='measured duration')
+    parser.add_argument('--warmup', type=float, default=2,
+            help='seconds of requests left out of the results')
+    parser.add_argument('--seed', type=int, default=2018)
+    parser.add_argument('--bcrypt-rounds', type=int,
+            default=app.config['BCRYPT_LOG_ROUNDS'])
+    parser.add_argument('--db', help='reuse a database seeded by an '
+            'earlier run (it is modified by the run)')
+    parser.add_argument('--output', help='save the results as JSON')
+    parser.add_argument('--baseline', help='results JSON to compare with')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    directory = None
+    if args.db is None:
+        directory = tempfile.mkdtemp()
+        args.db = os.path.join(directory, 'loadtest.db')
+        start = time.time()
+        seed(args.db, args.users, args.tasks, args.bcrypt_rounds, args.seed)
+        print("seeded {0} users and {1} tasks in {2:.1f}s".format(
+            args.users, args.tasks, time.time() - start))
+
+    try:
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=client_process,
+            args=(index, args, results)) for index in range(args.clients)]
+        for process in processes:
+            process.start()
+        samples = [results.get() for process in processes]
+        for process in processes:
+            process.join()
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+    results = {
+        'meta': {
+            'date': datetime.datetime.utcnow().isoformat(),
+            'users': args.users,
+            'tasks': args.tasks,
+            'clients': args.clients,
+            'seconds': args.seconds,
+            'seed': args.seed,
+            'bcrypt_rounds': args.bcrypt_rounds,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'routes': summarize(samples, args.seconds),
+    }
+
+    print("{0:<22} {1:>9} {2:>7} {3:>9} {4:>10} {5:>10} {6:>10}".format(
+        'route', 'requests', 'errors', 'req/s', 'p50', 'p95', 'p99'))
+    for route, weight in ROUTE_WEIGHTS:
+        row = results['routes'][route]
+        print("{0:<22} {1:>9} {2:>7} {3:>9.1f} {4:>8.1f}ms {5:>8.1f}ms "
+                "{6:>8.1f}ms".format(route, row['requests'], row['errors'],
+                    row['per_second'], row['p50_ms'] or 0,
+                    row['p95_ms'] or 0, row['p99_ms'] or 0))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\nregressed: {}".format(', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
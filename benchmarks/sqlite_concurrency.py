@@ -0,0 +1,176 @@
+"""
+benchmarks/sqlite_concurrency.py
+
+Measures read throughput of the task list query while other processes
+keep writing tasks, once with SQLite's defaults (rollback journal, no
+busy timeout, a new connection per checkout) and once with the engine
+settings from project/_config.py (WAL, pragmas, pooled connections).
+
+Usage:
+
+    python benchmarks/sqlite_concurrency.py --readers 4 --writers 1 --seconds 10
+
+Tyler Huntington, 2018
+"""
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from project import app, db
+from project.database import set_sqlite_pragmas
+
+PAGE_QUERY = text("""SELECT tasks.task_id, tasks.name, tasks.due_date,
+        tasks.priority, users.name FROM tasks
+        LEFT OUTER JOIN users ON users.id = tasks.user_id
+        WHERE tasks.status = 1 ORDER BY tasks.due_date, tasks.task_id
+        LIMIT 26""")
+
+INSERT_TASK = text("""INSERT INTO tasks (name, due_date, priority, status,
+        user_id, posted_date) VALUES (:name, :due_date, :priority, 1, 1,
+        :posted_date)""")
+
+
+"""
+make_engine(path, tuned)
+
+Creates an engine on the benchmark database, either with SQLite's
+defaults or with the app's pool and pragma settings.
+"""
+def make_engine(path, tuned):
+    url = 'sqlite:///' + path
+    if not tuned:
+        return create_engine(url, poolclass=NullPool)
+
+    engine = create_engine(url, poolclass=QueuePool,
+            pool_size=app.config['SQLALCHEMY_POOL_SIZE'],
+            max_overflow=app.config['SQLALCHEMY_MAX_OVERFLOW'],
+            connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, app.config['SQLITE_PRAGMAS'])
+
+    return engine
+
+
+"""
+seed(path, tasks)
+
+Creates the schema and a user with `tasks` open tasks.
+"""
+def seed(path, tasks):
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    today = datetime.date.today()
+    with engine.begin() as connection:
+        connection.execute(text("""INSERT INTO users (name, email,
+            password, role) VALUES ('bench', 'bench@docket', 'x', 'user')"""))
+        connection.execute(INSERT_TASK, [dict(name='Task {}'.format(i),
+            due_date=today + datetime.timedelta(days=i % 365),
+            priority=i % 10 + 1, posted_date=today) for i in range(tasks)])
+    engine.dispose()
+
+
+"""
+worker(role, path, tuned, seconds, results)
+
+Runs reads or writes against the database until time runs out and
+puts (role, operations, errors, latencies) on the results queue.
+"""
+def worker(role, path, tuned, seconds, results):
+    engine = make_engine(path, tuned)
+    deadline = time.time() + seconds
+    operations = errors = 0
+    latencies = []
+
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            if role == 'read':
+                with engine.connect() as connection:
+                    connection.execute(PAGE_QUERY).fetchall()
+            else:
+                with engine.begin() as connection:
+                    connection.execute(INSERT_TASK, name='New task',
+                            due_date=datetime.date.today(),
+                            priority=random.randint(1, 10),
+                            posted_date=datetime.date.today())
+            operations += 1
+            latencies.append(time.time() - start)
+        except OperationalError:
+            errors += 1
+
+    engine.dispose()
+    results.put((role, operations, errors, latencies))
+
+
+"""
+run(tuned, args)
+
+Runs one benchmark round on a fresh database and returns its summary.
+"""
+def run(tuned, args):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.db')
+    seed(path, args.tasks)
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker,
+        args=(role, path, tuned, args.seconds, results))
+        for role in ['read'] * args.readers + ['write'] * args.writers]
+    for process in processes:
+        process.start()
+    collected = [results.get() for process in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role in ('read', 'write'):
+        rows = [r for r in collected if r[0] == role]
+        latencies = sorted(l for r in rows for l in r[3])
+        summary[role] = {
+            'per_second': sum(r[1] for r in rows) / float(args.seconds),
+            'errors': sum(r[2] for r in rows),
+            'p99_ms': (latencies[int(len(latencies) * 0.99)] * 1000
+                if latencies else None),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--tasks', type=int, default=10000,
+            help='open tasks seeded before the run')
+    args = parser.parse_args()
+
+    print("{0:<8} {1:>10} {2:>8} {3:>10} {4:>10} {5:>8} {6:>10}".format(
+        'engine', 'reads/s', 'errors', 'read p99', 'writes/s', 'errors',
+        'write p99'))
+    for name, tuned in (('default', False), ('tuned', True)):
+        summary = run(tuned, args)
+        read, write = summary['read'], summary['write']
+        print("{0:<8} {1:>10.1f} {2:>8} {3:>8.1f}ms {4:>10.1f} {5:>8} "
+                "{6:>8.1f}ms".format(name, read['per_second'],
+                    read['errors'], read['p99_ms'] or 0,
+                    write['per_second'], write['errors'],
+                    write['p99_ms'] or 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,74 +1,68 @@
-
-from views import db
-from _config import DATABASE_PATH
-
-import sqlite3
-from datetime import datetime
-
-#with sqlite3.connect(DATABASE_PATH) as con:
-#
-#    # get cursor from db
-#    c = con.cursor()
-#
-#    # temporarily change the name of tasks table
-#    c.execute("""ALTER TABLE tasks RENAME TO old_tasks""")
-#
-#    # re-create a new tasks table with new schema
-#    db.create_all()
-#
-#    # retrieve data from old tasks table
-#    c.execute("""SELECT name, due_date, priority, status FROM old_tasks \
-#            ORDER BY task_id ASC""")
-#
-#    # save all rows as a list of tuples; set posted date to current time and user_id to 1
-#    data = [(row[0], row[1], row[2], row[3], datetime.now(), 1) for row in c.fetchall()]
-#
-#    # insert data into tasks folder
-#    c.executemany("""INSERT INTO tasks (name, due_date, priority, status, posted_date, \
-#            user_id) VALUES(?, ?, ?, ?, ?, ?)""", data)
-#
-#    # delete old tasks table
-#    c.execute("""DROP TABLE old_tasks""")
-#
-
-with sqlite3.connect(DATABASE_PATH) as con:
-
-    # get cursor
-    c = con.cursor()
-
-    # temporarily change the name of the users table
-    c.execute("""ALTER TABLE users RENAME TO old_users""")
-
-    # re-create new users table with updated schema
-    db.create_all()
-
-    # retrieve data from old users table
-    c.execute("""SELECT name, email, password FROM old_users \
-            ORDER BY id ASC""")
-
-    # save all rows as a list of tuples and set role to user
-    data = [(row[0], row[1], row[2], 'user') for row in c.fetchall()]
-
-    # insert data into users table
-    c.executemany("""INSERT INTO users (name, email, password, role) \
-            VALUES(?, ?, ?, ?)""", data)
-
-    # delete old users table
-    c.execute("""DROP TABLE old_users""")
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+"""
+db_migrate.py
+
+Brings a Docket database up to the current schema by applying the
+pending migrations from project/migrations.py. Safe to run again: an
+interrupted run resumes from its last checkpoint.
+
+Usage:
+
+    python db_migrate.py                  # apply every pending migration
+    python db_migrate.py --status         # show the recorded version
+    python db_migrate.py --target 2 --batch-size 10000 --db other.db
+
+Tyler Huntington, 2018
+"""
+
+# imports
+import argparse
+import sys
+
+from project._config import DATABASE_PATH
+from project.migrations import Migrator
+
+
+def report(migration, table, copied, total, rows_per_second):
+    percent = 100.0 * copied / total if total else 100.0
+    sys.stdout.write("\r  {0}: {1}/{2} rows ({3:.1f}%), {4:.0f} rows/s".format(
+        table, copied, total, percent, rows_per_second))
+    if copied >= total:
+        sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DATABASE_PATH)
+    parser.add_argument('--target', type=int,
+            help='stop at this schema version')
+    parser.add_argument('--batch-size', type=int, default=5000,
+            help='rows copied per transaction')
+    parser.add_argument('--status', action='store_true',
+            help='show the schema version and pending migrations')
+    args = parser.parse_args()
+
+    migrator = Migrator(args.db, args.batch_size, report)
+    try:
+        migrator.prepare()
+        if args.status:
+            print("schema version: {}".format(migrator.version()))
+            for migration in migrator.pending(args.target):
+                print("pending: {0} {1}".format(migration.version,
+                    migration.name))
+            return
+
+        before = migrator.version()
+        for migration in migrator.pending(args.target):
+            print("migration {0}: {1}".format(migration.version,
+                migration.name))
+        done = migrator.migrate(args.target)
+        print("schema version {0} -> {1} ({2} applied)".format(before,
+            migrator.version(), len(done)))
+    finally:
+        migrator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+gunicorn_config.py
+
+Gunicorn settings for Docket app. Every value can be overridden from
+the environment:
+
+    PORT                   port to listen on (5000)
+    WEB_CONCURRENCY        worker processes (2 x CPUs + 1)
+    GUNICORN_WORKER_CLASS  'sync' or 'gthread' (sync)
+    GUNICORN_THREADS       threads per gthread worker (4)
+    GUNICORN_MAX_REQUESTS  requests a worker serves before it is
+                           replaced, 0 to never recycle (1000)
+    GUNICORN_TIMEOUT       seconds a worker may spend on a request (30)
+
+Tyler Huntington, 2018
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 5000))
+
+# sync workers block on each request, so run a couple per core; gthread
+# workers serve several requests at once, one per thread
+workers = int(os.environ.get('WEB_CONCURRENCY',
+    multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS',
+    4 if worker_class == 'gthread' else 1))
+
+# load the app once in the master and fork the workers from it
+preload_app = True
+
+# replace workers after a while to cap slow memory growth; the jitter
+# keeps them from all restarting at the same moment
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# the worker heartbeat file; a tmpfs avoids stalls on a busy disk
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def when_ready(server):
+    from wsgi import warm_up, freeze_heap
+    warm_up()
+    freeze_heap()
+
+
+def post_fork(server, worker):
+    from wsgi import after_fork
+    after_fork()
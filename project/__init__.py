@@ -5,42 +5,105 @@ Main controller for integrating blueprints of Docket app.
 
 Tyler Huntington, 2018
 '''
-import datetime
-from flask import Flask, render_template, request   
-from flask_sqlalchemy import SQLAlchemy
+import time
+from flask import Flask, g, render_template, request
 from flask_bcrypt import Bcrypt
+from project.assets import Assets
+from project.cache import make_cache
+from project.compression import GzipMiddleware
+from project.database import DocketSQLAlchemy
+from project.logwriter import AsyncLogWriter
+from project.metrics import RequestMetrics
+from project.passwords import PasswordHasher, HasherBusy
+from project.sqlmonitor import QueryMonitor
+from project.throttle import LoginThrottle
 
 app = Flask(__name__)
 app.config.from_pyfile('_config.py')
 bcrypt = Bcrypt(app)
-db = SQLAlchemy(app)
+hasher = PasswordHasher(app, bcrypt)
+throttle = LoginThrottle(app)
+db = DocketSQLAlchemy(app)
+cache = make_cache(app.config)
+metrics = RequestMetrics(app)
+assets = Assets(app)
+GzipMiddleware(app)
+
+
+"""
+make_log_writer(path)
+
+Builds a background log writer for `path` using the LOG_* settings.
+"""
+def make_log_writer(path):
+    return AsyncLogWriter(path,
+            max_bytes=app.config['LOG_MAX_BYTES'],
+            rotate_seconds=app.config['LOG_ROTATE_SECONDS'],
+            backup_count=app.config['LOG_BACKUP_COUNT'],
+            queue_size=app.config['LOG_QUEUE_SIZE'],
+            flush_interval=app.config['LOG_FLUSH_INTERVAL'])
+
+
+error_log = make_log_writer(app.config['ERROR_LOG_PATH'])
+access_log = make_log_writer(app.config['ACCESS_LOG_PATH'])
+sql_log = make_log_writer(app.config['SQL_LOG_PATH'])
+sql_monitor = QueryMonitor(app, sql_log)
 
 # import blueprints
 from project.users.views import users_blueprint
 from project.tasks.views import tasks_blueprint
+from project.api.views import api_blueprint
 
 # register blueprints
 app.register_blueprint(users_blueprint)
 app.register_blueprint(tasks_blueprint)
+app.register_blueprint(api_blueprint)
+
+# register command line tools
+import project.commands
+
+# access log
+@app.before_request
+def start_timer():
+    g.request_started = time.time()
+
+
+@app.after_request
+def log_request(response):
+    if app.config['ACCESS_LOG_ENABLED']:
+        started = g.get('request_started')
+        access_log.write(
+                event='request',
+                method=request.method,
+                path=request.path,
+                status=response.status_code,
+                bytes=response.content_length,
+                ms='{:.1f}'.format((time.time() - started) * 1000)
+                    if started else None,
+                remote=request.remote_addr)
+    return response
+
 
 # error handlers
+def log_error(status):
+    if app.debug is not True:
+        error_log.write(event='error', status=status,
+                method=request.method, url=request.url,
+                remote=request.remote_addr)
+
+
 @app.errorhandler(404)
 def page_not_found(error):
-    if app.debug is not True:
-        now = datetime.datetime.now()
-        r = request.url
-        with open('error.log', 'a') as f:
-            current_timestamp = now.strftime("%d-%m-%Y %H:%M:%S")
-            f.write("\n404 error at {}: {} ".format(current_timestamp, r))
+    log_error(404)
     return render_template('404.html'), 404
 
 
 @app.errorhandler(500)
 def internal_error(error):
-    if app.debug is not True:
-        now = datetime.datetime.now()
-        r = request.url
-        with open('error.log', 'a') as f:
-            current_timestamp = now.strftime("%d-%m-%Y %H:%M:%S")
-            f.write("\n500 error at {}: {} ".format(current_timestamp, r))
+    log_error(500)
     return render_template('500.html'), 500
+
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(error):
+    return render_template('503.html'), 503, {'Retry-After': '1'}
@@ -14,3 +14,137 @@ DATABASE_PATH = os.path.join(basedir, DATABASE)
 
 # define the database uri
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + DATABASE_PATH
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# connection pool; each worker process keeps up to POOL_SIZE + MAX_OVERFLOW
+# open connections and waits POOL_TIMEOUT seconds for a free one
+SQLALCHEMY_POOL_SIZE = 5
+SQLALCHEMY_MAX_OVERFLOW = 10
+SQLALCHEMY_POOL_TIMEOUT = 10
+SQLALCHEMY_POOL_RECYCLE = 3600
+
+# pragmas run on every new sqlite connection, in order. WAL lets readers
+# carry on while a writer commits, and writers wait up to busy_timeout ms
+# for the write lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = [
+    ('busy_timeout', 5000),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -20000),         # in KiB, i.e. 20 MB per connection
+    ('mmap_size', 268435456),       # 256 MB
+    ('temp_store', 'MEMORY'),
+]
+
+# number of tasks shown per page of the open and closed task lists
+OPEN_TASKS_PER_PAGE = 25
+CLOSED_TASKS_PER_PAGE = 10
+MAX_TASKS_PER_PAGE = 100
+
+# default number of tasks per page of the JSON api task list
+API_TASKS_PER_PAGE = 50
+
+# rows per transaction and number of reported row errors for task imports
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+
+# rows fetched from the database per chunk of a task export
+EXPORT_CHUNK_SIZE = 1000
+
+# number of rendered task tables kept in memory per process
+FRAGMENT_CACHE_SIZE = 512
+
+# shared query-result cache: 'local' keeps results in each process,
+# 'file' shares them between the processes on this host through CACHE_DIR
+CACHE_BACKEND = 'local'
+CACHE_SIZE = 1000
+CACHE_DEFAULT_TIMEOUT = 300
+CACHE_DIR = os.path.join(basedir, 'cache')
+
+# seconds a user looked up by name at login stays cached
+USER_CACHE_TIMEOUT = 300
+
+# bcrypt work factor of new password hashes; stored hashes with a lower
+# cost are upgraded on the next successful login. Pick it for the host
+# with `flask bcrypt-cost`.
+BCRYPT_LOG_ROUNDS = 12
+
+# password hashing pool: hashes run at once, hashes allowed to wait,
+# and seconds a request waits for its hash
+PASSWORD_HASH_WORKERS = 2
+PASSWORD_HASH_QUEUE_DEPTH = 8
+PASSWORD_HASH_TIMEOUT = 10
+
+# token-bucket limits on login and registration attempts. The 'file'
+# backend shares the buckets between worker processes through
+# LOGIN_THROTTLE_DIR; 'memory' keeps them per process.
+LOGIN_THROTTLE_ENABLED = True
+LOGIN_THROTTLE_BACKEND = 'memory'
+LOGIN_THROTTLE_DIR = os.path.join(basedir, 'throttle')
+LOGIN_THROTTLE_IP_RATE = 1.0
+LOGIN_THROTTLE_IP_BURST = 20
+LOGIN_THROTTLE_USER_RATE = 0.2
+LOGIN_THROTTLE_USER_BURST = 5
+
+# error and access logs are written by a background thread; records that
+# do not fit in the queue are dropped rather than delaying requests.
+# Files rotate at LOG_MAX_BYTES or after LOG_ROTATE_SECONDS (0 disables
+# either) and LOG_BACKUP_COUNT rotated files are kept.
+ERROR_LOG_PATH = 'error.log'
+ACCESS_LOG_ENABLED = False
+ACCESS_LOG_PATH = 'access.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_SECONDS = 24 * 60 * 60
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL = 1.0
+
+# per-endpoint request metrics, served in Prometheus format at
+# /api/v1/metrics/ to admins or to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>". Worker processes share their
+# counters through METRICS_DIR (None keeps each process separate).
+METRICS_ENABLED = True
+METRICS_DIR = os.path.join(basedir, 'metrics')
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+        5.0, 10.0)
+METRICS_FLUSH_INTERVAL = 5.0
+METRICS_TOKEN = None
+
+# SQL instrumentation: per-request query count and time headers
+# (X-DB-Query-Count, X-DB-Query-Time in ms; always sent in debug and
+# testing modes), a warning when one statement runs more than
+# SQL_NPLUSONE_THRESHOLD times in a request, and a log of statements
+# slower than SQL_SLOW_QUERY_MS with their query plan
+SQL_DEBUG_HEADERS = False
+SQL_NPLUSONE_THRESHOLD = 10
+SQL_SLOW_QUERY_MS = 250
+SQL_LOG_PATH = 'sql.log'
+
+# fingerprinted and precompressed static files written by
+# `flask build-assets`; url_for('static') uses them when present
+ASSETS_DIR = os.path.join(basedir, 'static', 'build')
+
+# gzip compression of dynamic responses
+COMPRESS_ENABLED = True
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_SIZE = 500
+COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/csv',
+        'text/javascript', 'application/javascript', 'application/json',
+        'application/x-ndjson', 'image/svg+xml']
+
+# task search: results per page, words of a search that are used, and
+# number of matching tasks ranked together (newest first; later pages
+# rank the next older ones)
+SEARCH_RESULTS_PER_PAGE = 25
+SEARCH_MAX_TERMS = 8
+SEARCH_CANDIDATES = 300
+
+# `flask archive-tasks` moves closed tasks due more than
+# ARCHIVE_AFTER_DAYS days ago to tasks_archive, ARCHIVE_BATCH_SIZE
+# tasks per transaction
+ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 1000
+
+# users per page of the per-user counts on the admin dashboard, and
+# seconds the task totals over every user stay cached
+DASHBOARD_USERS_PER_PAGE = 50
+DASHBOARD_CACHE_TIMEOUT = 10
@@ -0,0 +1,424 @@
+"""
+project/api/views.py
+
+Controller for the api blueprint of Docket app. Exposes the tasks of
+the logged in user's Docket as a versioned JSON API so that scripts do
+not have to scrape the html pages.
+
+Tyler Huntington, 2018
+"""
+# imports
+import datetime
+import hashlib
+import hmac
+from functools import wraps
+from flask import jsonify, request, session, url_for, Blueprint, \
+        current_app, Response, stream_with_context
+
+from project import db, cache, metrics
+from project.models import Task, ArchivedTask
+from project.tasks.forms import validate_task
+from project.tasks.archive import restore_task
+from project.tasks.bulk import apply_bulk_action, is_task_id, BULK_ACTIONS
+from project.tasks.exporter import generate_export, EXPORT_FORMATS, \
+        EXPORT_MIMETYPES
+from project.tasks.importer import import_tasks, guess_format, \
+        IMPORT_FORMATS
+from project.tasks.pagination import paginate, MAX_TASK_ID
+from project.tasks.search import search_tasks, parse_query, SEARCH_STATUSES
+from project.tasks.stats import total_counts
+from project.tasks.views import open_tasks, closed_tasks, can_modify, \
+        fragment_cache, dashboard_counts, dashboard_users
+from project.versions import TASKS_SCOPE, user_scope, get_version, \
+        bump_versions
+
+# configuration
+api_blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
+
+TASK_STATUSES = {'open': 1, 'closed': 0}
+
+
+# helper functions
+
+"""
+api_login_required(test)
+
+A wrapper function for checking whether the user is logged in. Unlike
+the html views, an anonymous request gets a 401 JSON error instead of
+a redirect to the login page.
+"""
+def api_login_required(test):
+    @wraps(test)
+    def wrap(*args, **kwargs):
+
+        if session.get('logged_in'):
+            return(test(*args, **kwargs))
+
+        else:
+            return(error_response(401, "You need to log in first."))
+
+    return wrap
+
+"""
+error_response(status, message, **extra)
+
+Builds a JSON error response.
+"""
+def error_response(status, message, **extra):
+    body = dict(error=message, **extra)
+    response = jsonify(body)
+    response.status_code = status
+    return response
+
+"""
+int_arg(name)
+
+Reads an optional integer query argument, such as a priority or a user
+id. Values SQLite cannot compare with (beyond 64 bits) are refused
+rather than left to fail in the query.
+
+Returns:
+    the int, or None if the argument is missing
+
+Raises:
+    ValueError: if the argument is not such an integer
+"""
+def int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    value = int(value)
+    if abs(value) > MAX_TASK_ID:
+        raise ValueError("{} is out of range".format(name))
+    return value
+
+"""
+task_to_dict(task)
+
+Serializes a Task, or an ArchivedTask, for the API.
+"""
+def task_to_dict(task):
+    return {
+        'task_id': task.task_id,
+        'name': task.name,
+        'due_date': task.due_date.isoformat(),
+        'posted_date': (task.posted_date.isoformat()
+            if task.posted_date is not None else None),
+        'priority': task.priority,
+        'status': 'open' if task.status == 1 else 'closed',
+        'user_id': task.user_id,
+        'poster': task.poster.name if task.poster is not None else None,
+        'can_modify': can_modify(task),
+        'archived': isinstance(task, ArchivedTask),
+    }
+
+"""
+counts_to_dict(counts)
+
+Serializes TaskCounts for the API.
+"""
+def counts_to_dict(counts):
+    return {
+        'open': counts.open,
+        'closed': counts.closed,
+        'overdue': counts.overdue,
+    }
+
+"""
+list_etag(scope)
+
+Computes the strong ETag of a task list response. It depends only on
+the data version of the scope the list reads, on the viewer (whose
+permissions show up in `can_modify`) and on the query args, so it can
+be computed without running the list query.
+"""
+def list_etag(scope):
+    key = "{0}:{1}:{2}:{3}:{4}".format(scope, get_version(scope),
+            session['user_id'], session['role'],
+            sorted(request.args.items(multi=True)))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+# route handlers
+@api_blueprint.route('/tasks/', methods=['GET'])
+@api_login_required
+def list_tasks():
+
+    # parse filters
+    status = request.args.get('status', 'open')
+    if status not in TASK_STATUSES:
+        return(error_response(400, "status must be 'open' or 'closed'."))
+    try:
+        priority, user_id = int_arg('priority'), int_arg('user_id')
+    except ValueError:
+        return(error_response(400, "priority and user_id must be integers."))
+
+    # answer conditional requests before touching the tasks table
+    etag = list_etag(user_scope(user_id) if user_id is not None
+            else TASKS_SCOPE)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = open_tasks() if status == 'open' else closed_tasks()
+    if priority is not None:
+        query = query.filter_by(priority=priority)
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+
+    per_page = request.args.get('per_page', type=int) or \
+            current_app.config['API_TASKS_PER_PAGE']
+    per_page = max(1, min(per_page, current_app.config['MAX_TASKS_PER_PAGE']))
+    try:
+        page = paginate(query, request.args.get('cursor') or None,
+                request.args.get('dir', 'next'), per_page)
+    except ValueError:
+        return(error_response(400, "Invalid cursor."))
+
+    response = jsonify(
+            tasks=[task_to_dict(task) for task in page],
+            next_cursor=page.next_cursor,
+            prev_cursor=page.prev_cursor)
+    response.set_etag(etag)
+    return response
+
+@api_blueprint.route('/tasks/search/', methods=['GET'])
+@api_login_required
+def search_task_names():
+    config = current_app.config
+    query = request.args.get('q', '')
+    if parse_query(query) is None:
+        return(error_response(400, "q must contain at least one word."))
+    status = request.args.get('status', 'all')
+    if status not in SEARCH_STATUSES:
+        return(error_response(400,
+            "status must be 'open', 'closed' or 'all'."))
+    try:
+        priority, user_id = int_arg('priority'), int_arg('user_id')
+    except ValueError:
+        return(error_response(400, "priority and user_id must be integers."))
+
+    etag = list_etag(TASKS_SCOPE)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    per_page = request.args.get('per_page', type=int) or \
+            config['SEARCH_RESULTS_PER_PAGE']
+    per_page = max(1, min(per_page, config['MAX_TASKS_PER_PAGE']))
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = search_tasks(query, SEARCH_STATUSES[status], priority, user_id,
+            limit=per_page + 1, offset=(page - 1) * per_page,
+            max_terms=config['SEARCH_MAX_TERMS'],
+            candidates=config['SEARCH_CANDIDATES'])
+
+    response = jsonify(
+            tasks=[task_to_dict(task) for task in results[:per_page]],
+            next_page=page + 1 if len(results) > per_page else None)
+    response.set_etag(etag)
+    return response
+
+@api_blueprint.route('/tasks/', methods=['POST'])
+@api_login_required
+def create_task():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return(error_response(400, "Request body must be a JSON object."))
+
+    values, errors = validate_task(data)
+    if errors:
+        return(error_response(400, "Invalid task.", fields=errors))
+
+    task = Task(values['name'],
+            values['due_date'],
+            values['priority'],
+            datetime.datetime.utcnow(),
+            1,
+            session['user_id']
+    )
+    db.session.add(task)
+    bump_versions(task.user_id)
+    db.session.commit()
+
+    response = jsonify(task_to_dict(task))
+    response.status_code = 201
+    response.headers['Location'] = url_for('api.get_task',
+            task_id=task.task_id)
+    return response
+
+@api_blueprint.route('/tasks/<int:task_id>/', methods=['GET'])
+@api_login_required
+def get_task(task_id):
+    task = db.session.query(Task).get(task_id) or \
+            db.session.query(ArchivedTask).get(task_id)
+    if task is None:
+        return(error_response(404, "Task not found."))
+    return jsonify(task_to_dict(task))
+
+@api_blueprint.route('/tasks/<int:task_id>/complete/', methods=['POST'])
+@api_login_required
+def complete_task(task_id):
+    task = db.session.query(Task).get(task_id)
+    if task is None:
+        return(error_response(404, "Task not found."))
+
+    # same ownership rules as the html view
+    if not can_modify(task):
+        return(error_response(403, "You can only update tasks that you created."))
+
+    task.status = 0
+    bump_versions(task.user_id)
+    db.session.commit()
+    return jsonify(task_to_dict(task))
+
+@api_blueprint.route('/tasks/<int:task_id>/', methods=['DELETE'])
+@api_login_required
+def delete_task(task_id):
+    task = db.session.query(Task).get(task_id)
+    if task is None:
+        return(error_response(404, "Task not found."))
+
+    # same ownership rules as the html view
+    if not can_modify(task):
+        return(error_response(403, "You can only delete tasks that you created."))
+
+    bump_versions(task.user_id)
+    db.session.delete(task)
+    db.session.commit()
+    return ('', 204)
+
+@api_blueprint.route('/tasks/<int:task_id>/restore/', methods=['POST'])
+@api_login_required
+def restore_archived_task(task_id):
+    archived = db.session.query(ArchivedTask).get(task_id)
+    if archived is None:
+        return(error_response(404, "Archived task not found."))
+
+    # same ownership rules as the html view
+    if not can_modify(archived):
+        return(error_response(403, "You can only restore tasks that you created."))
+
+    task = restore_task(archived)
+    return jsonify(task_to_dict(task))
+
+@api_blueprint.route('/tasks/import/', methods=['POST'])
+@api_login_required
+def import_task_file():
+
+    # accept either a multipart upload in `file` or the raw request body
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = request.args.get('format') or guess_format(upload.filename,
+                upload.mimetype)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or guess_format(None,
+                request.mimetype)
+
+    if fmt not in IMPORT_FORMATS:
+        return(error_response(400, "format must be 'csv' or 'jsonl'."))
+
+    config = current_app.config
+    report = import_tasks(stream, fmt, session['user_id'],
+            batch_size=config['IMPORT_BATCH_SIZE'],
+            max_errors=config['IMPORT_MAX_ERRORS'])
+    return jsonify(report.to_dict())
+
+@api_blueprint.route('/tasks/bulk/', methods=['POST'])
+@api_login_required
+def bulk_tasks():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return(error_response(400, "Request body must be a JSON object."))
+
+    action = data.get('action')
+    task_ids = data.get('task_ids')
+    if action not in BULK_ACTIONS:
+        return(error_response(400, "action must be 'complete' or 'delete'."))
+    if (not isinstance(task_ids, list) or
+            not all(is_task_id(t) for t in task_ids)):
+        return(error_response(400, "task_ids must be a list of task ids."))
+
+    result = apply_bulk_action(action, task_ids, session['user_id'],
+            session['role'] == 'admin')
+    return jsonify(result.to_dict())
+
+@api_blueprint.route('/tasks/export/', methods=['GET'])
+@api_login_required
+def export_tasks():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return(error_response(400, "format must be 'csv' or 'jsonl'."))
+
+    # admins export every task (or one user's), users only their own
+    if session['role'] == 'admin':
+        try:
+            user_id = int_arg('user_id')
+        except ValueError:
+            return(error_response(400, "user_id must be an integer."))
+    else:
+        user_id = session['user_id']
+
+    chunks = generate_export(fmt, user_id,
+            current_app.config['EXPORT_CHUNK_SIZE'])
+    return Response(stream_with_context(chunks),
+            mimetype=EXPORT_MIMETYPES[fmt],
+            headers={'Content-Disposition':
+                'attachment; filename=tasks.{}'.format(fmt)})
+
+@api_blueprint.route('/dashboard/', methods=['GET'])
+@api_login_required
+def dashboard_stats():
+    config = current_app.config
+    try:
+        user_id = int_arg('user_id')
+    except ValueError:
+        return(error_response(400, "user_id must be an integer."))
+
+    # admins see every user's counts (or one user's), users only their own
+    if session['role'] != 'admin':
+        if user_id not in (None, session['user_id']):
+            return(error_response(403, "You can only view your own counts."))
+        user_id = session['user_id']
+
+    today = datetime.date.today()
+    counts = dashboard_counts(user_id, today)
+    body = dict(
+            user_id=user_id,
+            date=today.isoformat(),
+            priorities=[dict(counts_to_dict(c), priority=c.key)
+                for c in counts],
+            totals=counts_to_dict(total_counts(counts)))
+
+    if user_id is None:
+        per_page = request.args.get('per_page', type=int) or \
+                config['DASHBOARD_USERS_PER_PAGE']
+        per_page = max(1, min(per_page, config['MAX_TASKS_PER_PAGE']))
+        page = max(request.args.get('page', 1, type=int), 1)
+        users, has_next = dashboard_users(page, per_page, today)
+        body['users'] = [dict(counts_to_dict(c), user_id=user.id,
+            name=user.name) for user, c in users]
+        body['next_page'] = page + 1 if has_next else None
+    return jsonify(**body)
+
+@api_blueprint.route('/stats/cache/', methods=['GET'])
+@api_login_required
+def cache_stats():
+    if session['role'] != 'admin':
+        return(error_response(403, "Only admins can view cache statistics."))
+    return jsonify(fragments=fragment_cache.stats(), queries=cache.stats())
+
+
+@api_blueprint.route('/metrics/', methods=['GET'])
+def request_metrics():
+    token = current_app.config['METRICS_TOKEN']
+    header = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(header, 'Bearer ' + token)):
+        if not session.get('logged_in'):
+            return(error_response(401, "You need to log in first."))
+        if session['role'] != 'admin':
+            return(error_response(403, "Only admins can view metrics."))
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,260 @@
+"""
+project/cache.py
+
+A small cache abstraction with two backends:
+
+    LocalCache  an in-process, thread-safe LRU cache
+    FileCache   a cache shared by every process on the host, kept as
+                one file per entry in a local directory
+
+Both support a per-entry timeout (TTL) and version-based invalidation:
+an entry stored with a version is only returned to readers asking for
+that same version, so bumping a version invalidates every entry made
+for the old one without having to find and delete them.
+
+Tyler Huntington, 2018
+"""
+
+import errno
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class BaseCache(object):
+    """
+    Interface shared by the cache backends, with hit/miss accounting.
+    """
+
+    def __init__(self, default_timeout=300):
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expires_at(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        return time.time() + timeout if timeout else 0
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get(self, key, default=None, version=None):
+        raise NotImplementedError
+
+    def set(self, key, value, timeout=None, version=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (float(self.hits) / lookups) if lookups else 0.0,
+        }
+
+
+class LocalCache(BaseCache):
+    """
+    In-process cache holding at most `maxsize` entries. When the cache
+    is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize=256, default_timeout=0):
+        super(LocalCache, self).__init__(default_timeout)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, version=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                expires, stored_version, value = entry
+                if expires and expires < time.time():
+                    entry = None
+                elif version is not None and stored_version != version:
+                    entry = None
+                else:
+                    self._entries[key] = entry
+            self._count(entry is not None)
+            return value if entry is not None else default
+
+    def set(self, key, value, timeout=None, version=None):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._expires_at(timeout), version, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            stats = super(LocalCache, self).stats()
+            stats.update(size=len(self._entries), maxsize=self.maxsize)
+            return stats
+
+
+class FileCache(BaseCache):
+    """
+    Cache shared between processes through a local directory. Each
+    entry is a pickle file named after the hash of its key and is
+    replaced atomically, so readers in other processes never see a
+    partly written entry. When the directory holds more than `maxsize`
+    entries, expired and then least recently written ones are removed.
+    """
+
+    suffix = '.cache'
+
+    # how many writes happen between checks of the directory size
+    prune_interval = 100
+
+    def __init__(self, cache_dir, maxsize=10000, default_timeout=300):
+        super(FileCache, self).__init__(default_timeout)
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self._writes = 0
+        try:
+            os.makedirs(cache_dir, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _path(self, key):
+        name = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name + self.suffix)
+
+    def _entries(self):
+        return [os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.endswith(self.suffix)]
+
+    def get(self, key, default=None, version=None):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, stored_version, value = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError,
+                pickle.UnpicklingError):
+            self._count(False)
+            return default
+
+        if expires and expires < time.time():
+            self._remove(path)
+            self._count(False)
+            return default
+        if version is not None and stored_version != version:
+            self._count(False)
+            return default
+        self._count(True)
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((self._expires_at(timeout), version, value), f,
+                        pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except Exception:
+            self._remove(tmp)
+            raise
+
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self._prune()
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def clear(self):
+        for path in self._entries():
+            self._remove(path)
+        self.hits = self.misses = self.evictions = 0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _prune(self):
+        entries = self._entries()
+        if len(entries) <= self.maxsize:
+            return
+
+        now = time.time()
+        by_age = []
+        for path in entries:
+            try:
+                with open(path, 'rb') as f:
+                    expires = pickle.load(f)[0]
+                mtime = os.path.getmtime(path)
+            except (IOError, OSError, EOFError, ValueError,
+                    pickle.UnpicklingError):
+                continue
+            if expires and expires < now:
+                self._remove(path)
+                self.evictions += 1
+            else:
+                by_age.append((mtime, path))
+
+        by_age.sort()
+        for mtime, path in by_age[:max(0, len(by_age) - self.maxsize)]:
+            self._remove(path)
+            self.evictions += 1
+
+    def stats(self):
+        stats = super(FileCache, self).stats()
+        stats.update(size=len(self._entries()), maxsize=self.maxsize)
+        return stats
+
+
+"""
+make_cache(config)
+
+Builds the cache backend selected by the app config:
+
+    CACHE_BACKEND          'local' (default) or 'file'
+    CACHE_SIZE             maximum number of entries
+    CACHE_DEFAULT_TIMEOUT  seconds an entry lives, 0 for no expiry
+    CACHE_DIR              directory of the 'file' backend
+"""
+def make_cache(config):
+    backend = config.get('CACHE_BACKEND', 'local')
+    maxsize = config.get('CACHE_SIZE', 1000)
+    timeout = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+
+    if backend == 'local':
+        return LocalCache(maxsize, timeout)
+    if backend == 'file':
+        return FileCache(config['CACHE_DIR'], maxsize, timeout)
+    raise ValueError("Unknown cache backend: {}".format(backend))
@@ -0,0 +1,231 @@
+"""
+project/commands.py
+
+Command line tools for maintaining a Docket database, registered on
+the Flask cli. Run them with e.g.
+
+    FLASK_APP=project flask import-tasks tasks.csv --user tylertarr
+
+Tyler Huntington, 2018
+"""
+# imports
+import time
+
+import click
+
+from project import app, db, bcrypt, assets
+from project.assets import build_assets
+from project.datagen import generate
+from project.models import Task, ArchivedTask, User
+from project.passwords import time_hash
+from project.tasks.archive import archive_tasks, restore_task
+from project.tasks.exporter import generate_export, EXPORT_FORMATS
+from project.tasks.search import rebuild_search_index
+from project.tasks.stats import find_stats_drift, rebuild_task_stats
+from project.tasks.importer import import_tasks, guess_format, \
+        IMPORT_FORMATS
+
+
+# helper functions
+
+"""
+get_user(name)
+
+Looks up a user by name for a command, aborting the command if there
+is no such user.
+"""
+def get_user(name):
+    user = db.session.query(User).filter_by(name=name).first()
+    if user is None:
+        raise click.BadParameter("No user named {}".format(name),
+                param_hint='--user')
+    return user
+
+
+# commands
+@app.cli.command('import-tasks')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'user_name', required=True,
+        help='Name of the user who will own the imported tasks.')
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+        help='File format; guessed from the file extension by default.')
+@click.option('--batch-size', default=None, type=int,
+        help='Rows per transaction.')
+def import_tasks_command(path, user_name, fmt, batch_size):
+    """Import tasks from a CSV or JSONL file."""
+    fmt = fmt or guess_format(path)
+    if fmt is None:
+        raise click.BadParameter("Cannot tell the format of {}".format(path),
+                param_hint='--format')
+    user = get_user(user_name)
+
+    with open(path, 'rb') as stream:
+        report = import_tasks(stream, fmt, user.id,
+                batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'],
+                max_errors=app.config['IMPORT_MAX_ERRORS'])
+
+    for error in report.errors:
+        click.echo("line {0}: {1}".format(error['line'], error['errors']),
+                err=True)
+    click.echo("Imported {0} tasks, rejected {1} rows.".format(
+        report.imported, report.rejected))
+
+
+@app.cli.command('export-tasks')
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS),
+        default='csv', help='Output format.')
+@click.option('--user', 'user_name', default=None,
+        help='Only export the tasks of this user.')
+@click.option('--output', type=click.File('w'), default='-',
+        help='File to write to; standard output by default.')
+@click.option('--chunk-size', default=None, type=int,
+        help='Rows fetched from the database at a time.')
+def export_tasks_command(fmt, user_name, output, chunk_size):
+    """Export tasks as CSV or JSONL."""
+    user_id = get_user(user_name).id if user_name else None
+    for chunk in generate_export(fmt, user_id,
+            chunk_size or app.config['EXPORT_CHUNK_SIZE']):
+        output.write(chunk)
+
+
+@app.cli.command('bcrypt-cost')
+@click.option('--target-ms', default=250, type=int,
+        help='Longest acceptable time for one hash, in milliseconds.')
+@click.option('--min-rounds', default=10, type=int)
+@click.option('--max-rounds', default=16, type=int)
+def bcrypt_cost_command(target_ms, min_rounds, max_rounds):
+    """Measure bcrypt hash times on this host to pick BCRYPT_LOG_ROUNDS."""
+    best = None
+    for rounds in range(min_rounds, max_rounds + 1):
+        elapsed = time_hash(bcrypt, rounds) * 1000
+        click.echo("rounds {0:>2}: {1:>8.1f} ms".format(rounds, elapsed))
+        if elapsed > target_ms:
+            break
+        best = rounds
+
+    if best is None:
+        click.echo("Even {0} rounds take longer than {1} ms.".format(
+            min_rounds, target_ms))
+    else:
+        click.echo("Recommended BCRYPT_LOG_ROUNDS = {0} (currently {1}).".format(
+            best, app.config['BCRYPT_LOG_ROUNDS']))
+
+
+@app.cli.command('generate-data')
+@click.option('--users', default=1000, type=int,
+        help='Number of users to create.')
+@click.option('--tasks', default=100000, type=int,
+        help='Number of tasks to create.')
+@click.option('--seed', default=0, type=int,
+        help='Seed of the random generator; the same seed gives the same '
+        'data.')
+@click.option('--open-ratio', default=0.35, type=float,
+        help='Fraction of the tasks that are open.')
+@click.option('--admins', default=1, type=int,
+        help='Number of the new users that are admins.')
+@click.option('--password', default='password',
+        help='Password of every new user.')
+@click.option('--bcrypt-rounds', default=None, type=int,
+        help='Work factor of the shared password hash.')
+@click.option('--batch-size', default=100000, type=int,
+        help='Rows per transaction.')
+def generate_data_command(users, tasks, seed, open_ratio, admins, password,
+        bcrypt_rounds, batch_size):
+    """Fill the database with synthetic users and tasks."""
+    db.create_all()
+    pw_hash = bcrypt.generate_password_hash(password,
+            bcrypt_rounds or app.config['BCRYPT_LOG_ROUNDS'])
+    if not isinstance(pw_hash, str):
+        pw_hash = pw_hash.decode('utf-8')
+
+    def progress(table, written):
+        click.echo("{0}: {1} rows".format(table, written), err=True)
+
+    result = generate(db.engine, users, tasks, pw_hash, seed=seed,
+            open_ratio=open_ratio, admins=admins, batch_size=batch_size,
+            progress=progress)
+    click.echo("Created {0} users and {1} tasks in {2:.1f}s, built indexes "
+            "in {3:.1f}s.".format(result['users'], result['tasks'],
+                result['load_seconds'], result['index_seconds']))
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Write fingerprinted, precompressed copies of the static files."""
+    manifest = build_assets(app.static_folder, app.config['ASSETS_DIR'])
+    assets.load()
+    for path, hashed in sorted(manifest.items()):
+        click.echo("{0} -> {1}".format(path, hashed))
+
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Create the task search index if needed and reindex every task."""
+    start = time.time()
+    rebuild_search_index(db.session.connection())
+    db.session.commit()
+    click.echo("Indexed {0} tasks in {1:.1f}s.".format(
+        db.session.query(Task).count(), time.time() - start))
+
+
+@app.cli.command('archive-tasks')
+@click.option('--days', default=None, type=int,
+        help='Archive closed tasks due more than this many days ago '
+        '(default ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', default=None, type=int,
+        help='Tasks moved per transaction (default ARCHIVE_BATCH_SIZE).')
+def archive_tasks_command(days, batch_size):
+    """Move old closed tasks to the archive."""
+    if days is None:
+        days = app.config['ARCHIVE_AFTER_DAYS']
+    start = time.time()
+
+    def progress(archived):
+        click.echo("archived {} tasks".format(archived), err=True)
+
+    archived = archive_tasks(days,
+            batch_size or app.config['ARCHIVE_BATCH_SIZE'],
+            progress=progress)
+    click.echo("Archived {0} tasks in {1:.1f}s.".format(archived,
+        time.time() - start))
+
+
+@app.cli.command('restore-task')
+@click.argument('task_id', type=int)
+@click.option('--keep-closed', is_flag=True,
+        help='Restore the task closed instead of reopening it.')
+def restore_task_command(task_id, keep_closed):
+    """Move an archived task back to the task list."""
+    archived = db.session.query(ArchivedTask).get(task_id)
+    if archived is None:
+        raise click.BadParameter("No archived task {}".format(task_id),
+                param_hint='task_id')
+    task = restore_task(archived, reopen=not keep_closed)
+    click.echo("Restored task {0} ({1}).".format(task.task_id,
+        'open' if task.status == 1 else 'closed'))
+
+
+@app.cli.command('reconcile-stats')
+@click.option('--check', is_flag=True,
+        help='Only report drifted counters, without rebuilding them.')
+@click.option('--show', default=20, type=int,
+        help='Number of drifted counters to list.')
+def reconcile_stats_command(check, show):
+    """Recount the dashboard task counters and report any drift."""
+    start = time.time()
+    connection = db.session.connection()
+    drift = find_stats_drift(connection)
+    for table, key, expected, actual in drift[:show]:
+        click.echo("{0} {1}: expected {2}, found {3}".format(table,
+            ', '.join(str(k) for k in key), expected, actual))
+    click.echo("{} counters drifted.".format(len(drift)))
+    if check:
+        if drift:
+            raise click.ClickException("Run without --check to rebuild "
+                    "the counters.")
+        return
+
+    rebuild_task_stats(connection)
+    db.session.commit()
+    click.echo("Rebuilt the task counters in {0:.1f}s.".format(
+        time.time() - start))
@@ -0,0 +1,205 @@
+"""
+project/compression.py
+
+WSGI middleware that gzips dynamic responses for clients that accept
+it. Only responses of allow-listed content types, at least
+COMPRESS_MIN_SIZE bytes long and not already encoded are compressed.
+Bodies produced by a generator (streamed exports) are compressed one
+chunk at a time and flushed after every chunk, so clients still get
+data as soon as it is produced.
+
+Compressed responses get their own strong ETag (the original one with
+a "-gzip" suffix); the suffix is stripped again from If-None-Match
+before the app sees it, so conditional requests keep working.
+
+Tyler Huntington, 2018
+"""
+
+import zlib
+
+ETAG_SUFFIX = '-gzip'
+
+
+"""
+accepts_gzip(environ)
+
+Whether the Accept-Encoding header of a request allows gzip.
+"""
+def accepts_gzip(environ):
+    for item in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            params = params.replace(' ', '')
+            return params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def strip_etag_suffixes(value):
+    return value.replace(ETAG_SUFFIX + '"', '"')
+
+
+def add_etag_suffix(value):
+    if value.endswith('"') and not value.startswith('W/'):
+        return value[:-1] + ETAG_SUFFIX + '"'
+    return value
+
+
+class GzipMiddleware(object):
+    """
+    Compresses the responses of a Flask app's WSGI callable. Configured
+    with:
+
+        COMPRESS_ENABLED    compress responses or not
+        COMPRESS_LEVEL      zlib level, 1 (fastest) to 9 (smallest)
+        COMPRESS_MIN_SIZE   smaller bodies are sent as they are
+        COMPRESS_MIMETYPES  content types that are compressed
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = self
+
+    def __call__(self, environ, start_response):
+        config = self.app.config
+        if not config['COMPRESS_ENABLED'] or not accepts_gzip(environ) or \
+                environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and ETAG_SUFFIX in if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = strip_etag_suffixes(if_none_match)
+
+        response = {}
+
+        def capture(status, headers, exc_info=None):
+            response['start'] = (status, headers, exc_info)
+            return response.setdefault('buffer', []).append
+
+        app_iter = self.wsgi_app(environ, capture)
+        status, headers, exc_info = response['start']
+        written = response.get('buffer', [])
+
+        mode = self.mode(status, headers, app_iter, written)
+        if mode is None:
+            if status.startswith('304') and if_none_match and \
+                    ETAG_SUFFIX in if_none_match:
+                headers = self.vary([(name, add_etag_suffix(value)
+                    if name.lower() == 'etag' else value)
+                    for name, value in headers])
+            start_response(status, headers, exc_info)
+            return self.chain(written, app_iter)
+        return self.compress(mode, status, headers, exc_info, written,
+                app_iter, start_response)
+
+    def mode(self, status, headers, app_iter, written):
+        """
+        Decides how to send a response: None to send it unchanged,
+        'buffered' to compress a body that is already in memory and
+        'stream' to compress a body chunk by chunk.
+        """
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return None
+
+        content_type = content_length = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return None
+            if name == 'cache-control' and 'no-transform' in value:
+                return None
+            if name == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+            elif name == 'content-length':
+                content_length = int(value)
+        if content_type not in self.app.config['COMPRESS_MIMETYPES']:
+            return None
+
+        # a body with a known length is already in memory; anything else
+        # may be a long stream
+        minimum = self.app.config['COMPRESS_MIN_SIZE']
+        if isinstance(app_iter, (list, tuple)):
+            content_length = sum(len(chunk) for chunk in app_iter) + \
+                    sum(len(chunk) for chunk in written)
+        if content_length is None:
+            return 'stream'
+        return 'buffered' if content_length >= minimum else None
+
+    def vary(self, headers):
+        for i, (name, value) in enumerate(headers):
+            if name.lower() == 'vary':
+                if 'accept-encoding' not in value.lower():
+                    headers[i] = (name, value + ', Accept-Encoding')
+                return headers
+        headers.append(('Vary', 'Accept-Encoding'))
+        return headers
+
+    def chain(self, written, app_iter):
+        if not written:
+            return app_iter
+        return ClosingIterator(self.join(written, app_iter), app_iter)
+
+    def join(self, written, app_iter):
+        for chunk in written:
+            yield chunk
+        for chunk in app_iter:
+            yield chunk
+
+    def compress(self, mode, status, headers, exc_info, written, app_iter,
+            start_response):
+        headers = [(name, add_etag_suffix(value)
+            if name.lower() == 'etag' else value)
+            for name, value in headers
+            if name.lower() != 'content-length']
+        headers.append(('Content-Encoding', 'gzip'))
+        headers = self.vary(headers)
+        compressor = zlib.compressobj(self.app.config['COMPRESS_LEVEL'],
+                zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        if mode == 'buffered':
+            try:
+                body = compressor.compress(b''.join(written) +
+                        b''.join(app_iter)) + compressor.flush()
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+            headers.append(('Content-Length', str(len(body))))
+            start_response(status, headers, exc_info)
+            return [body]
+
+        start_response(status, headers, exc_info)
+        return ClosingIterator(self.stream(compressor,
+            self.join(written, app_iter)), app_iter)
+
+    def stream(self, compressor, chunks):
+        for chunk in chunks:
+            if chunk:
+                data = compressor.compress(chunk) + \
+                        compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+        yield compressor.flush()
+
+
+class ClosingIterator(object):
+    """
+    Iterates over a wrapped body and closes the original app iterable
+    when the server is done with the response, as WSGI requires.
+    """
+
+    def __init__(self, iterable, app_iter):
+        self.iterable = iter(iterable)
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.iterable)
+
+    next = __next__
+
+    def close(self):
+        if hasattr(self.app_iter, 'close'):
+            self.app_iter.close()
@@ -0,0 +1,89 @@
+"""
+project/database.py
+
+Engine setup for the Docket database. File-backed SQLite databases get
+a real connection pool instead of a new connection per checkout, and
+every new SQLite connection of the app's engines is configured with the
+pragmas listed in the SQLITE_PRAGMAS config value (WAL journal, busy timeout, cache and
+mmap sizes, ...).
+
+Tyler Huntington, 2018
+"""
+
+import sqlite3
+import threading
+import weakref
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# engine options that only make sense for a QueuePool
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+"""
+set_sqlite_pragmas(connection, pragmas)
+
+Runs a list of PRAGMA statements on a DBAPI sqlite connection.
+
+Args:
+    connection: a sqlite3 connection
+    pragmas: list of (name, value) pairs, applied in order
+"""
+def set_sqlite_pragmas(connection, pragmas):
+    cursor = connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute("PRAGMA {0} = {1}".format(name, value))
+    finally:
+        cursor.close()
+
+
+class DocketSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy extension that tunes SQLite engines for serving
+    concurrent requests.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DocketSQLAlchemy, self).__init__(*args, **kwargs)
+        self._tuned_engines = weakref.WeakSet()
+        self._tuning_lock = threading.Lock()
+
+    def get_engine(self, app=None, bind=None):
+        engine = super(DocketSQLAlchemy, self).get_engine(app, bind)
+
+        # only the app's own engines get the pragmas, not every engine
+        # in the process (scripts and benchmarks create their own)
+        with self._tuning_lock:
+            if engine not in self._tuned_engines:
+                self._tuned_engines.add(engine)
+                pragmas = self.get_app(app).config.get('SQLITE_PRAGMAS', [])
+
+                @event.listens_for(engine, 'connect')
+                def on_connect(dbapi_connection, connection_record):
+                    if isinstance(dbapi_connection, sqlite3.Connection):
+                        set_sqlite_pragmas(dbapi_connection, pragmas)
+        return engine
+
+    def apply_driver_hacks(self, app, info, options):
+        result = super(DocketSQLAlchemy, self).apply_driver_hacks(
+                app, info, options)
+
+        if info.drivername == 'sqlite':
+            if info.database in (None, '', ':memory:'):
+                # in-memory databases keep their single static connection
+                for option in QUEUE_POOL_OPTIONS:
+                    options.pop(option, None)
+            elif options.get('pool_size'):
+                # pool connections so pragmas are set once per connection;
+                # a connection may be returned to the pool by one thread
+                # and checked out by another
+                options['poolclass'] = QueuePool
+                connect_args = options.setdefault('connect_args', {})
+                connect_args['check_same_thread'] = False
+
+        # SQLALCHEMY_ENGINE_OPTIONS is only read by Flask-SQLAlchemy 2.4+
+        options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        return result
@@ -0,0 +1,243 @@
+"""
+project/datagen.py
+
+Synthetic data for load tests and for reproducing problems that only
+show up at production scale. Users and tasks are written with
+executemany inserts in large transactions, and the secondary indexes
+on tasks and the triggers of the task search index and of the task
+counters are dropped during the load, and all of them are rebuilt once
+at the end, which is far faster than maintaining them row by row. Every value comes
+from a random generator seeded by the caller, so the same seed always
+produces the same database.
+
+Tyler Huntington, 2018
+"""
+
+import datetime
+import random
+import time
+
+from sqlalchemy import func, inspect, select
+
+from project.models import Task, ArchivedTask, User, DataVersion
+from project.tasks.search import SEARCH_TABLE, drop_search_triggers, \
+        rebuild_search_index
+from project.tasks.stats import STATS_TABLE, drop_stats_triggers, \
+        rebuild_task_stats
+from project.versions import TASKS_SCOPE
+
+TASK_VERBS = ['Call', 'Email', 'Review', 'Write', 'Plan', 'Buy', 'Fix',
+        'Clean', 'Book', 'Pay', 'Update', 'Schedule', 'Finish', 'Prepare']
+TASK_OBJECTS = ['the report', 'groceries', 'the dentist', 'rent',
+        'the budget', 'slides', 'the car', 'flights', 'the garage',
+        'taxes', 'the newsletter', 'a birthday gift', 'the backlog',
+        'the quarterly review', 'insurance', 'the kitchen']
+
+# priorities 1-10 cluster around the middle of the scale
+PRIORITY_WEIGHTS = [4, 7, 11, 14, 16, 15, 12, 9, 7, 5]
+
+
+class DataGenerator(object):
+    """
+    Generates users and tasks.
+
+    Args:
+        seed: seed of the random generator
+        open_ratio: fraction of tasks that are still open
+        today: the date due dates are spread around
+    """
+
+    def __init__(self, seed=0, open_ratio=0.35, today=None):
+        self.rng = random.Random(seed)
+        self.open_ratio = open_ratio
+        self.today = today or datetime.date.today()
+
+    def users(self, first_id, count, pw_hash, admins=0):
+        for user_id in range(first_id, first_id + count):
+            yield {
+                'id': user_id,
+                'name': 'user{:07d}'.format(user_id),
+                'email': 'user{:07d}@docket.test'.format(user_id),
+                'password': pw_hash,
+                'role': 'admin' if user_id < first_id + admins else 'user',
+            }
+
+    def user_weights(self, count):
+        # a few users own most of the tasks (log-normal task counts)
+        return [self.rng.lognormvariate(0, 1) for i in range(count)]
+
+    def task(self, task_id, user_id):
+        rng = self.rng
+        is_open = rng.random() < self.open_ratio
+        if is_open:
+            # mostly due in the coming weeks, some already overdue
+            days = int(rng.triangular(-30, 120, 7))
+        else:
+            days = -int(rng.expovariate(1 / 60.0))
+        due_date = self.today + datetime.timedelta(days=days)
+        posted = min(self.today, due_date - datetime.timedelta(
+            days=int(rng.expovariate(1 / 10.0))))
+        return {
+            'task_id': task_id,
+            'name': '{0} {1}'.format(rng.choice(TASK_VERBS),
+                rng.choice(TASK_OBJECTS)),
+            'due_date': due_date,
+            'priority': rng.choices(range(1, 11), PRIORITY_WEIGHTS)[0],
+            'status': 1 if is_open else 0,
+            'user_id': user_id,
+            'posted_date': posted,
+        }
+
+    def tasks(self, first_id, count, user_ids, weights):
+        cumulative, total = [], 0
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        for task_id in range(first_id, first_id + count):
+            user_id = self.rng.choices(user_ids, cum_weights=cumulative)[0]
+            yield self.task(task_id, user_id)
+
+
+"""
+batches(rows, size)
+
+Splits an iterable of rows into lists of at most `size` rows.
+"""
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+"""
+generate(engine, users, tasks, pw_hash, seed=0, open_ratio=0.35,
+        admins=0, batch_size=100000, progress=None)
+
+Adds users and tasks to the database of `engine`. New rows get ids
+after the largest existing ones (for tasks, also after archived and
+deleted ones, see last_task_id()), so the data can be added to a
+database that is already in use. The data versions are bumped at the
+end so that caches do not keep serving the old data.
+
+Args:
+    engine: a SQLAlchemy engine on a database with the Docket schema
+    users: number of users to create
+    tasks: number of tasks to create, spread over the new users
+    pw_hash: password hash shared by every new user
+    seed: seed of the random generator
+    open_ratio: fraction of tasks that are open
+    admins: number of the new users that are admins
+    batch_size: rows per transaction
+    progress: optional callable(table, rows_written)
+
+Returns:
+    a dict with the counts written and the seconds spent loading and
+    building indexes
+"""
+def generate(engine, users, tasks, pw_hash, seed=0, open_ratio=0.35,
+        admins=0, batch_size=100000, progress=None):
+    generator = DataGenerator(seed, open_ratio)
+    users_table, tasks_table = User.__table__, Task.__table__
+    with engine.connect() as connection:
+        first_user = (connection.execute(
+            select([func.max(users_table.c.id)])).scalar() or 0) + 1
+        first_task = last_task_id(connection) + 1
+
+    started = time.time()
+    indexes = [index for index in tasks_table.indexes
+            if index.name in inspect_indexes(engine, tasks_table.name)]
+    for index in indexes:
+        index.drop(engine)
+    tables = inspect(engine).get_table_names()
+    search = engine.dialect.name == 'sqlite' and SEARCH_TABLE in tables
+    stats = engine.dialect.name == 'sqlite' and STATS_TABLE in tables
+    if search:
+        with engine.begin() as connection:
+            drop_search_triggers(connection)
+    if stats:
+        with engine.begin() as connection:
+            drop_stats_triggers(connection)
+    try:
+        written = 0
+        for batch in batches(generator.users(first_user, users, pw_hash,
+                admins), batch_size):
+            with engine.begin() as connection:
+                connection.execute(users_table.insert(), batch)
+            written += len(batch)
+            if progress:
+                progress('users', written)
+
+        user_ids = list(range(first_user, first_user + users))
+        written = 0
+        for batch in batches(generator.tasks(first_task, tasks, user_ids,
+                generator.user_weights(users)), batch_size):
+            with engine.begin() as connection:
+                connection.execute(tasks_table.insert(), batch)
+            written += len(batch)
+            if progress:
+                progress('tasks', written)
+    finally:
+        loaded = time.time()
+        for index in indexes:
+            index.create(engine)
+        if search:
+            with engine.begin() as connection:
+                rebuild_search_index(connection)
+        if stats:
+            with engine.begin() as connection:
+                rebuild_task_stats(connection)
+
+    with engine.begin() as connection:
+        versions = DataVersion.__table__
+        connection.execute(versions.update().values(
+            version=versions.c.version + 1))
+        if connection.execute(select([versions.c.scope]).where(
+                versions.c.scope == TASKS_SCOPE)).first() is None:
+            connection.execute(versions.insert(),
+                    {'scope': TASKS_SCOPE, 'version': 1})
+        if engine.dialect.name == 'sqlite':
+            connection.execute('ANALYZE')
+
+    return {
+        'users': users,
+        'tasks': tasks,
+        'load_seconds': loaded - started,
+        'index_seconds': time.time() - loaded,
+    }
+
+
+"""
+last_task_id(connection)
+
+Returns the largest task id ever handed out: the largest id in tasks
+and in tasks_archive, or the AUTOINCREMENT counter in sqlite_sequence,
+which still counts the ids of deleted tasks. New tasks must start above
+all three, or they would reuse the ids of archived or deleted tasks.
+"""
+def last_task_id(connection):
+    tables = inspect(connection).get_table_names()
+    ids = [connection.execute(select([func.max(Task.__table__.c.task_id)]))
+            .scalar()]
+    if ArchivedTask.__tablename__ in tables:
+        ids.append(connection.execute(select(
+            [func.max(ArchivedTask.__table__.c.task_id)])).scalar())
+    if connection.dialect.name == 'sqlite' and connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'") \
+                    .first() is not None:
+        ids.append(connection.execute("SELECT seq FROM sqlite_sequence "
+            "WHERE name = ?", (Task.__tablename__,)).scalar())
+    return max(i or 0 for i in ids)
+
+
+"""
+inspect_indexes(engine, table)
+
+Returns the names of the indexes that currently exist on a table.
+"""
+def inspect_indexes(engine, table):
+    return set(index['name'] for index in inspect(engine).get_indexes(table))
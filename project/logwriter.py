@@ -0,0 +1,232 @@
+"""
+project/logwriter.py
+
+A log writer that keeps file I/O off the request path. Request handlers
+put structured records on a bounded queue and return; a background
+thread formats them as `key=value` lines, appends them to the log file
+in batches and rotates the file by size and by age. When the queue is
+full, records are dropped and counted instead of blocking the request.
+
+Several processes may append to the same file. The age of a file is
+read from its first record, so every process agrees on it, and the
+rotation itself runs under an flock on `path.lock`, so only the first
+process to see a full or old file rotates it.
+
+Tyler Huntington, 2018
+"""
+
+import atexit
+import calendar
+import datetime
+import errno
+import fcntl
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+"""
+format_record(timestamp, fields)
+
+Formats a log record as one line, e.g.
+
+    2018-01-16T22:08:32Z event=error status=404 url="http://..."
+"""
+def format_record(timestamp, fields):
+    parts = [datetime.datetime.utcfromtimestamp(timestamp)
+            .strftime('%Y-%m-%dT%H:%M:%SZ')]
+    for key, value in fields:
+        value = '' if value is None else str(value)
+        if not value or any(c in value for c in ' "=\n'):
+            value = '"{}"'.format(value.replace('\\', '\\\\')
+                    .replace('"', '\\"').replace('\n', '\\n'))
+        parts.append('{0}={1}'.format(key, value))
+    return ' '.join(parts) + '\n'
+
+
+class AsyncLogWriter(object):
+    """
+    Appends records to `path` from a background thread.
+
+    Args:
+        path: the log file
+        max_bytes: rotate once the file reaches this size (0 to disable)
+        rotate_seconds: rotate once the file is this old (0 to disable)
+        backup_count: number of rotated files to keep (path.1, path.2, ...)
+        queue_size: records that may wait to be written
+        batch_size: records written per batch
+        flush_interval: seconds between writes of a partial batch
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, rotate_seconds=0,
+            backup_count=5, queue_size=10000, batch_size=256,
+            flush_interval=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._pid = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._file = None
+        self._started_at = None
+
+    # ---- request side ----
+
+    def write(self, **fields):
+        """
+        Queues a record without blocking. Fields are written in sorted
+        key order after the timestamp.
+        """
+        record = (time.time(), sorted(fields.items()))
+        try:
+            self._ensure_thread().put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """
+        Blocks until every queued record has been written.
+        """
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def _ensure_thread(self):
+        # threads do not survive a fork, so each process starts its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.queue_size)
+                    self._file = None
+                    thread = threading.Thread(target=self._run,
+                            args=(self._queue,), name='log-writer')
+                    thread.daemon = True
+                    thread.start()
+                    self._pid = os.getpid()
+                    atexit.register(self.flush)
+        return self._queue
+
+    # ---- writer thread ----
+
+    def _run(self, records):
+        while True:
+            try:
+                batch = [records.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except (IOError, OSError):
+                self.dropped += len(batch)
+            finally:
+                for record in batch:
+                    records.task_done()
+
+    def _write_batch(self, batch):
+        self._open()
+        self._file.write(''.join(format_record(t, f) for t, f in batch))
+        self._file.flush()
+        self.written += len(batch)
+        try:
+            if self._should_rotate():
+                self._rotate()
+        except (IOError, OSError):
+            # the batch is written; rotating is tried again after the next
+            pass
+
+    def _is_current(self):
+        # whether self.path still names the file we have open
+        try:
+            return os.stat(self.path).st_ino == os.fstat(
+                    self._file.fileno()).st_ino
+        except OSError:
+            return False
+
+    def _open(self):
+        # reopen if another process rotated the file under us
+        if self._file is not None:
+            if self._is_current():
+                return
+            self._file.close()
+        self._file = open(self.path, 'a')
+        self._started_at = None
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds and
+                time.time() - self._file_age_start() >= self.rotate_seconds)
+
+    def _file_age_start(self):
+        # the time of the first record in the file; unlike the time we
+        # opened it, this is the same for every process and survives a
+        # restart
+        if self._started_at is None:
+            with open(self.path) as f:
+                first = f.read(len('2018-01-16T22:08:32Z'))
+            try:
+                self._started_at = calendar.timegm(
+                        time.strptime(first, '%Y-%m-%dT%H:%M:%SZ'))
+            except ValueError:
+                self._started_at = time.time()
+        return self._started_at
+
+    def _rotate(self):
+        fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # another process rotated the file since we wrote to it
+            if self._is_current():
+                self._rotate_files()
+        finally:
+            os.close(fd)
+            self._file.close()
+            self._file = None
+
+    def _rotate_files(self):
+        if self.backup_count:
+            for i in range(self.backup_count - 1, 0, -1):
+                _rename_missing_ok('{0}.{1}'.format(self.path, i),
+                        '{0}.{1}'.format(self.path, i + 1))
+            _rename_missing_ok(self.path, self.path + '.1')
+        else:
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+
+
+"""
+_rename_missing_ok(source, target)
+
+Renames `source` to `target` unless `source` is already gone.
+"""
+def _rename_missing_ok(source, target):
+    try:
+        os.rename(source, target)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -0,0 +1,349 @@
+"""
+project/metrics.py
+
+Per-endpoint request metrics: request counts by status, server error
+counts and latency histograms with fixed buckets. Recording a request
+is a dictionary update under a lock; nothing is formatted until the
+metrics are scraped.
+
+Under gunicorn every worker counts its own requests. With METRICS_DIR
+set, each worker periodically writes its counters to its own file in
+that directory and the metrics endpoint adds up the files of all the
+workers, so a scrape served by any worker reports the whole host. The
+files of workers that have exited are folded into an archive file, so
+their requests stay counted and the directory does not grow with every
+restarted worker.
+
+Tyler Huntington, 2018
+"""
+
+import bisect
+import errno
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from timeit import default_timer
+
+from flask import g, request
+
+
+# upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+        5.0, 10.0)
+
+
+class RequestStats(object):
+    """
+    Request counters keyed by (endpoint, method, status). Each series
+    holds a count, the total duration and the number of requests that
+    fell into each bucket (the last one is +Inf).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, status, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        key = (endpoint, method, status)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = \
+                        [0, 0.0, [0] * (len(self.buckets) + 1)]
+            series[0] += 1
+            series[1] += seconds
+            series[2][index] += 1
+
+    def rows(self):
+        with self._lock:
+            return [list(key) + [s[0], s[1], list(s[2])]
+                    for key, s in self.series.items()]
+
+    def merge(self, rows):
+        with self._lock:
+            for endpoint, method, status, count, total, counts in rows:
+                key = (endpoint, method, status)
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = \
+                            [0, 0.0, [0] * (len(self.buckets) + 1)]
+                series[0] += count
+                series[1] += total
+                series[2] = [a + b for a, b in zip(series[2], counts)]
+
+    def dump(self):
+        return {'buckets': list(self.buckets), 'rows': self.rows()}
+
+
+class MetricsStore(object):
+    """
+    Holds the counters of this process and, if `directory` is given,
+    shares them with the other processes on the host.
+
+    Args:
+        directory: directory of the per-process files, or None to keep
+            the counters in this process only
+        buckets: upper bounds of the latency buckets
+        flush_interval: seconds between writes of this process's file
+    """
+
+    archive_name = 'requests_archive.json'
+
+    def __init__(self, directory=None, buckets=DEFAULT_BUCKETS,
+            flush_interval=5.0):
+        self.directory = directory
+        self.buckets = tuple(buckets)
+        self.flush_interval = flush_interval
+        self._pid = None
+        if directory:
+            try:
+                os.makedirs(directory, 0o700)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    @property
+    def stats(self):
+        # counters inherited over a fork belong to the parent
+        if self._pid != os.getpid():
+            self._stats = RequestStats(self.buckets)
+            self._last_flush = time.time()
+            self._claimed = False
+            self._pid = os.getpid()
+        return self._stats
+
+    def observe(self, endpoint, method, status, seconds):
+        self.stats.observe(endpoint, method, status, seconds)
+        if self.directory and \
+                time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    # ---- shared files ----
+
+    def _path(self, pid):
+        return os.path.join(self.directory, 'requests_{}.json'.format(pid))
+
+    def _lock_dir(self):
+        fd = os.open(os.path.join(self.directory, '.lock'),
+                os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        # files written with other buckets cannot be added up
+        if tuple(data.get('buckets', ())) != self.buckets:
+            return None
+        return data['rows']
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def _archive(self, path, archive):
+        rows = self._read(path)
+        if rows:
+            archive.merge(rows)
+        os.remove(path)
+
+    def flush(self):
+        """
+        Writes the counters of this process to its file.
+        """
+        if not self.directory:
+            return
+        stats = self.stats
+        fd = self._lock_dir()
+        try:
+            if not self._claimed:
+                # a file left by an exited process that had our pid
+                path = self._path(self._pid)
+                if os.path.exists(path):
+                    self._fold([path])
+                self._claimed = True
+            self._write(self._path(self._pid), stats.dump())
+            self._last_flush = time.time()
+        finally:
+            os.close(fd)
+
+    def _fold(self, paths):
+        archive_path = os.path.join(self.directory, self.archive_name)
+        archive = RequestStats(self.buckets)
+        archive.merge(self._read(archive_path) or [])
+        for path in paths:
+            self._archive(path, archive)
+        self._write(archive_path, archive.dump())
+
+    def collect(self):
+        """
+        Returns a RequestStats with the counters of every process.
+        """
+        if not self.directory:
+            return self.stats
+
+        self.flush()
+        total = RequestStats(self.buckets)
+        fd = self._lock_dir()
+        try:
+            live, dead = [], []
+            for name in os.listdir(self.directory):
+                if not (name.startswith('requests_') and
+                        name.endswith('.json')) or name == self.archive_name:
+                    continue
+                pid = name[len('requests_'):-len('.json')]
+                path = os.path.join(self.directory, name)
+                (live if pid_alive(int(pid)) else dead).append(path)
+            if dead:
+                self._fold(dead)
+            for path in live + [os.path.join(self.directory,
+                    self.archive_name)]:
+                total.merge(self._read(path) or [])
+        finally:
+            os.close(fd)
+        return total
+
+    def clear(self):
+        self._pid = None
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, name))
+
+
+"""
+pid_alive(pid)
+
+Whether a process with the given pid is running.
+"""
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+"""
+render_prometheus(stats)
+
+Formats request counters in the Prometheus text exposition format.
+
+Args:
+    stats: a RequestStats
+
+Returns:
+    the exposition text
+"""
+def render_prometheus(stats):
+    rows = sorted(stats.rows())
+    lines = []
+
+    lines.append('# HELP docket_http_requests_total Requests handled, '
+            'by endpoint, method and status.')
+    lines.append('# TYPE docket_http_requests_total counter')
+    for endpoint, method, status, count, total, counts in rows:
+        lines.append('docket_http_requests_total{{{0}}} {1}'.format(
+                labels(endpoint=endpoint, method=method, status=status),
+                count))
+
+    errors, histograms = {}, {}
+    for endpoint, method, status, count, total, counts in rows:
+        key = (endpoint, method)
+        errors[key] = errors.get(key, 0) + (count if status >= 500 else 0)
+        histogram = histograms.setdefault(key,
+                [0, 0.0, [0] * len(counts)])
+        histogram[0] += count
+        histogram[1] += total
+        histogram[2] = [a + b for a, b in zip(histogram[2], counts)]
+
+    lines.append('# HELP docket_http_request_errors_total Requests that '
+            'ended in a server error.')
+    lines.append('# TYPE docket_http_request_errors_total counter')
+    for (endpoint, method), count in sorted(errors.items()):
+        lines.append('docket_http_request_errors_total{{{0}}} {1}'.format(
+                labels(endpoint=endpoint, method=method), count))
+
+    lines.append('# HELP docket_http_request_duration_seconds Time spent '
+            'handling requests.')
+    lines.append('# TYPE docket_http_request_duration_seconds histogram')
+    bounds = ['{:g}'.format(b) for b in stats.buckets] + ['+Inf']
+    for (endpoint, method), (count, total, counts) in \
+            sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(bounds, counts):
+            cumulative += n
+            lines.append('docket_http_request_duration_seconds_bucket'
+                    '{{{0}}} {1}'.format(labels(endpoint=endpoint,
+                        method=method, le=bound), cumulative))
+        series = labels(endpoint=endpoint, method=method)
+        lines.append('docket_http_request_duration_seconds_sum'
+                '{{{0}}} {1!r}'.format(series, total))
+        lines.append('docket_http_request_duration_seconds_count'
+                '{{{0}}} {1}'.format(series, count))
+
+    return '\n'.join(lines) + '\n'
+
+
+"""
+labels(**values)
+
+Formats Prometheus labels, sorted by name and escaped.
+"""
+def labels(**values):
+    return ','.join('{0}="{1}"'.format(name, str(value)
+            .replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in sorted(values.items()))
+
+
+class RequestMetrics(object):
+    """
+    Times every request of an app. Configured with:
+
+        METRICS_ENABLED         record requests or not
+        METRICS_DIR             directory shared by the worker processes,
+                                or None to count each process on its own
+        METRICS_BUCKETS         latency bucket bounds in seconds
+        METRICS_FLUSH_INTERVAL  seconds between writes of a worker's file
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.store = MetricsStore(app.config['METRICS_DIR'],
+                app.config['METRICS_BUCKETS'],
+                app.config['METRICS_FLUSH_INTERVAL'])
+        app.before_request(self._start)
+        app.after_request(self._record)
+
+    def _start(self):
+        g.metrics_started = default_timer()
+
+    def _record(self, response):
+        started = g.get('metrics_started')
+        if started is not None and self.app.config['METRICS_ENABLED']:
+            # unmatched urls share one series to keep the label set small
+            self.store.observe(request.endpoint or 'unmatched',
+                    request.method, response.status_code,
+                    default_timer() - started)
+        return response
+
+    def render(self):
+        return render_prometheus(self.store.collect())
@@ -0,0 +1,467 @@
+"""
+project/migrations.py
+
+Versioned schema migrations for the Docket SQLite database.
+
+Each migration has a version number, a name and a function that brings
+the schema from the previous version to its own. Applied versions are
+recorded in the schema_migrations table, so running the migrations
+again only applies the new ones. A database that predates the table is
+adopted by checking each migration in order and recording those whose
+changes are already in place.
+
+Tables that have to be rebuilt (SQLite cannot add constraints or change
+columns in place) are copied into a new table in bounded batches. Each
+batch commits together with a checkpoint of the last copied rowid, so
+no write transaction is longer than one batch and an interrupted copy
+resumes where it stopped. Triggers on the source table log the rowids
+of rows inserted, updated or deleted while the copy runs, and those rows
+are copied again (or removed from the new table) in the next batch and
+when the tables are swapped, so the app can keep writing to the table
+during the rebuild.
+
+Migration functions must be safe to run again after an interruption.
+
+Tyler Huntington, 2018
+"""
+
+import datetime
+import sqlite3
+import time
+from collections import namedtuple
+
+from sqlalchemy import create_engine
+
+from project import db
+from project.tasks.search import rebuild_search_index, SEARCH_SCHEMA
+from project.tasks.stats import rebuild_task_stats
+
+Migration = namedtuple('Migration', ['version', 'name', 'upgrade', 'applied'])
+
+MIGRATIONS = []
+
+
+"""
+migration(version, name, applied)
+
+Decorator registering an upgrade function as a migration.
+
+Args:
+    version: the schema version the function migrates to
+    name: short description
+    applied: function(connection) telling whether the changes are
+        already in a database that has no recorded version
+"""
+def migration(version, name, applied):
+    def register(upgrade):
+        MIGRATIONS.append(Migration(version, name, upgrade, applied))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return upgrade
+    return register
+
+
+# helper functions
+
+def table_exists(connection, name):
+    return connection.execute("""SELECT 1 FROM sqlite_master
+        WHERE type IN ('table', 'view') AND name = ?""",
+        (name,)).fetchone() is not None
+
+
+def index_exists(connection, name):
+    return connection.execute("""SELECT 1 FROM sqlite_master
+        WHERE type = 'index' AND name = ?""", (name,)).fetchone() is not None
+
+
+def columns(connection, table):
+    return [row[1] for row in
+            connection.execute('PRAGMA table_info({})'.format(table))]
+
+
+class Migrator(object):
+    """
+    Applies migrations to one database.
+
+    Args:
+        path: path of the SQLite database
+        batch_size: rows per transaction when copying tables
+        progress: optional callable(migration, table, copied, total,
+            rows_per_second) called after every batch
+    """
+
+    def __init__(self, path, batch_size=5000, progress=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.progress = progress
+        self.connection = sqlite3.connect(path, timeout=30,
+                isolation_level=None)
+        self.connection.execute('PRAGMA foreign_keys = OFF')
+        self.current = None
+
+    def close(self):
+        self.connection.close()
+
+    # ---- transactions ----
+
+    def begin(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        self.connection.execute('COMMIT')
+
+    def rollback(self):
+        self.connection.execute('ROLLBACK')
+
+    def execute(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def run_in_transaction(self, statements):
+        self.begin()
+        try:
+            for statement in statements:
+                self.execute(statement)
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+
+    # ---- versions ----
+
+    def ensure_version_tables(self):
+        self.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at VARCHAR NOT NULL)""")
+        self.execute("""CREATE TABLE IF NOT EXISTS migration_checkpoints (
+            version INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            last_rowid INTEGER NOT NULL,
+            rows_copied INTEGER NOT NULL,
+            PRIMARY KEY (version, name))""")
+        self.execute("""CREATE TABLE IF NOT EXISTS migration_changes (
+            version INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            row_id INTEGER NOT NULL,
+            PRIMARY KEY (version, name, row_id))""")
+
+    def applied_versions(self):
+        return set(row[0] for row in
+                self.execute('SELECT version FROM schema_migrations'))
+
+    def version(self):
+        return max(self.applied_versions() or [0])
+
+    def record(self, migration):
+        self.execute("""INSERT OR REPLACE INTO schema_migrations
+            (version, name, applied_at) VALUES (?, ?, ?)""",
+            (migration.version, migration.name,
+                datetime.datetime.utcnow().isoformat()))
+
+    def adopt(self):
+        """
+        Records the migrations whose changes a database without recorded
+        versions already has. A database without any tables gets the
+        current schema from the models first.
+        """
+        if not table_exists(self.connection, 'users'):
+            engine = create_engine('sqlite:///' + self.path)
+            db.metadata.create_all(engine)
+            engine.dispose()
+        for migration in MIGRATIONS:
+            if not migration.applied(self.connection):
+                break
+            self.record(migration)
+
+    def prepare(self):
+        """
+        Creates the version tables and adopts an unversioned database.
+        """
+        self.ensure_version_tables()
+        if not self.applied_versions():
+            self.adopt()
+
+    def pending(self, target=None):
+        applied = self.applied_versions()
+        return [m for m in MIGRATIONS if m.version not in applied and
+                (target is None or m.version <= target)]
+
+    def migrate(self, target=None):
+        """
+        Applies the pending migrations up to `target` (all by default).
+
+        Returns:
+            the migrations that were applied
+        """
+        self.prepare()
+        done = []
+        for migration in self.pending(target):
+            self.current = migration
+            migration.upgrade(self)
+            self.record(migration)
+            done.append(migration)
+        self.current = None
+        return done
+
+    # ---- copying ----
+
+    def checkpoint(self, name):
+        row = self.execute("""SELECT last_rowid, rows_copied
+            FROM migration_checkpoints WHERE version = ? AND name = ?""",
+            (self.current.version, name)).fetchone()
+        return row if row is not None else (0, 0)
+
+    def copy_batch(self, source, target, select, insert, after, limit):
+        placeholders = ', '.join('?' * len(insert))
+        rows = self.execute("""SELECT rowid, {0} FROM {1} WHERE rowid > ?
+            ORDER BY rowid {2}""".format(', '.join(select), source,
+                'LIMIT {}'.format(limit) if limit else ''),
+            (after,)).fetchall()
+        self.connection.executemany("""INSERT INTO {0} ({1})
+            VALUES ({2})""".format(target, ', '.join(insert), placeholders),
+            [row[1:] for row in rows])
+        return rows
+
+    def log_changes(self, table):
+        # every rowid written since the copy started, by the app or by
+        # any other connection, goes into migration_changes
+        for event, rows in (('INSERT', ['new']), ('UPDATE', ['old', 'new']),
+                ('DELETE', ['old'])):
+            self.execute("""CREATE TRIGGER IF NOT EXISTS {0}_migration_{1}
+                AFTER {2} ON {0} BEGIN {3} END""".format(table,
+                    event.lower(), event, ' '.join("""INSERT OR IGNORE INTO
+                        migration_changes (version, name, row_id)
+                        VALUES ({0}, '{1}', {2}.rowid);""".format(
+                            self.current.version, table, row)
+                        for row in rows)))
+
+    def replay_changes(self, source, target, select, insert, up_to=None):
+        # copies the logged rows again, dropping those deleted meanwhile;
+        # rows past `up_to` are not copied yet and stay in the log
+        logged = """migration_changes WHERE version = {0} AND name = '{1}'
+            """.format(self.current.version, source)
+        if up_to is not None:
+            logged += 'AND row_id <= {}'.format(int(up_to))
+        self.execute("""DELETE FROM {0} WHERE rowid IN
+            (SELECT row_id FROM {1})""".format(target, logged))
+        self.execute("""INSERT INTO {0} ({1}) SELECT {2} FROM {3}
+            WHERE rowid IN (SELECT row_id FROM {4})""".format(target,
+                ', '.join(insert), ', '.join(select), source, logged))
+        self.execute('DELETE FROM {}'.format(logged))
+
+    def rebuild_table(self, table, create, select, insert, finish=(),
+            before_swap=()):
+        """
+        Rebuilds `table` with a new definition and swaps it in.
+
+        Args:
+            table: the table to rebuild
+            create: CREATE TABLE statement of the new table, named
+                "<table>_new"
+            select: expressions selected from the old table
+            insert: columns of the new table they are written to
+            finish: statements run after the swap, in the same
+                transaction (indexes, triggers, ...)
+            before_swap: statements run just before the old table is
+                dropped, in the same transaction (e.g. dropping views
+                on it, which would make the rename fail)
+
+        The new table must keep the rowids of the old one (copy its
+        INTEGER PRIMARY KEY), as rows changed during the copy are found
+        in it by rowid.
+        """
+        new = table + '_new'
+        if not table_exists(self.connection, new):
+            self.execute(create)
+        self.log_changes(table)
+
+        last_rowid, copied = self.checkpoint(table)
+        total = self.execute('SELECT count(*) FROM {}'.format(table)) \
+            .fetchone()[0]
+        started, copied_before = time.time(), copied
+        while True:
+            self.begin()
+            try:
+                rows = self.copy_batch(table, new, select, insert,
+                        last_rowid, self.batch_size)
+                if rows:
+                    last_rowid = rows[-1][0]
+                    copied += len(rows)
+                    self.replay_changes(table, new, select, insert,
+                            last_rowid)
+                    self.execute("""INSERT OR REPLACE INTO
+                        migration_checkpoints (version, name, last_rowid,
+                        rows_copied) VALUES (?, ?, ?, ?)""",
+                        (self.current.version, table, last_rowid, copied))
+                self.commit()
+            except Exception:
+                self.rollback()
+                raise
+            if self.progress and (rows or not copied):
+                elapsed = time.time() - started
+                self.progress(self.current, table, copied, total,
+                        (copied - copied_before) / elapsed if elapsed else 0)
+            if len(rows) < self.batch_size:
+                break
+
+        # copy what was written meanwhile and swap, under one lock; the
+        # logging triggers go with the old table
+        self.begin()
+        try:
+            self.copy_batch(table, new, select, insert, last_rowid, None)
+            self.replay_changes(table, new, select, insert)
+            for statement in before_swap:
+                self.execute(statement)
+            self.execute('DROP TABLE {}'.format(table))
+            self.execute('ALTER TABLE {0} RENAME TO {1}'.format(new, table))
+            for statement in finish:
+                self.execute(statement)
+            self.execute("""DELETE FROM migration_checkpoints
+                WHERE version = ? AND name = ?""",
+                (self.current.version, table))
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+
+
+# migrations
+
+@migration(1, 'add users.role and keep user ids',
+        applied=lambda c: 'role' in columns(c, 'users') and
+            not table_exists(c, 'users_new'))
+def add_user_role(migrator):
+    if 'role' in columns(migrator.connection, 'users'):
+        return
+    migrator.rebuild_table('users',
+            create="""CREATE TABLE users_new (
+                id INTEGER NOT NULL,
+                name VARCHAR NOT NULL,
+                email VARCHAR NOT NULL,
+                password VARCHAR NOT NULL,
+                role VARCHAR,
+                PRIMARY KEY (id),
+                UNIQUE (name),
+                UNIQUE (email))""",
+            select=['id', 'name', 'email', 'password', "'user'"],
+            insert=['id', 'name', 'email', 'password', 'role'])
+
+
+@migration(2, 'index the task lists',
+        applied=lambda c: index_exists(c, 'ix_tasks_status_due_date_task_id')
+            and index_exists(c, 'ix_tasks_user_id_status_due_date'))
+def add_task_indexes(migrator):
+    migrator.run_in_transaction([
+        # store status as a true integer so comparisons can use the indexes
+        """UPDATE tasks SET status = CAST(status AS INTEGER)
+            WHERE typeof(status) != 'integer' AND status IS NOT NULL""",
+        """CREATE INDEX IF NOT EXISTS ix_tasks_status_due_date_task_id
+            ON tasks (status, due_date, task_id)""",
+        """CREATE INDEX IF NOT EXISTS ix_tasks_user_id_status_due_date
+            ON tasks (user_id, status, due_date)""",
+        'ANALYZE tasks',
+    ])
+
+
+@migration(3, 'add data_versions',
+        applied=lambda c: table_exists(c, 'data_versions'))
+def add_data_versions(migrator):
+    migrator.execute("""CREATE TABLE IF NOT EXISTS data_versions (
+        scope VARCHAR NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (scope))""")
+
+
+@migration(4, 'add the task search index',
+        applied=lambda c: table_exists(c, 'tasks_fts'))
+def add_task_search(migrator):
+    migrator.begin()
+    try:
+        rebuild_search_index(migrator.connection)
+        migrator.commit()
+    except Exception:
+        migrator.rollback()
+        raise
+
+
+@migration(5, 'add tasks_archive and stop reusing task ids',
+        applied=lambda c: table_exists(c, 'tasks_archive') and
+            not table_exists(c, 'tasks_new'))
+def add_tasks_archive(migrator):
+    if table_exists(migrator.connection, 'tasks_archive'):
+        return
+
+    # AUTOINCREMENT can only be added by rebuilding the table; the task
+    # indexes, search view and triggers go with the old table
+    task_columns = ['task_id', 'name', 'due_date', 'priority', 'status',
+            'user_id', 'posted_date']
+    migrator.rebuild_table('tasks',
+            create="""CREATE TABLE tasks_new (
+                task_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+                name VARCHAR NOT NULL,
+                due_date DATE NOT NULL,
+                priority INTEGER NOT NULL,
+                status INTEGER,
+                user_id INTEGER,
+                posted_date DATE,
+                FOREIGN KEY(user_id) REFERENCES users (id))""",
+            select=task_columns,
+            insert=task_columns,
+            before_swap=['DROP VIEW IF EXISTS task_search'],
+            finish=[
+                """CREATE INDEX ix_tasks_status_due_date_task_id
+                    ON tasks (status, due_date, task_id)""",
+                """CREATE INDEX ix_tasks_user_id_status_due_date
+                    ON tasks (user_id, status, due_date)""",
+            ] + SEARCH_SCHEMA + [
+                """CREATE TABLE tasks_archive (
+                    task_id INTEGER NOT NULL,
+                    name VARCHAR NOT NULL,
+                    due_date DATE NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status INTEGER,
+                    user_id INTEGER,
+                    posted_date DATE,
+                    archived_at DATETIME NOT NULL,
+                    PRIMARY KEY (task_id),
+                    FOREIGN KEY(user_id) REFERENCES users (id))""",
+                """CREATE INDEX ix_tasks_archive_due_date_task_id
+                    ON tasks_archive (due_date, task_id)""",
+                """CREATE INDEX ix_tasks_archive_user_id_due_date
+                    ON tasks_archive (user_id, due_date)""",
+            ])
+
+
+@migration(6, 'add the dashboard task counters',
+        applied=lambda c: table_exists(c, 'task_due_totals'))
+def add_task_stats(migrator):
+    migrator.run_in_transaction([
+        """CREATE TABLE IF NOT EXISTS task_stats (
+            user_id INTEGER NOT NULL,
+            priority INTEGER NOT NULL,
+            status INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, priority, status))""",
+        """CREATE TABLE IF NOT EXISTS task_totals (
+            priority INTEGER NOT NULL,
+            status INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (priority, status))""",
+        """CREATE TABLE IF NOT EXISTS task_due_totals (
+            priority INTEGER NOT NULL,
+            due_date DATE NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (priority, due_date))""",
+        """CREATE TABLE IF NOT EXISTS task_due_stats (
+            user_id INTEGER NOT NULL,
+            priority INTEGER NOT NULL,
+            due_month VARCHAR NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, priority, due_month))""",
+    ])
+    migrator.begin()
+    try:
+        rebuild_task_stats(migrator.connection)
+        migrator.commit()
+    except Exception:
+        migrator.rollback()
+        raise
@@ -14,6 +14,17 @@ class Task(db.Model):
 
     __tablename__ = "tasks"
 
+    # composite indexes serving the task list queries (filter on status,
+    # ordered by due date and task id) and per-user task lookups.
+    # AUTOINCREMENT keeps the ids of archived tasks from being reused.
+    __table_args__ = (
+            db.Index('ix_tasks_status_due_date_task_id',
+                'status', 'due_date', 'task_id'),
+            db.Index('ix_tasks_user_id_status_due_date',
+                'user_id', 'status', 'due_date'),
+            {'sqlite_autoincrement': True},
+    )
+
     task_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     due_date = db.Column(db.Date, nullable=False)
@@ -34,6 +45,42 @@ class Task(db.Model):
     def __repr__(self):
 
         print("<name {0}>".format(self.name))
+
+
+'''
+ArchivedTask class definition
+
+A closed task moved out of the tasks table by `flask archive-tasks`.
+It keeps its task id and columns, so it can be shown next to the
+closed tasks and restored as it was.
+'''
+class ArchivedTask(db.Model):
+
+    __tablename__ = "tasks_archive"
+
+    # the closed task list and per-user lookups, like on tasks
+    __table_args__ = (
+            db.Index('ix_tasks_archive_due_date_task_id',
+                'due_date', 'task_id'),
+            db.Index('ix_tasks_archive_user_id_due_date',
+                'user_id', 'due_date'),
+    )
+
+    task_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)
+    priority = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.Integer)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    posted_date = db.Column(db.Date)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    poster = db.relationship('User')
+
+    def __repr__(self):
+
+        return "<ArchivedTask {0}>".format(self.task_id)
+
+
 '''
 User class definition
 '''
@@ -59,6 +106,115 @@ class User(db.Model):
     def __repr__(self):
 
         print ("<User: {0}>".format(self.name))
-    
 
 
+'''
+DataVersion class definition
+
+A counter per scope that is bumped whenever tasks in that scope are
+written. Scopes are 'tasks' for the whole task table and 'user:<id>'
+for the tasks posted by one user. Readers compare versions to decide
+whether data they have already seen is still current.
+'''
+class DataVersion(db.Model):
+
+    __tablename__ = "data_versions"
+
+    scope = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, scope, version=0):
+
+        self.scope = scope
+        self.version = version
+
+    def __repr__(self):
+
+        return "<DataVersion {0}={1}>".format(self.scope, self.version)
+
+
+'''
+TaskStat class definition
+
+The number of tasks of one user with one priority and status (1 open,
+0 closed, archived tasks included), kept up to date by triggers on
+tasks and tasks_archive, see project/tasks/stats.py. Tasks without a
+poster are counted under user id 0.
+'''
+class TaskStat(db.Model):
+
+    __tablename__ = "task_stats"
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    priority = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    status = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+
+        return "<TaskStat {0}/{1}/{2}={3}>".format(self.user_id,
+                self.priority, self.status, self.count)
+
+
+'''
+TaskDueStat class definition
+
+The number of open tasks of one user with one priority due in one month
+('2018-01'), from which a user's overdue counts are summed. Rows are
+removed when their count drops to zero, so the table only covers open
+tasks.
+'''
+class TaskDueStat(db.Model):
+
+    __tablename__ = "task_due_stats"
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    priority = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    due_month = db.Column(db.String, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+
+        return "<TaskDueStat {0}/{1}/{2}={3}>".format(self.user_id,
+                self.priority, self.due_month, self.count)
+
+
+'''
+TaskTotal class definition
+
+The number of tasks of every user with one priority and status, so the
+totals over all users are read from a handful of rows.
+'''
+class TaskTotal(db.Model):
+
+    __tablename__ = "task_totals"
+
+    priority = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    status = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+
+        return "<TaskTotal {0}/{1}={2}>".format(self.priority, self.status,
+                self.count)
+
+
+'''
+TaskDueTotal class definition
+
+The number of open tasks of every user with one priority due on one
+date, from which the overdue totals are summed. Rows are removed when
+their count drops to zero.
+'''
+class TaskDueTotal(db.Model):
+
+    __tablename__ = "task_due_totals"
+
+    priority = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    due_date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+
+        return "<TaskDueTotal {0}/{1}={2}>".format(self.priority,
+                self.due_date, self.count)
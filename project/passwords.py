@@ -0,0 +1,133 @@
+"""
+project/passwords.py
+
+Runs bcrypt password hashing and checking on a small, bounded thread
+pool instead of the request thread. bcrypt releases the GIL while it
+hashes, so the pool spreads the work over CPU cores while the number
+of hashes running or waiting at once is capped: when the pool and its
+queue are full, HasherBusy is raised straight away so the request can
+be answered with a 503 instead of piling up behind other logins. A
+job that does not finish within PASSWORD_HASH_TIMEOUT seconds is
+answered the same way.
+
+Tyler Huntington, 2018
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class HasherBusy(Exception):
+    """
+    Raised when the hashing pool has no room for another job, or a job
+    took longer than PASSWORD_HASH_TIMEOUT.
+    """
+    pass
+
+
+"""
+hash_cost(pw_hash)
+
+Reads the bcrypt work factor out of a hash such as "$2b$12$...".
+
+Returns:
+    the cost as an int, or None if the hash is not a bcrypt hash
+"""
+def hash_cost(pw_hash):
+    if isinstance(pw_hash, bytes):
+        pw_hash = pw_hash.decode('utf-8', 'replace')
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher(object):
+    """
+    Hashes and checks passwords with Flask-Bcrypt on a bounded pool.
+
+    Config values:
+
+        BCRYPT_LOG_ROUNDS          work factor of new hashes
+        PASSWORD_HASH_WORKERS      threads hashing at the same time
+        PASSWORD_HASH_QUEUE_DEPTH  jobs allowed to wait for a thread
+        PASSWORD_HASH_TIMEOUT      seconds a request waits for its hash
+    """
+
+    def __init__(self, app=None, bcrypt=None):
+        self.bcrypt = bcrypt
+        self._pid = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def _pool(self):
+        # pools do not survive a fork, so each process makes its own
+        with self._lock:
+            if self._pid != os.getpid():
+                config = self.app.config
+                workers = config['PASSWORD_HASH_WORKERS']
+                self._executor = ThreadPoolExecutor(max_workers=workers)
+                self._slots = threading.BoundedSemaphore(
+                        workers + config['PASSWORD_HASH_QUEUE_DEPTH'])
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def _run(self, fn, *args):
+        executor, slots = self._pool()
+        if not slots.acquire(False):
+            raise HasherBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda f: slots.release())
+        try:
+            return future.result(self.app.config['PASSWORD_HASH_TIMEOUT'])
+        except TimeoutError:
+            # the job keeps its slot until it finishes
+            raise HasherBusy()
+
+    @property
+    def rounds(self):
+        return self.app.config['BCRYPT_LOG_ROUNDS']
+
+    def generate(self, password):
+        pw_hash = self._run(self.bcrypt.generate_password_hash, password,
+                self.rounds)
+        if isinstance(pw_hash, bytes):
+            pw_hash = pw_hash.decode('utf-8')
+        return pw_hash
+
+    def check(self, pw_hash, password):
+        return self._run(self.bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        cost = hash_cost(pw_hash)
+        return cost is not None and cost < self.rounds
+
+
+"""
+time_hash(bcrypt, rounds, samples=3)
+
+Measures how long hashing a password takes at a work factor.
+
+Returns:
+    the fastest of `samples` runs, in seconds
+"""
+def time_hash(bcrypt, rounds, samples=3):
+    best = None
+    for i in range(samples):
+        start = time.time()
+        bcrypt.generate_password_hash('docket-benchmark', rounds)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,184 @@
+"""
+project/sqlmonitor.py
+
+SQL instrumentation built on SQLAlchemy engine events:
+
+  * every request counts its statements and the time spent in the
+    database; outside production the totals are sent back in the
+    X-DB-Query-Count and X-DB-Query-Time response headers
+  * when one statement shape runs more than SQL_NPLUSONE_THRESHOLD times
+    in a request (the signature of a per-row lazy load) a warning names
+    the statement and the endpoint
+  * statements slower than SQL_SLOW_QUERY_MS are written to the SQL log
+    together with their EXPLAIN QUERY PLAN
+
+Tyler Huntington, 2018
+"""
+
+import re
+import sqlite3
+from collections import Counter
+from timeit import default_timer
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# collapses the placeholders of IN lists, so "IN (?, ?)" and "IN (?)"
+# count as the same statement shape
+IN_LIST = re.compile(r'\(\s*\?(\s*,\s*\?)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+# statements that have a query plan worth logging
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+"""
+statement_shape(statement)
+
+Normalizes a parameterized statement so that statements differing only
+in their parameters compare equal.
+"""
+def statement_shape(statement):
+    return WHITESPACE.sub(' ', IN_LIST.sub('(?)', statement)).strip()
+
+
+"""
+explain_query_plan(dbapi_connection, statement, parameters)
+
+Runs EXPLAIN QUERY PLAN for a statement on a sqlite3 connection.
+
+Returns:
+    the plan as one string, or None for other databases and for
+    statements without a plan (DDL, PRAGMA, ...)
+"""
+def explain_query_plan(dbapi_connection, statement, parameters):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or \
+            not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '; '.join(row[-1] for row in cursor.fetchall())
+    except sqlite3.Error as e:
+        return 'unavailable: {}'.format(e)
+    finally:
+        cursor.close()
+
+
+class RequestQueries(object):
+    """
+    Statements run while handling one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common()
+                if n > threshold]
+
+
+class QueryMonitor(object):
+    """
+    Instruments the statements of an app's engines. Configured with:
+
+        SQL_DEBUG_HEADERS        add the query count and time headers
+                                 (always on in debug and testing modes)
+        SQL_NPLUSONE_THRESHOLD   runs of one statement shape per request
+                                 allowed before warning, 0 to disable
+        SQL_SLOW_QUERY_MS        statements at least this slow are logged
+                                 with their plan, 0 to disable
+
+    Args:
+        app: the Flask app
+        log: an AsyncLogWriter for repeated and slow statements
+    """
+
+    def __init__(self, app=None, log=None):
+        if app is not None:
+            self.init_app(app, log)
+
+    def init_app(self, app, log):
+        self.app = app
+        self.log = log
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    # ---- engine events ----
+
+    # the start time is kept on the execution context rather than on the
+    # connection, so a statement that raises (and never reaches
+    # after_cursor_execute) leaves nothing behind. Statements run without
+    # a context, such as the dialect's first-connect checks, are not timed.
+
+    def _before_execute(self, conn, cursor, statement, parameters,
+            context, executemany):
+        if context is not None:
+            context._sql_monitor_started = default_timer()
+
+    def _after_execute(self, conn, cursor, statement, parameters,
+            context, executemany):
+        started = getattr(context, '_sql_monitor_started', None)
+        if started is None:
+            return
+        seconds = default_timer() - started
+
+        if has_request_context():
+            queries = g.get('sql_queries')
+            if queries is not None:
+                queries.record(statement, seconds)
+
+        threshold = self.app.config['SQL_SLOW_QUERY_MS']
+        if threshold and seconds * 1000 >= threshold:
+            self.log_slow_query(conn, statement, parameters, executemany,
+                    seconds)
+
+    def log_slow_query(self, conn, statement, parameters, executemany,
+            seconds):
+        # the plan of an executemany is the plan of its first row
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        plan = explain_query_plan(conn.connection.connection, statement,
+                parameters)
+        self.log.write(event='slow_query',
+                ms='{:.1f}'.format(seconds * 1000),
+                endpoint=request.endpoint if has_request_context() else None,
+                statement=statement_shape(statement),
+                plan=plan)
+
+    # ---- request hooks ----
+
+    def _start(self):
+        g.sql_queries = RequestQueries()
+
+    def _finish(self, response):
+        queries = g.get('sql_queries')
+        if queries is None:
+            return response
+
+        config = self.app.config
+        if config['SQL_DEBUG_HEADERS'] or self.app.debug or \
+                self.app.testing:
+            response.headers['X-DB-Query-Count'] = str(queries.count)
+            response.headers['X-DB-Query-Time'] = \
+                    '{:.2f}'.format(queries.seconds * 1000)
+
+        threshold = config['SQL_NPLUSONE_THRESHOLD']
+        if threshold:
+            for shape, n in queries.repeated(threshold):
+                self.app.logger.warning(
+                        "%s ran the same statement %d times: %s",
+                        request.endpoint, n, shape)
+                self.log.write(event='repeated_query', count=n,
+                        endpoint=request.endpoint, statement=shape)
+        return response
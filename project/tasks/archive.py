@@ -0,0 +1,110 @@
+"""
+project/tasks/archive.py
+
+Archiving of closed tasks. Closed tasks whose due date is more than
+ARCHIVE_AFTER_DAYS days in the past are moved from the tasks table to
+tasks_archive, so the open task list, its indexes and the search index
+only carry tasks that are still in use. Archived tasks keep their ids
+and still show up in the closed task list and in exports.
+
+Tasks are moved in batches of consecutive (due_date, task_id) keys,
+each in its own short transaction together with the data version
+bumps, so the app keeps serving requests while a large backlog is
+archived and an interrupted run just continues with the next batch.
+
+Tyler Huntington, 2018
+"""
+
+import datetime
+
+from sqlalchemy import and_, literal, select, tuple_
+
+from project import db
+from project.models import Task, ArchivedTask
+from project.versions import bump_versions
+
+# columns copied between tasks and tasks_archive
+ARCHIVE_COLUMNS = ('task_id', 'name', 'due_date', 'priority', 'status',
+        'user_id', 'posted_date')
+
+
+"""
+archive_cutoff(days, today=None)
+
+Returns the date before which closed tasks are archived.
+"""
+def archive_cutoff(days, today=None):
+    return (today or datetime.date.today()) - datetime.timedelta(days=days)
+
+
+"""
+archive_tasks(days, batch_size=1000, today=None, progress=None)
+
+Moves the closed tasks due more than `days` days ago to the archive.
+
+Args:
+    days: age of the due date after which closed tasks are archived
+    batch_size: tasks moved per transaction
+    today: the date the age is counted from; today by default
+    progress: optional callable(archived) called after every batch
+
+Returns:
+    the number of tasks archived
+"""
+def archive_tasks(days, batch_size=1000, today=None, progress=None):
+    tasks, archive = Task.__table__, ArchivedTask.__table__
+    key = tuple_(tasks.c.due_date, tasks.c.task_id)
+    due = and_(tasks.c.status == 0,
+            tasks.c.due_date < archive_cutoff(days, today))
+
+    archived = 0
+    while True:
+        rows = db.session.execute(select([tasks.c.due_date,
+            tasks.c.task_id, tasks.c.user_id]).where(due)
+            .order_by(tasks.c.due_date, tasks.c.task_id)
+            .limit(batch_size)).fetchall()
+        if not rows:
+            break
+
+        # the batch is every due task up to the key of its last row
+        batch = and_(due, key <= (rows[-1].due_date, rows[-1].task_id))
+        columns = [tasks.c[name] for name in ARCHIVE_COLUMNS]
+        db.session.execute(archive.insert().from_select(
+            list(ARCHIVE_COLUMNS) + ['archived_at'],
+            select(columns + [literal(datetime.datetime.utcnow(),
+                db.DateTime)]).where(batch)))
+        db.session.execute(tasks.delete().where(batch))
+        bump_versions(*set(row.user_id for row in rows))
+        db.session.commit()
+
+        archived += len(rows)
+        if progress:
+            progress(archived)
+        if len(rows) < batch_size:
+            break
+    return archived
+
+
+"""
+restore_task(archived, reopen=True)
+
+Moves an archived task back to the tasks table under its old id.
+
+Args:
+    archived: the ArchivedTask to restore
+    reopen: whether the task comes back open; a task restored closed
+        is archived again by the next run while it is still old enough
+
+Returns:
+    the restored Task
+"""
+def restore_task(archived, reopen=True):
+    task = Task(archived.name, archived.due_date, archived.priority,
+            archived.posted_date, 1 if reopen else archived.status,
+            archived.user_id)
+    task.task_id = archived.task_id
+    db.session.delete(archived)
+    db.session.add(task)
+    bump_versions(task.user_id)
+    db.session.commit()
+    return task
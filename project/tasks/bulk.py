@@ -0,0 +1,104 @@
+"""
+project/tasks/bulk.py
+
+Set-based bulk actions on tasks. A whole selection of tasks is
+completed or deleted with one UPDATE/DELETE per chunk of ids and a
+single commit, with the ownership rule of can_modify() applied in the
+WHERE clause rather than task by task.
+
+Tyler Huntington, 2018
+"""
+
+from project import db
+from project.models import Task
+from project.versions import bump_versions
+from .pagination import MAX_TASK_ID
+
+BULK_ACTIONS = ('complete', 'delete')
+
+# stay well below sqlite's limit on bound parameters per statement
+CHUNK_SIZE = 500
+
+
+class BulkResult(object):
+    """
+    Outcome of a bulk action: the ids that were acted on and the ids
+    that were rejected because they do not exist or the user may not
+    modify them.
+    """
+
+    def __init__(self, action, accepted, rejected):
+        self.action = action
+        self.accepted = accepted
+        self.rejected = rejected
+
+    def to_dict(self):
+        return {
+            'action': self.action,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+        }
+
+
+"""
+is_task_id(value)
+
+Checks that a value is a usable task id: an int (but not a bool) that
+SQLite can store as a rowid, 1 to 2**63 - 1. Larger ints would raise
+OverflowError in sqlite3 rather than just match nothing.
+"""
+def is_task_id(value):
+    return (isinstance(value, int) and not isinstance(value, bool) and
+            1 <= value <= MAX_TASK_ID)
+
+
+"""
+apply_bulk_action(action, task_ids, user_id, is_admin=False)
+
+Completes or deletes a set of tasks in one transaction.
+
+Args:
+    action: 'complete' or 'delete'
+    task_ids: iterable of task ids
+    user_id: id of the user performing the action
+    is_admin: whether the user may modify tasks of other users
+
+Returns:
+    a BulkResult
+"""
+def apply_bulk_action(action, task_ids, user_id, is_admin=False):
+    if action not in BULK_ACTIONS:
+        raise ValueError("Unknown bulk action: {}".format(action))
+
+    task_ids = sorted(set(task_ids))
+    accepted = []
+    owners = set()
+
+    for start in range(0, len(task_ids), CHUNK_SIZE):
+        chunk = task_ids[start:start + CHUNK_SIZE]
+
+        # ownership rule: users may only modify their own tasks
+        condition = Task.task_id.in_(chunk)
+        if not is_admin:
+            condition = condition & (Task.user_id == user_id)
+
+        rows = db.session.query(Task.task_id, Task.user_id) \
+            .filter(condition).all()
+        if not rows:
+            continue
+        accepted.extend(row.task_id for row in rows)
+        owners.update(row.user_id for row in rows)
+
+        tasks = db.session.query(Task).filter(condition)
+        if action == 'complete':
+            tasks.update({"status": 0}, synchronize_session=False)
+        else:
+            tasks.delete(synchronize_session=False)
+
+    if accepted:
+        bump_versions(*owners)
+        db.session.commit()
+
+    accepted_ids = set(accepted)
+    rejected = [t for t in task_ids if t not in accepted_ids]
+    return BulkResult(action, sorted(accepted), rejected)
@@ -0,0 +1,142 @@
+"""
+project/tasks/exporter.py
+
+Streaming export of tasks to CSV or JSONL. Rows are read from a
+database cursor in fixed-size chunks and written out chunk by chunk,
+without building ORM objects or lists of the whole result, so the
+memory used does not grow with the number of tasks and the first
+bytes can be sent before the query has finished.
+
+Archived tasks are exported with the others: the tasks and
+tasks_archive tables are read side by side, each in task id order, and
+merged.
+
+Tyler Huntington, 2018
+"""
+
+import csv
+import heapq
+import io
+import json
+from itertools import islice
+
+from sqlalchemy import select
+
+from project import db
+from project.models import Task, ArchivedTask, User
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+EXPORT_COLUMNS = ('task_id', 'name', 'due_date', 'priority', 'status',
+        'user_id', 'poster', 'posted_date')
+
+
+# tables holding tasks, merged into every export
+EXPORT_TABLES = (Task.__table__, ArchivedTask.__table__)
+
+
+"""
+export_query(user_id=None, tasks=Task.__table__)
+
+Builds the select statement for an export.
+
+Args:
+    user_id: only export the tasks of this user; None exports every task
+    tasks: the table read, one of EXPORT_TABLES
+"""
+def export_query(user_id=None, tasks=Task.__table__):
+    users = User.__table__
+    query = select([tasks.c.task_id, tasks.c.name, tasks.c.due_date,
+        tasks.c.priority, tasks.c.status, tasks.c.user_id,
+        users.c.name.label('poster'), tasks.c.posted_date]) \
+        .select_from(tasks.outerjoin(users, tasks.c.user_id == users.c.id)) \
+        .order_by(tasks.c.task_id)
+    if user_id is not None:
+        query = query.where(tasks.c.user_id == user_id)
+    return query
+
+
+"""
+iter_chunks(query, chunk_size)
+
+Runs a query on its own connection and yields its rows in lists of at
+most `chunk_size` rows, fetched from the cursor as they are needed.
+"""
+def iter_chunks(query, chunk_size):
+    connection = db.engine.connect()
+    try:
+        result = connection.execution_options(stream_results=True) \
+            .execute(query)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        connection.close()
+
+
+"""
+iter_export_rows(user_id, chunk_size)
+
+Yields the rows of every table in EXPORT_TABLES, merged in task id
+order, in lists of at most `chunk_size` rows.
+"""
+def iter_export_rows(user_id, chunk_size):
+    streams = [(row for rows in iter_chunks(export_query(user_id, table),
+        chunk_size) for row in rows) for table in EXPORT_TABLES]
+    rows = heapq.merge(*streams, key=lambda row: row.task_id)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
+"""
+serialize_value(value)
+
+Converts a column value to its exported form (dates as ISO strings).
+"""
+def serialize_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+"""
+generate_export(fmt, user_id=None, chunk_size=1000)
+
+Generates the text of an export, one string per chunk of rows.
+
+Args:
+    fmt: 'csv' or 'jsonl'
+    user_id: only export the tasks of this user; None exports every task
+    chunk_size: number of rows fetched and written per chunk
+"""
+def generate_export(fmt, user_id=None, chunk_size=1000):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Unsupported export format: {}".format(fmt))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    for rows in iter_export_rows(user_id, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            values = [serialize_value(v) for v in row]
+            if fmt == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                buffer.write('\n')
+        yield buffer.getvalue()
@@ -7,6 +7,7 @@ which creates a form for adding new tasks to a user's Docket.
 Tyler Huntington, 2018
 """
 
+import datetime
 from flask_wtf import Form
 from wtforms import StringField, IntegerField, DateField, \
         SelectField, PasswordField
@@ -27,7 +28,74 @@ class AddTaskForm(Form):
     )
     status = IntegerField('Status')
 
+class BulkActionForm(Form):
+    action = SelectField(
+            'Action',
+            validators=[DataRequired()],
+            choices=[('complete', 'Mark as Complete'), ('delete', 'Delete')]
+    )
+
+
+# accepted due date formats outside of the html form: the form's own
+# format plus ISO 8601 dates
+TASK_DATE_FORMATS = (AddTaskForm.due_date.kwargs['format'], '%Y-%m-%d')
+
+# accepted priorities, taken from the form's choices
+TASK_PRIORITIES = [value for value, label in
+        AddTaskForm.priority.kwargs['choices']]
+
+"""
+validate_task(data)
+
+Validates a mapping of task fields, such as a decoded JSON object or a
+CSV row, with the same rules as AddTaskForm: a name and a due date are
+required and must be strings, and the priority must be one of the
+form's choices.
+
+Args:
+    data: mapping with 'name', 'due_date' and 'priority' keys
+
+Returns:
+    a (values, errors) tuple. `values` holds the cleaned name, due_date
+    (a datetime.date) and priority (an int) when there are no errors;
+    `errors` maps field names to lists of error messages.
+"""
+def validate_task(data):
+    values = {}
+    errors = {}
+
+    name = data.get('name')
+    name = name.strip() if isinstance(name, str) else name
+    if name is not None and not isinstance(name, str):
+        errors['name'] = ['Not a valid string value']
+    elif not name:
+        errors['name'] = ['This field is required.']
+    else:
+        values['name'] = name
 
-        
+    due_date = data.get('due_date')
+    due_date = due_date.strip() if isinstance(due_date, str) else due_date
+    if due_date is not None and not isinstance(due_date, str):
+        errors['due_date'] = ['Not a valid string value']
+    elif not due_date:
+        errors['due_date'] = ['This field is required.']
+    else:
+        for date_format in TASK_DATE_FORMATS:
+            try:
+                values['due_date'] = datetime.datetime.strptime(
+                        due_date, date_format).date()
+                break
+            except ValueError:
+                pass
+        else:
+            errors['due_date'] = ['Not a valid date value']
 
+    priority = data.get('priority')
+    if priority is None or str(priority).strip() == '':
+        errors['priority'] = ['This field is required.']
+    elif str(priority).strip() not in TASK_PRIORITIES:
+        errors['priority'] = ['Not a valid choice']
+    else:
+        values['priority'] = int(str(priority).strip())
 
+    return (values if not errors else None), errors
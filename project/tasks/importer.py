@@ -0,0 +1,191 @@
+"""
+project/tasks/importer.py
+
+Streaming bulk import of tasks from CSV or JSONL files. Rows are read
+one at a time, validated with the same rules as AddTaskForm and written
+with one executemany-style INSERT per batch, so memory use depends on
+the batch size rather than on the size of the file.
+
+Tyler Huntington, 2018
+"""
+
+import csv
+import datetime
+import json
+
+from project import db
+from project.models import Task
+from project.tasks.forms import validate_task
+from project.versions import bump_versions
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+class ImportReport(object):
+    """
+    Summary of an import: how many rows were imported and rejected,
+    plus the errors of the first `max_errors` rejected rows.
+    """
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, errors):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'errors_truncated': self.rejected > len(self.errors),
+        }
+
+
+"""
+guess_format(filename, mimetype=None)
+
+Picks the import format from a file name or mimetype.
+
+Returns:
+    'csv', 'jsonl' or None if the format cannot be told
+"""
+def guess_format(filename, mimetype=None):
+    filename = (filename or '').lower()
+    if filename.endswith('.csv') or mimetype == 'text/csv':
+        return 'csv'
+    if filename.endswith(('.jsonl', '.ndjson')) or mimetype in (
+            'application/x-ndjson', 'application/jsonl'):
+        return 'jsonl'
+    return None
+
+
+"""
+decode_lines(stream, bad_lines)
+
+Decodes the lines of a binary stream as UTF-8 one at a time, so a line
+that is not valid UTF-8 only spoils its own row. Such lines are decoded
+with replacement characters and their numbers added to `bad_lines`.
+"""
+def decode_lines(stream, bad_lines):
+    for line_number, line in enumerate(stream, 1):
+        try:
+            yield line.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(line_number)
+            yield line.decode('utf-8', 'replace')
+
+
+"""
+iter_rows(stream, fmt)
+
+Lazily decodes the rows of a binary CSV or JSONL stream.
+
+Args:
+    stream: a binary file-like object, iterated line by line
+    fmt: 'csv' or 'jsonl'
+
+Yields:
+    (line_number, row, error) tuples; `row` is a dict of fields, or
+    None with an error message if the line could not be decoded
+"""
+def iter_rows(stream, fmt):
+    bad_lines = set()
+    lines = decode_lines(stream, bad_lines)
+
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        reader.fieldnames  # reads the header
+        last_line = reader.line_num
+        for row in reader:
+            # a quoted field may span several lines
+            first_line, last_line = last_line + 1, reader.line_num
+            if bad_lines.intersection(range(first_line, last_line + 1)):
+                yield last_line, None, 'Not valid UTF-8 text'
+            else:
+                yield last_line, row, None
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if line_number in bad_lines:
+            yield line_number, None, 'Not valid UTF-8 text'
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Not a valid JSON object'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Not a valid JSON object'
+            continue
+        yield line_number, row, None
+
+
+"""
+insert_batch(rows, user_id)
+
+Inserts a batch of validated task rows with a single executemany and
+commits it together with the data version bump.
+"""
+def insert_batch(rows, user_id):
+    if not rows:
+        return
+    db.session.execute(Task.__table__.insert(), rows)
+    bump_versions(user_id)
+    db.session.commit()
+
+
+"""
+import_tasks(stream, fmt, user_id, batch_size=1000, max_errors=100)
+
+Imports tasks for a user from a CSV or JSONL stream. Each row needs
+`name`, `due_date` (mm/dd/yyyy or yyyy-mm-dd) and `priority` (1-10);
+other columns are ignored. Valid rows are committed in batches of
+`batch_size`, so an error part-way through a file does not undo the
+batches before it.
+
+Args:
+    stream: binary file-like object with the rows
+    fmt: 'csv' or 'jsonl'
+    user_id: id of the user who will own the tasks
+    batch_size: number of rows per INSERT/transaction
+    max_errors: number of rejected rows to report errors for
+
+Returns:
+    an ImportReport
+"""
+def import_tasks(stream, fmt, user_id, batch_size=1000, max_errors=100):
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError("Unsupported import format: {}".format(fmt))
+
+    report = ImportReport(max_errors)
+    posted_date = datetime.datetime.utcnow().date()
+    batch = []
+
+    for line, row, error in iter_rows(stream, fmt):
+        if error is not None:
+            report.reject(line, {'row': [error]})
+            continue
+
+        values, errors = validate_task(row)
+        if errors:
+            report.reject(line, errors)
+            continue
+
+        values.update(posted_date=posted_date, status=1, user_id=user_id)
+        batch.append(values)
+        if len(batch) >= batch_size:
+            insert_batch(batch, user_id)
+            report.imported += len(batch)
+            batch = []
+
+    insert_batch(batch, user_id)
+    report.imported += len(batch)
+    return report
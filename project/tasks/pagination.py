@@ -0,0 +1,184 @@
+"""
+project/tasks/pagination.py
+
+Keyset (cursor-based) pagination for task lists. Pages are ordered by
+(due_date, task_id) and each page is fetched with a range condition on
+that key instead of an OFFSET, so the cost of a page does not depend
+on how deep into the list it is.
+
+A list spread over several tables (the closed tasks, which are partly
+archived) is paged as a MergedQuery: each query is fetched with the
+same range condition and limit, and the rows are merged by key.
+
+Tyler Huntington, 2018
+"""
+
+import datetime
+from sqlalchemy import tuple_
+
+
+CURSOR_SEPARATOR = '_'
+
+# largest id SQLite can store; larger ones cannot be bound to a query
+MAX_TASK_ID = 2 ** 63 - 1
+
+
+"""
+encode_cursor(task)
+
+Builds the opaque cursor string for the position of a task.
+
+Args:
+    task: any object with `due_date` and `task_id` attributes
+
+Returns:
+    a url-safe string of the form "<yyyy-mm-dd>_<task_id>"
+"""
+def encode_cursor(task):
+    return "{0}{1}{2}".format(task.due_date.isoformat(),
+            CURSOR_SEPARATOR, task.task_id)
+
+
+"""
+decode_cursor(cursor)
+
+Parses a cursor produced by encode_cursor().
+
+Args:
+    cursor: the cursor string
+
+Returns:
+    a (due_date, task_id) tuple
+
+Raises:
+    ValueError if the cursor is malformed
+"""
+def decode_cursor(cursor):
+    due_date, sep, task_id = cursor.partition(CURSOR_SEPARATOR)
+    if not sep:
+        raise ValueError("Malformed cursor: {}".format(cursor))
+    due_date = datetime.datetime.strptime(due_date, '%Y-%m-%d').date()
+    task_id = int(task_id)
+    if not 0 <= task_id <= MAX_TASK_ID:
+        raise ValueError("Malformed cursor: {}".format(cursor))
+    return due_date, task_id
+
+
+class KeysetPage(object):
+    """
+    A single page of tasks plus the cursors needed to move to the
+    neighbouring pages. Iterating over a page yields its tasks, so it
+    can be handed to templates in place of a query.
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class MergedQuery(object):
+    """
+    A task list made of several queries over tables with the same key
+    columns, paged as one list by paginate(). Filters are applied to
+    every query.
+    """
+
+    def __init__(self, *queries):
+        self.queries = queries
+
+    def filter_by(self, **kwargs):
+        return MergedQuery(*[query.filter_by(**kwargs)
+            for query in self.queries])
+
+
+"""
+fetch_rows(query, bound=None, descending=False, limit=None)
+
+Fetches the rows of a query (or MergedQuery) past a key, in key order.
+
+Args:
+    query: a query over one task table; any ordering is replaced
+    bound: (due_date, task_id) the rows must come after, or before when
+        descending; None starts at the beginning (or the end)
+    descending: fetch in descending key order
+    limit: maximum number of rows
+
+Returns:
+    a list of rows
+"""
+def fetch_rows(query, bound=None, descending=False, limit=None):
+    if isinstance(query, MergedQuery):
+        rows = sorted((row for q in query.queries
+            for row in fetch_rows(q, bound, descending, limit)),
+            key=lambda row: (row.due_date, row.task_id), reverse=descending)
+        return rows[:limit]
+
+    entity = query.column_descriptions[0]['entity']
+    query = query.order_by(None)
+    if bound is not None:
+        key = tuple_(entity.due_date, entity.task_id)
+        query = query.filter(key < bound if descending else key > bound)
+    if descending:
+        query = query.order_by(entity.due_date.desc(), entity.task_id.desc())
+    else:
+        query = query.order_by(entity.due_date.asc(), entity.task_id.asc())
+    return query.limit(limit).all()
+
+
+"""
+paginate(query, cursor=None, direction='next', per_page=25)
+
+Fetches one page of a task query using keyset pagination on
+(due_date, task_id). Any ordering already applied to the query is
+replaced by the key ordering.
+
+Args:
+    query: a query over Task (filters and loader options are kept), or
+        a MergedQuery
+    cursor: cursor string of the page boundary, or None for the first page
+    direction: 'next' for the tasks after the cursor, 'prev' for the
+        tasks before it
+    per_page: maximum number of tasks on the page
+
+Returns:
+    a KeysetPage
+
+Raises:
+    ValueError if the cursor is malformed
+"""
+def paginate(query, cursor=None, direction='next', per_page=25):
+    if cursor is not None and direction == 'prev':
+        rows = fetch_rows(query, decode_cursor(cursor), True, per_page + 1)
+
+        # nothing before the cursor; fall back to the first page
+        if not rows:
+            return paginate(query, None, 'next', per_page)
+
+        has_more = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        return KeysetPage(rows,
+                next_cursor=encode_cursor(rows[-1]),
+                prev_cursor=encode_cursor(rows[0]) if has_more else None)
+
+    rows = fetch_rows(query, decode_cursor(cursor) if cursor is not None
+            else None, False, per_page + 1)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    return KeysetPage(rows,
+            next_cursor=encode_cursor(rows[-1]) if has_more else None,
+            prev_cursor=encode_cursor(rows[0]) if (cursor and rows) else None)
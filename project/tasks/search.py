@@ -0,0 +1,320 @@
+"""
+project/tasks/search.py
+
+Full-text search over task names. The names are indexed in tasks_fts,
+an SQLite FTS5 table whose content comes from the tasks table (through
+the task_search view), and triggers on tasks keep the index in step
+with every insert, update and delete, whichever code path writes the
+rows (views, api, bulk actions, imports).
+
+Besides the name, each task is indexed with filter tokens for its
+owner, status and priority ("u12 s1 p4"), so filtered searches are
+answered by intersecting posting lists inside the index instead of
+looking up every matching task. Every search word of two or more
+characters also matches the words it is a prefix of ("gro" finds
+"groceries"). The index keeps the prefixes of up to PREFIX_LENGTH
+characters of every word, so prefix searches read one posting list;
+longer words are searched by their first PREFIX_LENGTH characters and
+checked in full here.
+
+FTS5's bm25() has to visit every row that contains a search term to
+weigh it, which takes tens of milliseconds for common words in a large
+table. Instead, the newest SEARCH_CANDIDATES matching tasks are read
+from the index in rowid order, which is cheap however many tasks
+match, and ranked here with the same BM25 term weighting: tasks whose
+names contain the words more often, as whole words and in fewer words
+rank first. Searches matching more tasks than that are ranked
+SEARCH_CANDIDATES at a time, newest first: the first pages hold the
+best of the newest matches and later pages go on to older ones, so
+every match can be paged to.
+
+The view, table and triggers are created together with the tasks
+table; existing databases get them from migration 4 or from
+`flask rebuild-search`, which also rebuilds the index from the tasks.
+
+Tyler Huntington, 2018
+"""
+
+import re
+import unicodedata
+
+from sqlalchemy import DDL, column, event, select, table, text
+from sqlalchemy.orm import joinedload
+
+from project import db
+from project.models import Task
+
+SEARCH_TABLE = 'tasks_fts'
+
+# filter tokens of a row of tasks, see filter_tokens()
+FILTER_TOKENS_SQL = ("'u' || ifnull({0}.user_id, '') || ' s' || "
+        "ifnull({0}.status, '') || ' p' || ifnull({0}.priority, '')")
+
+# longest word prefix kept in the index; a prefix query of another
+# length would have to merge the posting lists of every matching word
+PREFIX_LENGTH = 6
+
+SEARCH_SCHEMA = [
+    """CREATE VIEW IF NOT EXISTS task_search AS
+        SELECT task_id, name, {0} AS filters FROM tasks""".format(
+            FILTER_TOKENS_SQL.format('tasks')),
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(name,
+        filters, content='task_search', content_rowid='task_id',
+        prefix='{0}')""".format(' '.join(str(length)
+            for length in range(2, PREFIX_LENGTH + 1))),
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (rowid, name, filters)
+                VALUES (new.task_id, new.name, {0});
+        END""".format(FILTER_TOKENS_SQL.format('new')),
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, name, filters)
+                VALUES ('delete', old.task_id, old.name, {0});
+        END""".format(FILTER_TOKENS_SQL.format('old')),
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+        AFTER UPDATE OF task_id, name, status, priority, user_id ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, name, filters)
+                VALUES ('delete', old.task_id, old.name, {0});
+            INSERT INTO tasks_fts (rowid, name, filters)
+                VALUES (new.task_id, new.name, {1});
+        END""".format(FILTER_TOKENS_SQL.format('old'),
+            FILTER_TOKENS_SQL.format('new')),
+]
+
+SEARCH_TRIGGERS = ['tasks_fts_insert', 'tasks_fts_delete',
+        'tasks_fts_update']
+
+# statuses accepted by the status filter
+SEARCH_STATUSES = {'open': 1, 'closed': 0, 'all': None}
+
+# BM25 parameters; a word that only matches as a prefix counts for
+# PREFIX_WEIGHT of a whole-word match
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.5
+
+tasks_fts = table(SEARCH_TABLE, column('rowid'))
+
+WORD = re.compile(r'[^\W_]+', re.UNICODE)
+NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+for statement in SEARCH_SCHEMA:
+    event.listen(Task.__table__, 'after_create',
+            DDL(statement).execute_if(dialect='sqlite'))
+for statement in ('DROP TABLE IF EXISTS tasks_fts',
+        'DROP VIEW IF EXISTS task_search'):
+    event.listen(Task.__table__, 'before_drop',
+            DDL(statement).execute_if(dialect='sqlite'))
+
+
+"""
+words(value)
+
+Splits text into lower case words without accents, the way the index
+tokenizes task names.
+"""
+def words(value):
+    value = value or ''
+    if NON_ASCII.search(value):
+        value = ''.join(c for c in unicodedata.normalize('NFKD', value)
+                if not unicodedata.combining(c))
+    return WORD.findall(value.lower())
+
+
+"""
+search_terms(query, max_terms=8)
+
+Returns the words of a search as (word, is_prefix) pairs. Words of two
+or more characters match as prefixes; single characters only match
+whole words, which keeps searches like "a" from expanding to most of
+the index.
+
+Args:
+    query: the search text
+    max_terms: words beyond this many are ignored
+"""
+def search_terms(query, max_terms=8):
+    return [(word, len(word) > 1) for word in words(query)[:max_terms]]
+
+
+"""
+parse_query(query, max_terms=8, status=None, priority=None, user_id=None)
+
+Turns what a user typed, and the filters, into an FTS5 query. Words are
+quoted, so punctuation and FTS5 operators are searched for literally
+rather than interpreted, and only match task names; all of them must
+match.
+
+Returns:
+    the FTS5 query string, or None if the text has no words
+"""
+def parse_query(query, max_terms=8, status=None, priority=None,
+        user_id=None):
+    terms = search_terms(query, max_terms)
+    if not terms:
+        return None
+    match = 'name : ({})'.format(' '.join(
+        '"{}"*'.format(word[:PREFIX_LENGTH]) if prefix else '"{}"'.format(word)
+        for word, prefix in terms))
+    filters = filter_tokens(status, priority, user_id)
+    if filters:
+        match += ' AND filters : ({})'.format(' '.join(filters))
+    return match
+
+
+"""
+filter_tokens(status=None, priority=None, user_id=None)
+
+Returns the index tokens selecting tasks with the given status,
+priority and owner.
+"""
+def filter_tokens(status=None, priority=None, user_id=None):
+    tokens = []
+    if user_id is not None:
+        tokens.append('u{:d}'.format(user_id))
+    if status is not None:
+        tokens.append('s{:d}'.format(status))
+    if priority is not None:
+        tokens.append('p{:d}'.format(priority))
+    return tokens
+
+
+"""
+relevance(tokens, terms, average_length)
+
+Scores how well the words of a task name match the search terms with
+the BM25 term weighting; higher is better. Returns None if one of the
+terms does not match at all.
+"""
+def relevance(tokens, terms, average_length):
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average_length)
+    score = 0.0
+    for word, prefix in terms:
+        count = 0.0
+        for token in tokens:
+            if token == word:
+                count += 1
+            elif prefix and token.startswith(word):
+                count += PREFIX_WEIGHT
+        if not count:
+            return None
+        score += count * (BM25_K1 + 1) / (count + norm)
+    return score
+
+
+"""
+rank_candidates(match, terms, candidates, before=None)
+
+Ranks one window of matching tasks: the newest `candidates` tasks
+matching the FTS5 query `match` whose ids are below `before`.
+
+Returns:
+    (ids, oldest): the ids of the tasks ranked best first, and the
+    lowest id in the window, or None if no older tasks match
+"""
+def rank_candidates(match, terms, candidates, before=None):
+    tasks = Task.__table__
+    hits = select([tasks_fts.c.rowid]) \
+        .where(text('tasks_fts MATCH :match').bindparams(match=match))
+    if before is not None:
+        hits = hits.where(tasks_fts.c.rowid < before)
+    hits = hits.order_by(tasks_fts.c.rowid.desc()).limit(candidates) \
+        .alias('hits')
+    rows = db.session.execute(select([hits.c.rowid, tasks.c.task_id,
+        tasks.c.name, tasks.c.due_date]).select_from(hits.outerjoin(tasks,
+            tasks.c.task_id == hits.c.rowid))).fetchall()
+    oldest = min(row.rowid for row in rows) \
+            if len(rows) == candidates else None
+    rows = [row for row in rows if row.task_id is not None]
+    if not rows:
+        return [], oldest
+
+    tokens = [words(row.name) for row in rows]
+    average_length = float(sum(len(t) for t in tokens)) / len(rows) or 1.0
+    scored = [(relevance(t, terms, average_length), row)
+            for row, t in zip(rows, tokens)]
+    ranked = sorted((pair for pair in scored if pair[0] is not None),
+            key=lambda pair: (-pair[0], pair[1].due_date, pair[1].task_id))
+    return [row.task_id for score, row in ranked], oldest
+
+
+"""
+search_tasks(query, status=None, priority=None, user_id=None, limit=25,
+        offset=0, max_terms=8, candidates=1000)
+
+Finds the tasks whose names match a search, best matches first. Ties
+are broken by due date like the task lists. Each task's poster is
+loaded in the same query.
+
+Args:
+    query: the search text, see search_terms()
+    status: only tasks with this status (1 open, 0 closed)
+    priority: only tasks with this priority
+    user_id: only the tasks of this user
+    limit, offset: the slice of the ranked results to return
+    max_terms: see search_terms()
+    candidates: number of matching tasks ranked together; when more
+        tasks match, each window of that many (newest first) is ranked
+        in turn, so a deep offset reads every window before it
+
+Returns:
+    a list of Tasks; empty if the text has no words
+"""
+def search_tasks(query, status=None, priority=None, user_id=None, limit=25,
+        offset=0, max_terms=8, candidates=1000):
+    match = parse_query(query, max_terms, status, priority, user_id)
+    if match is None:
+        return []
+
+    terms = search_terms(query, max_terms)
+    ids, before = [], None
+    while len(ids) < limit:
+        ranked, before = rank_candidates(match, terms, candidates, before)
+        ids += ranked[offset:offset + limit - len(ids)]
+        offset = max(offset - len(ranked), 0)
+        if before is None:
+            break
+    if not ids:
+        return []
+
+    found = dict((task.task_id, task) for task in
+            db.session.query(Task).options(joinedload('poster'))
+            .filter(Task.task_id.in_(ids)))
+    return [found[task_id] for task_id in ids if task_id in found]
+
+
+"""
+create_search_index(connection)
+
+Creates the search view, table and triggers where they are missing.
+`connection` is a DB-API or SQLAlchemy connection to a SQLite database.
+"""
+def create_search_index(connection):
+    for statement in SEARCH_SCHEMA:
+        connection.execute(statement)
+
+
+"""
+drop_search_triggers(connection)
+
+Drops the triggers that keep the search index up to date, for bulk
+loads that rebuild the index once at the end instead.
+"""
+def drop_search_triggers(connection):
+    for trigger in SEARCH_TRIGGERS:
+        connection.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+
+
+"""
+rebuild_search_index(connection)
+
+Creates the search view, table and triggers if needed, then reindexes
+every task and merges the index into as few segments as possible.
+"""
+def rebuild_search_index(connection):
+    create_search_index(connection)
+    connection.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+    connection.execute(
+            "INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')")
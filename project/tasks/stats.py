@@ -0,0 +1,251 @@
+"""
+project/tasks/stats.py
+
+Task counters for the dashboard. Counting tasks with GROUP BY on every
+load reads every task, so the counts are kept in summary tables
+instead, each as coarse as its readers allow:
+
+    task_stats       open and closed tasks per user, priority
+    task_totals      open and closed tasks per priority, over all users
+    task_due_totals  open tasks per priority and due date, over all users
+    task_due_stats   open tasks per user, priority and due month
+
+The totals over all users read a few rows per priority and date. A
+user's overdue tasks are summed from the months before the current one,
+plus the open tasks due earlier this month, which are counted from the
+task index on (user_id, status, due_date).
+
+Triggers on tasks and tasks_archive update the tables in the same
+transaction as every insert, update and delete, whichever code path
+writes the rows (views, api, bulk actions, imports, the archive job),
+so the counters can never be seen out of step with the tasks. Archived
+tasks count as closed tasks. `flask reconcile-stats` recounts every
+task, reports counters that drifted and rebuilds the tables.
+
+Tyler Huntington, 2018
+"""
+
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import DDL, and_, case, event, func, select
+
+from project import db
+from project.models import Task, TaskStat, TaskDueStat, TaskTotal, \
+        TaskDueTotal
+
+STATS_TABLE = 'task_stats'
+
+# counts of one priority or one user
+TaskCounts = namedtuple('TaskCounts', ['key', 'open', 'closed', 'overdue'])
+
+STATUS_SQL = 'CASE WHEN {0}.status = 1 THEN 1 ELSE 0 END'
+
+# the counter tables: their key columns, the key of a task row in them
+# ({0} is the row) and whether they only count open tasks
+COUNTERS = [
+    ('task_stats', ('user_id', 'priority', 'status'),
+        ('ifnull({0}.user_id, 0)', '{0}.priority', STATUS_SQL), False),
+    ('task_totals', ('priority', 'status'),
+        ('{0}.priority', STATUS_SQL), False),
+    ('task_due_totals', ('priority', 'due_date'),
+        ('{0}.priority', '{0}.due_date'), True),
+    ('task_due_stats', ('user_id', 'priority', 'due_month'),
+        ('ifnull({0}.user_id, 0)', '{0}.priority',
+            'substr({0}.due_date, 1, 7)'), True),
+]
+
+
+"""
+count_sql(row, delta)
+
+Returns the trigger statements adding `delta` to the counters of the
+`row` ('new' or 'old') of a trigger. Counters of open tasks that drop
+to zero are removed.
+"""
+def count_sql(row, delta):
+    sql = ''
+    for table, columns, keys, open_only in COUNTERS:
+        keys = [key.format(row) for key in keys]
+        where = ' AND '.join(['{0}.status = 1'.format(row)] * open_only +
+                ['{0} = {1}'.format(c, k) for c, k in zip(columns, keys)])
+        sql += """
+            INSERT OR IGNORE INTO {0} ({1}, count) SELECT {2}, 0{3};
+            UPDATE {0} SET count = count + {4} WHERE {5};""".format(table,
+                ', '.join(columns), ', '.join(keys),
+                ' WHERE {}.status = 1'.format(row) if open_only else '',
+                delta, where)
+        if open_only and delta < 0:
+            sql += """
+            DELETE FROM {0} WHERE {1} AND count = 0;""".format(table, where)
+    return sql
+
+
+STATS_TRIGGERS = {}
+for table in ('tasks', 'tasks_archive'):
+    STATS_TRIGGERS['{}_stats_insert'.format(table)] = """
+        CREATE TRIGGER IF NOT EXISTS {0}_stats_insert AFTER INSERT ON {0}
+        BEGIN{1}
+        END""".format(table, count_sql('new', 1))
+    STATS_TRIGGERS['{}_stats_delete'.format(table)] = """
+        CREATE TRIGGER IF NOT EXISTS {0}_stats_delete AFTER DELETE ON {0}
+        BEGIN{1}
+        END""".format(table, count_sql('old', -1))
+    STATS_TRIGGERS['{}_stats_update'.format(table)] = """
+        CREATE TRIGGER IF NOT EXISTS {0}_stats_update
+        AFTER UPDATE OF user_id, priority, status, due_date ON {0}
+        BEGIN{1}{2}
+        END""".format(table, count_sql('old', -1), count_sql('new', 1))
+
+# every task, live or archived
+TASK_ROWS_SQL = """SELECT user_id, priority, status, due_date FROM tasks
+    UNION ALL SELECT user_id, priority, status, due_date FROM tasks_archive"""
+
+# the counters of each table recounted from the tasks
+EXPECTED_SQL = dict((table, """SELECT {0}, count(*) FROM ({1}) AS t{2}
+    GROUP BY {3}""".format(', '.join(key.format('t') for key in keys),
+        TASK_ROWS_SQL, ' WHERE t.status = 1' if open_only else '',
+        ', '.join(str(i + 1) for i in range(len(keys)))))
+    for table, columns, keys, open_only in COUNTERS)
+
+# created once every table exists, as they span tasks and tasks_archive
+for name in sorted(STATS_TRIGGERS):
+    event.listen(db.metadata, 'after_create',
+            DDL(STATS_TRIGGERS[name]).execute_if(dialect='sqlite'))
+
+
+"""
+create_stats_triggers(connection)
+
+Creates the triggers that keep the task counters up to date where they
+are missing. `connection` is a DB-API or SQLAlchemy connection to a
+SQLite database.
+"""
+def create_stats_triggers(connection):
+    for name in sorted(STATS_TRIGGERS):
+        connection.execute(STATS_TRIGGERS[name])
+
+
+"""
+drop_stats_triggers(connection)
+
+Drops the triggers that keep the task counters up to date, for bulk
+loads that rebuild the counters once at the end instead.
+"""
+def drop_stats_triggers(connection):
+    for name in sorted(STATS_TRIGGERS):
+        connection.execute('DROP TRIGGER IF EXISTS {}'.format(name))
+
+
+"""
+rebuild_task_stats(connection)
+
+Creates the counter triggers if needed and recounts every counter from
+the tasks. Run it in a transaction, so that no task write falls
+between the recount and the swap.
+"""
+def rebuild_task_stats(connection):
+    create_stats_triggers(connection)
+    for table, columns, keys, open_only in COUNTERS:
+        connection.execute('DELETE FROM {}'.format(table))
+        connection.execute('INSERT INTO {0} ({1}, count) {2}'.format(table,
+            ', '.join(columns), EXPECTED_SQL[table]))
+
+
+"""
+find_stats_drift(connection)
+
+Compares the counters with a recount of the tasks.
+
+Returns:
+    a list of (table, key, expected, actual) tuples, one per counter
+    that differs; empty if the counters are right
+"""
+def find_stats_drift(connection):
+    drift = []
+    for table, columns, keys, open_only in COUNTERS:
+        expected = dict((tuple(row[:-1]), row[-1])
+                for row in connection.execute(EXPECTED_SQL[table]))
+        actual = dict((tuple(row[:-1]), row[-1]) for row in
+                connection.execute('SELECT {0}, count FROM {1} '
+                    'WHERE count != 0'.format(', '.join(columns), table)))
+        for key in sorted(set(expected) | set(actual), key=str):
+            if expected.get(key, 0) != actual.get(key, 0):
+                drift.append((table, key, expected.get(key, 0),
+                    actual.get(key, 0)))
+    return drift
+
+
+"""
+count_tasks(by='priority', user_ids=None, today=None)
+
+Reads the open, closed and overdue task counts from the counters.
+
+Args:
+    by: 'priority' for counts per priority, 'user_id' for counts per user
+    user_ids: only count the tasks of these users; None counts every task
+    today: tasks due before this date are overdue; today by default
+
+Returns:
+    a list of TaskCounts ordered by key, leaving out keys without tasks
+"""
+def count_tasks(by='priority', user_ids=None, today=None):
+    today = today or datetime.date.today()
+    if by == 'priority' and user_ids is None:
+        # the totals over all users
+        stats, due = TaskTotal.__table__, TaskDueTotal.__table__
+        overdue = [select([due.c.priority, func.sum(due.c.count)])
+            .where(due.c.due_date < today).group_by(due.c.priority)]
+    else:
+        stats = TaskStat.__table__
+        overdue = overdue_queries(by, user_ids, today)
+    counts = select([stats.c[by],
+        func.sum(case([(stats.c.status == 1, stats.c.count)], else_=0)),
+        func.sum(case([(stats.c.status == 0, stats.c.count)], else_=0))]) \
+        .group_by(stats.c[by])
+    if user_ids is not None:
+        counts = counts.where(stats.c.user_id.in_(user_ids))
+
+    totals = {}
+    for key, open_count, closed_count in db.session.execute(counts):
+        totals[key] = [open_count, closed_count, 0]
+    for query in overdue:
+        for key, overdue_count in db.session.execute(query):
+            totals.setdefault(key, [0, 0, 0])[2] += overdue_count
+    return [TaskCounts(key, *values) for key, values in
+            sorted(totals.items()) if any(values)]
+
+
+"""
+overdue_queries(by, user_ids, today)
+
+Returns the queries counting the open tasks of `user_ids` (every user
+if None) due before `today`, per `by`: one summing the months before
+the current one from task_due_stats, and one counting the tasks due
+earlier in the current month from the tasks. Open tasks are never
+archived, so only the tasks table is read.
+"""
+def overdue_queries(by, user_ids, today):
+    due, tasks = TaskDueStat.__table__, Task.__table__
+    months = select([due.c[by], func.sum(due.c.count)]) \
+        .where(due.c.due_month < today.strftime('%Y-%m')) \
+        .group_by(due.c[by])
+    key = tasks.c.priority if by == 'priority' else \
+            func.ifnull(tasks.c.user_id, 0)
+    this_month = select([key, func.count()]).where(and_(
+        tasks.c.status == 1, tasks.c.due_date >= today.replace(day=1),
+        tasks.c.due_date < today)).group_by(key)
+    if user_ids is not None:
+        months = months.where(due.c.user_id.in_(user_ids))
+        this_month = this_month.where(tasks.c.user_id.in_(user_ids))
+    return [months, this_month]
+
+
+"""
+total_counts(counts)
+
+Adds up a list of TaskCounts.
+"""
+def total_counts(counts):
+    return TaskCounts('total', sum(c.open for c in counts),
+            sum(c.closed for c in counts), sum(c.overdue for c in counts))
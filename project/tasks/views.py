@@ -1,17 +1,38 @@
 
 # imports
+import copy
 import datetime
+from collections import namedtuple
 from functools import wraps
 from flask import flash, redirect, render_template, \
-    request, session, url_for, Blueprint
+    request, session, url_for, Blueprint, current_app
 
-from .forms import AddTaskForm
-from project import db
-from project.models import Task
+from .forms import AddTaskForm, BulkActionForm, TASK_PRIORITIES
+from .bulk import apply_bulk_action, is_task_id
+from .archive import restore_task
+from .pagination import paginate, MergedQuery
+from .search import search_tasks, SEARCH_STATUSES
+from .stats import count_tasks, total_counts, TaskCounts
+from sqlalchemy.orm import joinedload
+from project import app, db, cache
+from project.cache import LocalCache
+from project.models import Task, ArchivedTask, User
+from project.versions import bump_versions, get_version, user_scope, \
+        TASKS_SCOPE
 
 # config
 tasks_blueprint = Blueprint('tasks', __name__)
 
+# rendered task tables, see task_table()
+fragment_cache = LocalCache(app.config['FRAGMENT_CACHE_SIZE'])
+
+# plain, picklable copy of a task as kept in the query cache
+TaskRow = namedtuple('TaskRow', ['task_id', 'name', 'due_date', 'priority',
+    'posted_date', 'status', 'user_id', 'poster_name', 'archived'])
+
+# rows cached before `archived` was added still unpickle
+TaskRow.__new__.__defaults__ = (False,)
+
 # helper functions
 def login_required(test):
     @wraps(test)
@@ -23,38 +44,331 @@ def login_required(test):
             return redirect(url_for('users.login'))
     return wrap
 
+"""
+can_modify(task)
+
+Helper function for checking whether the logged in user may complete
+or delete a task. Users may only modify tasks they created, while
+admins may modify any task.
+
+Args:
+    task: the Task to check, or None if it does not exist
+
+Returns:
+    True if the task exists and the user may modify it
+"""
+def can_modify(task):
+    return (task is not None and
+            (session['user_id'] == task.user_id or
+                session['role'] == 'admin'))
+
 """
 open_tasks()
 
-Helper function for retrieving uncompleted tasks.
+Helper function for retrieving uncompleted tasks. Each task's poster
+is loaded in the same query so templates can show it without a
+SELECT per row.
 """
 def open_tasks():
-    return db.session.query(Task).filter_by(
-            status='1').order_by(Task.due_date.asc())
+    return db.session.query(Task).options(joinedload('poster')).filter_by(
+            status=1).order_by(Task.due_date.asc(), Task.task_id.asc())
 
 """
 closed_tasks()
 
-Helper function for retrieving completed tasks.
+Helper function for retrieving completed tasks, with their posters
+loaded in the same query. Closed tasks moved to the archive are listed
+with the others, so the result is a MergedQuery of both tables to be
+paged with paginate().
 """
 def closed_tasks():
-    return db.session.query(Task).filter_by(
-            status='0').order_by(Task.due_date.asc())
+    return MergedQuery(
+            db.session.query(Task).options(joinedload('poster'))
+                .filter_by(status=0),
+            db.session.query(ArchivedTask).options(joinedload('poster')))
+
+"""
+task_row(task)
+
+Helper function for copying a Task or ArchivedTask, with its poster's
+name, into a TaskRow.
+"""
+def task_row(task):
+    return TaskRow(task.task_id, task.name, task.due_date, task.priority,
+            task.posted_date, task.status, task.user_id,
+            task.poster.name if task.poster is not None else None,
+            isinstance(task, ArchivedTask))
+
+"""
+cached_task_page(query, prefix, cursor, direction, per_page, version)
+
+Helper function for fetching one page of a task list through the
+shared query cache. The page's tasks are stored as TaskRow tuples under
+the current task data version, so every worker can reuse a page until
+the next task write bumps the version.
+
+Raises:
+    ValueError if the cursor is malformed
+"""
+def cached_task_page(query, prefix, cursor, direction, per_page, version):
+    key = 'tasks:{0}:{1}:{2}:{3}'.format(prefix, cursor, direction, per_page)
+    page = cache.get(key, version=version)
+    if page is None:
+        page = paginate(query(), cursor, direction, per_page)
+        page.items = [task_row(task) for task in page.items]
+        cache.set(key, page, version=version)
+    return page
+
+"""
+task_table(query, prefix, template, version)
+
+Helper function for fetching one page of a task list rendered as an
+html table. The cursor, direction and page size are read from the
+request args named after the list (e.g. `open_cursor`, `open_dir`,
+`open_per_page`), so the open and closed lists page independently of
+each other.
+
+Rendered pages are kept in `fragment_cache`, keyed by the viewer (their
+user id, or just 'admin' for admins) and the page, and stored under the
+task data version. Every task write bumps the version, so a cached page
+is only reused while the tasks it shows are unchanged.
+
+Args:
+    query: function returning the task query to paginate
+    prefix: name of the list, either 'open' or 'closed'
+    template: template rendering the table from `tasks`
+    version: current task data version
+
+Returns:
+    a KeysetPage holding the rendered table in `html` and an `args`
+    dict with the request args that reproduce the page
+"""
+def task_table(query, prefix, template, version):
+    config = current_app.config
+    per_page = request.args.get(prefix + '_per_page', type=int)
+    if per_page is None or per_page < 1:
+        per_page = config['{}_TASKS_PER_PAGE'.format(prefix.upper())]
+    per_page = min(per_page, config['MAX_TASKS_PER_PAGE'])
+    cursor = request.args.get(prefix + '_cursor') or None
+    direction = request.args.get(prefix + '_dir', 'next')
+
+    viewer = 'admin' if session['role'] == 'admin' else session['user_id']
+    key = (prefix, viewer, cursor, direction, per_page)
+    page = fragment_cache.get(key, version=version)
+
+    if page is None:
+        # an invalid cursor just sends the user back to the first page
+        try:
+            page = cached_task_page(query, prefix, cursor, direction,
+                    per_page, version)
+        except ValueError:
+            cursor = None
+            page = cached_task_page(query, prefix, None, 'next',
+                    per_page, version)
+        page = copy.copy(page)
+        page.cursor = cursor
+        page.can_modify_any = any(can_modify(task) for task in page)
+        page.html = render_template(template, tasks=page)
+
+        # keep the rendered table only, not the rows
+        page.items = []
+        fragment_cache.set(key, page, version=version)
+
+    # the links depend on the other list, so work on a copy
+    page = copy.copy(page)
+    page.prefix = prefix
+    page.args = {}
+    if page.cursor is not None:
+        page.args[prefix + '_cursor'] = page.cursor
+        page.args[prefix + '_dir'] = direction
+    if prefix + '_per_page' in request.args:
+        page.args[prefix + '_per_page'] = per_page
+    return page
+
+"""
+page_url(page, other, cursor, direction)
+
+Helper function for building the link to a neighbouring page of one
+task list while keeping the other list on its current page.
+"""
+def page_url(page, other, cursor, direction):
+    args = dict(other.args)
+    args.update((k, v) for k, v in page.args.items()
+            if k.endswith('_per_page'))
+    args[page.prefix + '_cursor'] = cursor
+    args[page.prefix + '_dir'] = direction
+    return url_for('tasks.tasks', **args)
+
+"""
+task_lists()
+
+Helper function for fetching the current page of the open and closed
+task lists, with their next/previous links attached and a flag telling
+whether the user may modify any task on the page.
+"""
+def task_lists():
+    version = get_version(TASKS_SCOPE)
+    open_page = task_table(open_tasks, 'open', '_open_tasks.html', version)
+    closed_page = task_table(closed_tasks, 'closed', '_closed_tasks.html',
+            version)
+    for page, other in ((open_page, closed_page), (closed_page, open_page)):
+        page.next_url = page_url(page, other, page.next_cursor, 'next') \
+                if page.has_next else None
+        page.prev_url = page_url(page, other, page.prev_cursor, 'prev') \
+                if page.has_prev else None
+    return open_page, closed_page
+
+"""
+dashboard_counts(user_id=None, today=None)
+
+Helper function for reading the open, closed and overdue task counts
+per priority of one user, or of every user if `user_id` is None,
+through the shared query cache. A user's counts are cached per day
+under the data version of their tasks. The totals over every user
+would be dropped by any user's task write, so they are cached for
+DASHBOARD_CACHE_TIMEOUT seconds instead.
+
+Returns:
+    a list of TaskCounts keyed by priority
+"""
+def dashboard_counts(user_id=None, today=None):
+    today = today or datetime.date.today()
+    key = 'dashboard:{0}:{1}'.format(user_id, today.isoformat())
+    if user_id is None:
+        counts = cache.get(key)
+        if counts is None:
+            counts = count_tasks('priority', None, today)
+            cache.set(key, counts,
+                    timeout=current_app.config['DASHBOARD_CACHE_TIMEOUT'])
+        return counts
+
+    version = get_version(user_scope(user_id))
+    counts = cache.get(key, version=version)
+    if counts is None:
+        counts = count_tasks('priority', [user_id], today)
+        cache.set(key, counts, version=version)
+    return counts
+
+"""
+dashboard_users(page, per_page, today=None)
+
+Helper function for reading the task counts of one page of users,
+ordered by name.
+
+Returns:
+    a list of (User, TaskCounts) pairs, and whether there is a next page
+"""
+def dashboard_users(page, per_page, today=None):
+    users = db.session.query(User).order_by(User.name) \
+        .offset((page - 1) * per_page).limit(per_page + 1).all()
+    has_next = len(users) > per_page
+    users = users[:per_page]
+    counts = dict((c.key, c) for c in
+            count_tasks('user_id', [user.id for user in users], today))
+    return ([(user, counts.get(user.id, TaskCounts(user.id, 0, 0, 0)))
+        for user in users], has_next)
 
 
 # routes
 @tasks_blueprint.route("/tasks/", methods = ['GET', 'POST'])
 @login_required
 def tasks():
+    open_page, closed_page = task_lists()
 
     return render_template(
             'tasks.html',
             form=AddTaskForm(request.form),
-            open_tasks=open_tasks(),
-            closed_tasks=closed_tasks(),
+            bulk_form=BulkActionForm(),
+            open_tasks=open_page,
+            closed_tasks=closed_page,
+            priorities=TASK_PRIORITIES,
             username=session['name']
             )
 
+"""
+search()
+
+Function for finding tasks by name. The search text is given in `q`;
+`status` ('open', 'closed' or 'all'), `priority` and `mine` (only the
+user's own tasks) narrow the results, which are ranked by relevance and
+shown SEARCH_RESULTS_PER_PAGE at a time.
+"""
+@tasks_blueprint.route('/search/')
+@login_required
+def search():
+    config = current_app.config
+    query = request.args.get('q', '').strip()
+    status = request.args.get('status', 'all')
+    if status not in SEARCH_STATUSES:
+        status = 'all'
+    priority = request.args.get('priority', type=int)
+    mine = request.args.get('mine') == '1'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = config['SEARCH_RESULTS_PER_PAGE']
+
+    # fetch one extra result to find out whether there is a next page
+    results = search_tasks(query, SEARCH_STATUSES[status], priority,
+            session['user_id'] if mine else None, limit=per_page + 1,
+            offset=(page - 1) * per_page,
+            max_terms=config['SEARCH_MAX_TERMS'],
+            candidates=config['SEARCH_CANDIDATES'])
+
+    args = dict(q=query, status=status)
+    if priority is not None:
+        args['priority'] = priority
+    if mine:
+        args['mine'] = 1
+    next_url = url_for('tasks.search', page=page + 1, **args) \
+            if len(results) > per_page else None
+    prev_url = url_for('tasks.search', page=page - 1, **args) \
+            if page > 1 else None
+
+    return(render_template('search.html',
+        tasks=[task_row(task) for task in results[:per_page]],
+        query=query,
+        status=status,
+        priority=priority,
+        mine=mine,
+        priorities=TASK_PRIORITIES,
+        next_url=next_url,
+        prev_url=prev_url,
+        username=session['name']))
+
+"""
+dashboard()
+
+Function for showing how many of the user's tasks are open, closed and
+overdue, per priority. Admins see the counts over every user's tasks,
+followed by the counts of each user, DASHBOARD_USERS_PER_PAGE users at
+a time.
+"""
+@tasks_blueprint.route('/dashboard/')
+@login_required
+def dashboard():
+    today = datetime.date.today()
+    is_admin = session['role'] == 'admin'
+    counts = dashboard_counts(None if is_admin else session['user_id'],
+            today)
+
+    users, next_url, prev_url = [], None, None
+    if is_admin:
+        page = max(request.args.get('page', 1, type=int), 1)
+        users, has_next = dashboard_users(page,
+                current_app.config['DASHBOARD_USERS_PER_PAGE'], today)
+        next_url = url_for('tasks.dashboard', page=page + 1) \
+                if has_next else None
+        prev_url = url_for('tasks.dashboard', page=page - 1) \
+                if page > 1 else None
+
+    return(render_template('dashboard.html',
+        counts=counts,
+        totals=total_counts(counts),
+        users=users,
+        today=today,
+        next_url=next_url,
+        prev_url=prev_url,
+        username=session['name']))
+
 """
 new_task()
 
@@ -74,21 +388,25 @@ def new_task():
         if form.validate_on_submit():
             new_task = Task(form.name.data, 
                     form.due_date.data,
-                    form.priority.data,
+                    int(form.priority.data),
                     datetime.datetime.utcnow(),
-                    '1',
+                    1,
                     session['user_id']
             )
             db.session.add(new_task)
+            bump_versions(new_task.user_id)
             db.session.commit()
             flash("New task successfully added to your Docket")
 
     # handler for GET request and invalid form entries
+    open_page, closed_page = task_lists()
     return(render_template('tasks.html', 
         form=form, 
+        bulk_form=BulkActionForm(),
         error=error, 
-        open_tasks=open_tasks(),
-        closed_tasks=closed_tasks()))
+        open_tasks=open_page,
+        closed_tasks=closed_page,
+        priorities=TASK_PRIORITIES))
 
     
 """
@@ -108,13 +426,13 @@ Returns:
 @login_required
 def complete(task_id):
     new_id = task_id
-    task = db.session.query(Task).filter_by(task_id=new_id)
+    task = db.session.query(Task).filter_by(task_id=new_id).first()
 
     # verify that user created the task they are attempting to mark complete
-    if (session['user_id'] == task.first().user_id or 
-            session['role'] == 'admin'):
+    if can_modify(task):
         db.session.query(Task).filter_by(task_id=new_id) \
-            .update({"status": "0"})
+            .update({"status": 0})
+        bump_versions(task.user_id)
         db.session.commit()
         flash("Task successfully marked as complete!")
         return(redirect(url_for('tasks.tasks')))
@@ -141,11 +459,11 @@ Returns:
 @login_required
 def delete_entry(task_id):
     new_id = task_id
-    task = db.session.query(Task).filter_by(task_id=new_id)
-    if (session["user_id"] == task.first().user_id or
-            session['role'] == 'admin'):
+    task = db.session.query(Task).filter_by(task_id=new_id).first()
+    if can_modify(task):
 
         # find task to delete and remove it from table
+        bump_versions(task.user_id)
         db.session.query(Task).filter_by(task_id=task_id) \
             .delete()
         db.session.commit()
@@ -155,4 +473,67 @@ def delete_entry(task_id):
     else:
         flash("You can only delete tasks that you created")
         return(redirect(url_for('tasks.tasks')))
-        
+
+
+"""
+bulk_action()
+
+Function for completing or deleting every task selected with the
+checkboxes on the task page in a single transaction.
+
+Returns:
+    redirects to user's task page
+"""
+@tasks_blueprint.route('/bulk/', methods = ['POST'])
+@login_required
+def bulk_action():
+    form = BulkActionForm(request.form)
+    task_ids = request.form.getlist('task_ids', type=int)
+
+    if not form.validate_on_submit() or not task_ids:
+        flash("Select at least one task first.")
+        return(redirect(url_for('tasks.tasks')))
+
+    if not all(is_task_id(t) for t in task_ids):
+        flash("Some of the selected tasks are not valid task ids.")
+        return(redirect(url_for('tasks.tasks')))
+
+    result = apply_bulk_action(form.action.data, task_ids,
+            session['user_id'], session['role'] == 'admin')
+
+    if result.accepted:
+        if result.action == 'complete':
+            flash("{} task(s) successfully marked as complete!".format(
+                len(result.accepted)))
+        else:
+            flash("{} task(s) successfully removed from your Docket".format(
+                len(result.accepted)))
+    if result.rejected:
+        flash("You can only modify tasks that you created. "
+                "Skipped task(s): {}".format(
+                    ', '.join(str(t) for t in result.rejected)))
+    return(redirect(url_for('tasks.tasks')))
+
+
+"""
+restore(task_id)
+
+Function for moving an archived task back to the user's Docket, as an
+open task.
+
+Args:
+    task_id: the unique ID of the archived task
+
+Returns:
+    redirects to user's task page
+"""
+@tasks_blueprint.route('/restore/<int:task_id>/')
+@login_required
+def restore(task_id):
+    archived = db.session.query(ArchivedTask).get(task_id)
+    if can_modify(archived):
+        restore_task(archived)
+        flash("Task successfully restored to your Docket")
+    else:
+        flash("You can only restore tasks that you created.")
+    return(redirect(url_for('tasks.tasks')))
@@ -0,0 +1,142 @@
+'''
+Shared fixtures for the Docket app test suite.
+
+The schema is created once per process in an in-memory SQLite database
+and every test runs inside a transaction that is rolled back afterwards,
+so tests never see each other's rows and nothing has to be dropped and
+recreated between them. Commits made by the app during a test only end
+a savepoint, which is reopened straight away.
+
+Log files and shared metrics go to a temporary directory of the test
+process, and bcrypt runs at its lowest cost, so the suite is fast and
+several test processes can run side by side.
+'''
+
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from sqlalchemy import event
+
+from project import app, db, bcrypt, cache, metrics, error_log, \
+        access_log, sql_log
+from project.metrics import MetricsStore
+from project.models import User
+from project.tasks.views import fragment_cache
+
+# bcrypt's minimum work factor; tests hash a lot of passwords
+TEST_BCRYPT_ROUNDS = 4
+
+_ready = False
+
+
+"""
+setup_test_app()
+
+Points the app at an in-memory database and per-process scratch files,
+once per process.
+"""
+def setup_test_app():
+    global _ready
+    if _ready:
+        return
+
+    scratch = tempfile.mkdtemp(prefix='docket-tests-')
+    atexit.register(shutil.rmtree, scratch, True)
+
+    app.config['TESTING'] = True
+    app.config['DEBUG'] = False
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    # every checkout shares the single in-memory connection, so returning
+    # one checkout to the pool must not roll back the test's transaction
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_reset_on_return': None}
+    app.config['BCRYPT_LOG_ROUNDS'] = TEST_BCRYPT_ROUNDS
+    bcrypt.init_app(app)
+
+    for log in (error_log, access_log, sql_log):
+        log.path = os.path.join(scratch, os.path.basename(log.path))
+    metrics.store = MetricsStore(os.path.join(scratch, 'metrics'),
+            app.config['METRICS_BUCKETS'],
+            app.config['METRICS_FLUSH_INTERVAL'])
+
+    # let pysqlite leave transactions to SQLAlchemy, which SAVEPOINT needs
+    engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        connection.execute('BEGIN')
+
+    db.create_all()
+    _ready = True
+
+
+class DocketTestCase(unittest.TestCase):
+    '''
+    Base class of the tests that use the app and its database.
+    '''
+
+    def setUp(self):
+        setup_test_app()
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['LOGIN_THROTTLE_ENABLED'] = False
+        self.app = app.test_client()
+        fragment_cache.clear()
+        cache.clear()
+
+        # run the test in a transaction of its own, on the connection
+        # every session of the test is bound to
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.savepoint = self.connection.begin_nested()
+        self.original_session = db.session
+        db.session = db.create_scoped_session(
+                options={'bind': self.connection, 'binds': {}})
+        event.listen(db.session.session_factory, 'after_transaction_end',
+                self.restart_savepoint)
+
+    def restart_savepoint(self, session, transaction):
+        if not self.savepoint.is_active:
+            self.savepoint = self.connection.begin_nested()
+
+    def tearDown(self):
+        event.remove(db.session.session_factory, 'after_transaction_end',
+                self.restart_savepoint)
+        db.session.remove()
+        db.session = self.original_session
+        self.transaction.rollback()
+        self.connection.close()
+
+    #------HELPER METHODS------#
+    def add_user(self, name, role=None):
+        """
+        Adds a user whose email and password are made from `name`.
+        """
+        user = User(name=name, email=name + "@docket.com",
+                password=bcrypt.generate_password_hash(name), role=role)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def login(self, name, password=None):
+        return self.app.post('/', data=dict(name=name,
+            password=name if password is None else password),
+            follow_redirects=True)
+
+    def json(self, response):
+        return json.loads(response.data.decode('utf-8'))
+
+    def invoke(self, command, *args):
+        """
+        Runs a CLI command against the app and returns the click result.
+        """
+        return CliRunner().invoke(command, list(args),
+                obj=ScriptInfo(create_app=lambda info: app))
@@ -0,0 +1,359 @@
+'''
+Unit tests for the JSON api of Docket app. Tests pertain to the `api`
+blueprint.
+'''
+
+import unittest
+import json
+import io
+import csv
+import tempfile
+
+from sqlalchemy import event
+
+from project import app, db, metrics
+from project.models import Task
+from project.commands import import_tasks_command, export_tasks_command
+from project.tests.base import DocketTestCase
+
+'''
+Test suite for the api blueprint.
+'''
+class ApiTests(DocketTestCase):
+
+    #-------------------------------------------------------------------------#
+    '''
+    HELPER METHODS FOR TESTS
+    '''
+    #-------------------------------------------------------------------------#
+    # executed prior to each test
+    def setUp(self):
+        super(ApiTests, self).setUp()
+
+        self.assertEqual(app.debug, False)
+
+    # helper method to perform logout
+    def logout(self):
+        return self.app.get('logout/', follow_redirects=True)
+
+    # helper method to create a task through the api
+    def create_task(self, **fields):
+        data = dict(name="Go to the bank", due_date="2018-01-23",
+                priority=4)
+        data.update(fields)
+        return self.app.post('api/v1/tasks/', data=json.dumps(data),
+                content_type='application/json')
+
+        
+    #-------------------------------------------------------------------------#
+    '''
+    TESTS
+    '''
+    #-------------------------------------------------------------------------#
+    def test_anonymous_users_get_401(self):
+        response = self.app.get('api/v1/tasks/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_users_can_create_and_get_tasks(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        response = self.create_task()
+        self.assertEqual(response.status_code, 201)
+        task = self.json(response)
+        self.assertEqual(task['name'], "Go to the bank")
+        self.assertEqual(task['status'], 'open')
+        self.assertEqual(task['poster'], 'tylertarr')
+
+        response = self.app.get('api/v1/tasks/{}/'.format(task['task_id']))
+        self.assertEqual(self.json(response)['due_date'], '2018-01-23')
+        self.assertEqual(self.app.get('api/v1/tasks/99/').status_code, 404)
+
+    def test_invalid_tasks_are_rejected(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        response = self.create_task(due_date='', priority=11)
+        self.assertEqual(response.status_code, 400)
+        fields = self.json(response)['fields']
+        self.assertIn('due_date', fields)
+        self.assertIn('priority', fields)
+
+        for name in (["Go"], {"a": 1}, 123):
+            response = self.create_task(name=name)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('name', self.json(response)['fields'])
+        self.assertEqual(db.session.query(Task).count(), 0)
+
+    def test_list_filters_and_cursor_pagination(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        for priority in (1, 2, 2):
+            self.create_task(priority=priority)
+
+        body = self.json(self.app.get('api/v1/tasks/?priority=2'))
+        self.assertEqual([t['task_id'] for t in body['tasks']], [2, 3])
+
+        body = self.json(self.app.get('api/v1/tasks/?per_page=2'))
+        self.assertEqual([t['task_id'] for t in body['tasks']], [1, 2])
+        body = self.json(self.app.get('api/v1/tasks/?per_page=2&cursor=' +
+            body['next_cursor']))
+        self.assertEqual([t['task_id'] for t in body['tasks']], [3])
+        self.assertIsNone(body['next_cursor'])
+
+        response = self.app.get(
+                'api/v1/tasks/?cursor=2018-01-01_99999999999999999999999')
+        self.assertEqual(response.status_code, 400)
+        for url in ('api/v1/tasks/?priority=99999999999999999999',
+                'api/v1/tasks/?user_id=-99999999999999999999',
+                'api/v1/tasks/?priority=high',
+                'api/v1/dashboard/?user_id=99999999999999999999'):
+            self.assertEqual(self.app.get(url).status_code, 400, url)
+
+    def test_users_cannot_modify_tasks_they_did_not_create(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        self.logout()
+        self.add_user("tessajo")
+        self.login("tessajo")
+        response = self.app.post('api/v1/tasks/1/complete/')
+        self.assertEqual(response.status_code, 403)
+        response = self.app.delete('api/v1/tasks/1/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_admins_can_complete_and_delete_any_task(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        self.logout()
+        self.add_user("superman", "admin")
+        self.login("superman")
+        response = self.app.post('api/v1/tasks/1/complete/')
+        self.assertEqual(self.json(response)['status'], 'closed')
+        response = self.app.delete('api/v1/tasks/1/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(db.session.query(Task).count(), 0)
+
+    def test_list_supports_conditional_get(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        response = self.app.get('api/v1/tasks/')
+        etag = response.headers['ETag']
+
+        # an unchanged list is answered without querying the tasks table
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.app.get('api/v1/tasks/',
+                    headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([s for s in statements if 'FROM tasks' in s])
+
+        # a write bumps the data version and changes the ETag
+        self.app.post('api/v1/tasks/1/complete/')
+        response = self.app.get('api/v1/tasks/',
+                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_html_writes_change_the_etag(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        etag = self.app.get('api/v1/tasks/?user_id=1').headers['ETag']
+        self.app.post('add/', data=dict(name="Go to the bank",
+            due_date="1/23/2018", priority='4'))
+        response = self.app.get('api/v1/tasks/?user_id=1',
+                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.json(response)['tasks']), 1)
+
+    def test_bulk_actions_report_rejected_ids(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        self.logout()
+        self.add_user("tessajo")
+        self.login("tessajo")
+        self.create_task()
+        response = self.app.post('api/v1/tasks/bulk/',
+                data=json.dumps(dict(action='delete', task_ids=[1, 2, 3])),
+                content_type='application/json')
+        body = self.json(response)
+        self.assertEqual(body['accepted'], [2])
+        self.assertEqual(body['rejected'], [1, 3])
+        self.assertEqual(db.session.query(Task).count(), 1)
+
+        for task_ids in ([True], [0], [2 ** 63], [-1], ["1"]):
+            response = self.app.post('api/v1/tasks/bulk/',
+                    data=json.dumps(dict(action='delete', task_ids=task_ids)),
+                    content_type='application/json')
+            self.assertEqual(response.status_code, 400, task_ids)
+
+    def test_users_can_import_csv_files(self):
+        app.config['IMPORT_BATCH_SIZE'] = 2
+        self.addCleanup(app.config.__setitem__, 'IMPORT_BATCH_SIZE', 1000)
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        csv_file = (b"name,due_date,priority\n"
+                b"Go to the bank,01/23/2018,4\n"
+                b"Buy milk,2018-01-24,1\n"
+                b",2018-01-24,1\n"
+                b"Walk the dog,2018-01-25,11\n"
+                b"Call mom,2018-01-26,10\n")
+        response = self.app.post('api/v1/tasks/import/',
+                data=dict(file=(io.BytesIO(csv_file), 'tasks.csv')))
+        report = self.json(response)
+        self.assertEqual(report['imported'], 3)
+        self.assertEqual(report['rejected'], 2)
+        self.assertEqual([e['line'] for e in report['errors']], [4, 5])
+        self.assertIn('name', report['errors'][0]['errors'])
+        self.assertIn('priority', report['errors'][1]['errors'])
+        self.assertEqual(db.session.query(Task).filter_by(user_id=1).count(), 3)
+
+    def test_users_can_import_jsonl_bodies(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        body = (b'{"name": "Go to the bank", "due_date": "2018-01-23", '
+                b'"priority": 4}\n'
+                b'not json\n'
+                b'\n'
+                b'{"name": "Buy milk", "due_date": "01/24/2018", '
+                b'"priority": "2"}\n')
+        response = self.app.post('api/v1/tasks/import/', data=body,
+                content_type='application/x-ndjson')
+        report = self.json(response)
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(report['errors'][0]['line'], 2)
+
+    def test_imports_reject_bad_rows_without_failing(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        body = (b'{"name": {"a": 1}, "due_date": "2018-01-23", '
+                b'"priority": 4}\n'
+                b'{"name": "Buy milk", "due_date": 20180124, "priority": 2}\n'
+                b'{"name": "Caf\xe9", "due_date": "2018-01-23", '
+                b'"priority": 4}\n'
+                b'{"name": "Go to the bank", "due_date": "2018-01-23", '
+                b'"priority": 4}\n')
+        response = self.app.post('api/v1/tasks/import/', data=body,
+                content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        report = self.json(response)
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual([(e['line'], sorted(e['errors']))
+            for e in report['errors']],
+            [(1, ['name']), (2, ['due_date']), (3, ['row'])])
+
+        csv_file = (b"name,due_date,priority\n"
+                b"\"Two\nlines \xff\",2018-01-24,1\n"
+                b"Call mom,2018-01-26,10\n")
+        response = self.app.post('api/v1/tasks/import/',
+                data=dict(file=(io.BytesIO(csv_file), 'tasks.csv')))
+        report = self.json(response)
+        self.assertEqual(report['imported'], 1)
+        self.assertEqual(report['errors'], [{'line': 3,
+            'errors': {'row': ['Not valid UTF-8 text']}}])
+
+    def test_import_command(self):
+        self.add_user("tylertarr")
+        with tempfile.NamedTemporaryFile(suffix='.jsonl') as f:
+            f.write(b'{"name": "Go to the bank", "due_date": "2018-01-23", '
+                    b'"priority": 4}\n')
+            f.flush()
+            result = self.invoke(import_tasks_command, f.name,
+                    '--user', 'tylertarr')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 1 tasks', result.output)
+        self.assertEqual(db.session.query(Task).count(), 1)
+
+    def test_users_export_their_own_tasks(self):
+        app.config['EXPORT_CHUNK_SIZE'] = 1
+        self.addCleanup(app.config.__setitem__, 'EXPORT_CHUNK_SIZE', 1000)
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        self.create_task(name="Buy milk")
+        self.logout()
+        self.add_user("tessajo")
+        self.login("tessajo")
+        self.create_task(name="Walk the dog")
+        self.logout()
+        self.login("tylertarr")
+
+        response = self.app.get('api/v1/tasks/export/?format=csv')
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.reader(io.StringIO(response.data.decode('utf-8'))))
+        self.assertEqual(rows[0][:3], ['task_id', 'name', 'due_date'])
+        self.assertEqual([r[1] for r in rows[1:]],
+                ["Go to the bank", "Buy milk"])
+        self.assertEqual(rows[1][6], 'tylertarr')
+
+    def test_admins_export_every_task(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        self.logout()
+        self.add_user("superman", "admin")
+        self.login("superman")
+        self.create_task(name="Save the world")
+
+        response = self.app.get('api/v1/tasks/export/?format=jsonl')
+        tasks = [json.loads(line) for line in
+                response.data.decode('utf-8').splitlines()]
+        self.assertEqual([t['poster'] for t in tasks],
+                ['tylertarr', 'superman'])
+        self.assertEqual(tasks[0]['due_date'], '2018-01-23')
+
+    def test_export_command(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.create_task()
+        result = self.invoke(export_tasks_command, '--format', 'jsonl',
+                '--user', 'tylertarr')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(json.loads(result.output)['name'], "Go to the bank")
+
+    def test_only_admins_see_cache_stats(self):
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.assertEqual(self.app.get('api/v1/stats/cache/').status_code, 403)
+        self.logout()
+        self.add_user("superman", "admin")
+        self.login("superman")
+        self.app.get('tasks/')
+        self.app.get('tasks/')
+        stats = self.json(self.app.get('api/v1/stats/cache/'))['fragments']
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_only_admins_see_request_metrics(self):
+        metrics.store.clear()
+        self.add_user("tylertarr")
+        self.login("tylertarr")
+        self.assertEqual(self.app.get('api/v1/metrics/').status_code, 403)
+        self.logout()
+        self.add_user("superman", "admin")
+        self.login("superman")
+        response = self.app.get('api/v1/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'docket_http_requests_total{endpoint="tasks.tasks",'
+                b'method="GET",status="200"} 2', response.data)
+        self.assertIn(b'docket_http_requests_total{endpoint="users.login",'
+                b'method="POST",status="302"} 2', response.data)
+
+    def test_scrapers_can_read_metrics_with_a_token(self):
+        self.addCleanup(app.config.__setitem__, 'METRICS_TOKEN', None)
+        app.config['METRICS_TOKEN'] = 'secret'
+        response = self.app.get('api/v1/metrics/',
+                headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        response = self.app.get('api/v1/metrics/',
+                headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+
+
+if (__name__ == '__main__'): 
+    unittest.main()
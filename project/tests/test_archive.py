@@ -0,0 +1,124 @@
+'''
+Unit tests for the task archive of Docket app.
+'''
+
+import datetime
+import json
+import unittest
+
+from project import app, db
+from project.commands import archive_tasks_command, restore_task_command
+from project.models import Task, ArchivedTask
+from project.tasks.archive import archive_tasks
+from project.tests.base import DocketTestCase
+
+TODAY = datetime.date(2018, 6, 1)
+
+
+class ArchiveTests(DocketTestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        super(ArchiveTests, self).setUp()
+        self.add_user("tylertarr")
+        self.add_user("tessajo")
+        self.create_task("Old closed", datetime.date(2018, 1, 2), 0, 1)
+        self.create_task("Old open", datetime.date(2018, 1, 3), 1, 1)
+        self.create_task("Older closed", datetime.date(2018, 1, 1), 0, 2)
+        self.create_task("Recent closed", datetime.date(2018, 5, 30), 0, 1)
+        self.create_task("Another old closed", datetime.date(2018, 1, 2), 0, 1)
+
+    #------HELPER METHODS------#
+    def create_task(self, name, due_date, status, user_id):
+        db.session.add(Task(name, due_date, 4, datetime.date(2017, 12, 1),
+            status, user_id))
+        db.session.commit()
+
+    def archived_ids(self):
+        return sorted(t.task_id for t in db.session.query(ArchivedTask))
+
+    #------TESTS------#
+    def test_old_closed_tasks_are_archived_in_batches(self):
+        batches = []
+        self.assertEqual(archive_tasks(30, batch_size=2, today=TODAY,
+            progress=batches.append), 3)
+        self.assertEqual(batches, [2, 3])
+        self.assertEqual(self.archived_ids(), [1, 3, 5])
+        self.assertEqual(sorted(t.task_id for t in db.session.query(Task)),
+                [2, 4])
+        self.assertEqual(archive_tasks(30, today=TODAY), 0)
+
+    def test_closed_list_reads_both_tables(self):
+        archive_tasks(30, today=TODAY)
+        self.login("tylertarr")
+        response = self.app.get('tasks/?closed_per_page=2')
+        self.assertIn(b"Older closed", response.data)
+        self.assertIn(b"Old closed", response.data)
+        self.assertIn(b"restore/1/", response.data)
+        self.assertNotIn(b'name="task_ids" value="1"', response.data)
+
+        response = self.app.get('api/v1/tasks/?status=closed&per_page=2')
+        body = self.json(response)
+        self.assertEqual([t['task_id'] for t in body['tasks']], [3, 1])
+        self.assertTrue(body['tasks'][0]['archived'])
+        response = self.app.get('api/v1/tasks/?status=closed&per_page=2'
+                '&cursor=' + body['next_cursor'])
+        body = self.json(response)
+        self.assertEqual([t['task_id'] for t in body['tasks']], [5, 4])
+        self.assertEqual([t['archived'] for t in body['tasks']],
+                [True, False])
+        response = self.app.get('api/v1/tasks/?status=closed&per_page=2'
+                '&dir=prev&cursor=' + body['prev_cursor'])
+        self.assertEqual([t['task_id'] for t in self.json(response)['tasks']],
+                [3, 1])
+
+    def test_exports_include_archived_tasks(self):
+        archive_tasks(30, today=TODAY)
+        self.login("tylertarr")
+        response = self.app.get('api/v1/tasks/export/?format=jsonl')
+        rows = [json.loads(line) for line in
+                response.data.decode('utf-8').splitlines()]
+        self.assertEqual([row['task_id'] for row in rows], [1, 2, 4, 5])
+
+    def test_archived_tasks_can_be_restored(self):
+        archive_tasks(30, today=TODAY)
+        self.login("tessajo")
+        self.app.get('restore/1/')
+        self.assertEqual(self.archived_ids(), [1, 3, 5])
+
+        response = self.app.get('restore/3/', follow_redirects=True)
+        self.assertIn(b"Task successfully restored", response.data)
+        task = db.session.query(Task).get(3)
+        self.assertEqual((task.name, task.status), ("Older closed", 1))
+
+        # new tasks never take the id of an archived one
+        self.create_task("New", TODAY, 1, 1)
+        self.assertEqual(db.session.query(Task).filter_by(
+            name="New").one().task_id, 6)
+
+        self.login("tylertarr")
+        response = self.app.post('api/v1/tasks/5/restore/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.json(response)['status'], 'open')
+        self.assertFalse(self.json(response)['archived'])
+        self.assertEqual(self.app.post(
+            'api/v1/tasks/5/restore/').status_code, 404)
+        self.assertEqual(self.archived_ids(), [1])
+
+    def test_archive_commands(self):
+        self.addCleanup(app.config.__setitem__, 'ARCHIVE_AFTER_DAYS',
+                app.config['ARCHIVE_AFTER_DAYS'])
+        app.config['ARCHIVE_AFTER_DAYS'] = 0
+        result = self.invoke(archive_tasks_command, '--batch-size', '2')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Archived 4 tasks", result.output)
+
+        result = self.invoke(restore_task_command, '4', '--keep-closed')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Restored task 4 (closed)", result.output)
+        self.assertEqual(self.archived_ids(), [1, 3, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
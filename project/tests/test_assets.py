@@ -0,0 +1,90 @@
+'''
+Unit tests for the fingerprinted static files of Docket app.
+'''
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from project import app, assets
+from project.assets import build_assets, brotli
+from project.tests.base import DocketTestCase
+
+
+class AssetsTests(DocketTestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        super(AssetsTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(assets.load)
+        self.addCleanup(app.config.__setitem__, 'ASSETS_DIR',
+                app.config['ASSETS_DIR'])
+        app.config['ASSETS_DIR'] = self.directory
+        self.manifest = build_assets(app.static_folder, self.directory)
+        assets.load()
+
+    #------HELPER METHODS------#
+    def read_static(self, path):
+        with open(os.path.join(app.static_folder, path), 'rb') as f:
+            return f.read()
+
+    #------TESTS------#
+    def test_build_writes_hashed_and_compressed_copies(self):
+        hashed = self.manifest['css/main.css']
+        self.assertRegex(hashed, r'^css/main\.[0-9a-f]{12}\.css$')
+        self.assertTrue(os.path.isfile(os.path.join(self.directory,
+            self.manifest['js/bootstrap.min.js'] + '.gz')))
+        self.assertEqual(build_assets(app.static_folder, self.directory),
+                self.manifest)
+
+    def test_pages_link_to_hashed_files(self):
+        response = self.app.get('/')
+        self.assertIn('/static/build/{}'.format(
+            self.manifest['css/main.css']).encode('utf-8'), response.data)
+
+    def test_hashed_files_are_served_compressed_and_immutable(self):
+        url = '/static/build/' + self.manifest['js/jquery-3.2.1.min.js']
+        response = self.app.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', response.content_type)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data),
+                self.read_static('js/jquery-3.2.1.min.js'))
+        response.close()
+
+        response = self.app.get(url)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data,
+                self.read_static('js/jquery-3.2.1.min.js'))
+        response.close()
+
+    @unittest.skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        url = '/static/build/' + self.manifest['css/bootstrap.min.css']
+        response = self.app.get(url,
+                headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.data),
+                self.read_static('css/bootstrap.min.css'))
+        response.close()
+
+    def test_unhashed_files_are_still_served(self):
+        response = self.app.get('/static/css/main.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response.headers.get('Cache-Control',
+            ''))
+        response.close()
+        self.assertEqual(self.app.get('/static/build/css/nope.css')
+                .status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
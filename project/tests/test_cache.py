@@ -0,0 +1,88 @@
+'''
+Unit tests for the cache backends of Docket app.
+'''
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from project.cache import LocalCache, FileCache, make_cache
+
+'''
+Tests shared by every cache backend.
+'''
+class CacheTestsMixin(object):
+
+    def test_get_returns_stored_values(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        self.cache.set('key', 'value', timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_entries_are_invalidated_by_version(self):
+        self.cache.set('key', 'old', version=1)
+        self.assertEqual(self.cache.get('key', version=1), 'old')
+        self.assertIsNone(self.cache.get('key', version=2))
+        self.cache.set('key', 'new', version=2)
+        self.assertEqual(self.cache.get('key', version=2), 'new')
+
+    def test_delete_and_clear(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('b'))
+
+
+class LocalCacheTests(CacheTestsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocalCache(maxsize=2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+class FileCacheTests(CacheTestsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = FileCache(self.cache_dir, maxsize=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_entries_are_shared_through_the_directory(self):
+        other = FileCache(self.cache_dir)
+        self.cache.set('key', 'value', version=3)
+        self.assertEqual(other.get('key', version=3), 'value')
+
+    def test_directory_is_pruned_to_maxsize(self):
+        self.cache.prune_interval = 1
+        for i in range(5):
+            self.cache.set(i, i)
+        self.assertEqual(self.cache.stats()['size'], 2)
+
+    def test_make_cache_selects_backend(self):
+        cache = make_cache({'CACHE_BACKEND': 'file',
+            'CACHE_DIR': self.cache_dir})
+        self.assertIsInstance(cache, FileCache)
+        self.assertIsInstance(make_cache({}), LocalCache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+Unit tests for the gzip compression of dynamic responses of Docket app.
+'''
+
+import datetime
+import gzip
+import unittest
+
+from project import app, db, bcrypt
+from project.compression import accepts_gzip
+from project.models import User, Task
+from project.tests.base import DocketTestCase
+
+GZIP = {'Accept-Encoding': 'gzip, deflate'}
+
+
+class CompressionTests(DocketTestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        super(CompressionTests, self).setUp()
+        user = User(name="tylertarr", email="tyler@tarr.com",
+                password=bcrypt.generate_password_hash("tylerhuntington"))
+        db.session.add(user)
+        db.session.flush()
+        for i in range(30):
+            db.session.add(Task("Task number {}".format(i),
+                datetime.date(2018, 1, 23), 4, datetime.date(2018, 1, 1), 1,
+                user.id))
+        db.session.commit()
+        self.app.post('/', data=dict(name="tylertarr",
+            password="tylerhuntington"))
+        self.app.get('/tasks/')
+
+    #------TESTS------#
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip({'HTTP_ACCEPT_ENCODING': 'gzip, br'}))
+        self.assertTrue(accepts_gzip({'HTTP_ACCEPT_ENCODING': '*'}))
+        self.assertFalse(accepts_gzip({'HTTP_ACCEPT_ENCODING': 'gzip;q=0'}))
+        self.assertFalse(accepts_gzip({'HTTP_ACCEPT_ENCODING': 'identity'}))
+        self.assertFalse(accepts_gzip({}))
+
+    def test_pages_are_compressed(self):
+        plain = self.app.get('/tasks/')
+        response = self.app.get('/tasks/', headers=GZIP)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(int(response.headers['Content-Length']),
+                len(response.data))
+        self.assertLess(len(response.data), len(plain.data))
+        body = gzip.decompress(response.data)
+        self.assertIn(b"Task number 24", body)
+        self.assertEqual(len(body), len(plain.data))
+
+    def test_responses_are_sent_as_they_are_without_accept_encoding(self):
+        response = self.app.get('/tasks/')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(b"Task number 24", response.data)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.app.get('/api/v1/tasks/99/', headers=GZIP)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_other_content_types_are_not_compressed(self):
+        self.addCleanup(app.config.__setitem__, 'COMPRESS_MIMETYPES',
+                app.config['COMPRESS_MIMETYPES'])
+        app.config['COMPRESS_MIMETYPES'] = ['application/json']
+        response = self.app.get('/tasks/', headers=GZIP)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_compression_can_be_disabled(self):
+        self.addCleanup(app.config.__setitem__, 'COMPRESS_ENABLED', True)
+        app.config['COMPRESS_ENABLED'] = False
+        response = self.app.get('/tasks/', headers=GZIP)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_exports_are_compressed(self):
+        self.addCleanup(app.config.__setitem__, 'EXPORT_CHUNK_SIZE',
+                app.config['EXPORT_CHUNK_SIZE'])
+        app.config['EXPORT_CHUNK_SIZE'] = 7
+        plain = self.app.get('/api/v1/tasks/export/?format=jsonl')
+        response = self.app.get('/api/v1/tasks/export/?format=jsonl',
+                headers=GZIP)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+    def test_conditional_requests_use_the_compressed_etag(self):
+        response = self.app.get('/api/v1/tasks/', headers=GZIP)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        etag = response.headers['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+
+        headers = dict(GZIP, **{'If-None-Match': etag})
+        response = self.app.get('/api/v1/tasks/', headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+        # the uncompressed representation has its own etag
+        response = self.app.get('/api/v1/tasks/',
+                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+'''
+Unit tests for the synthetic data generator of Docket app.
+'''
+
+import unittest
+
+from sqlalchemy import create_engine, inspect
+
+from project import db
+from project.datagen import generate
+
+
+class DataGeneratorTests(unittest.TestCase):
+
+    # helper method to generate data into a fresh in-memory database
+    def generate(self, seed, **kwargs):
+        engine = create_engine('sqlite://')
+        db.metadata.create_all(engine)
+        result = generate(engine, 20, 500, 'hash', seed=seed, **kwargs)
+        self.addCleanup(engine.dispose)
+        return engine, result
+
+    def rows(self, engine):
+        return engine.execute("SELECT * FROM tasks ORDER BY task_id") \
+                .fetchall()
+
+    def test_same_seed_gives_same_data(self):
+        first, result = self.generate(7)
+        second, result = self.generate(7)
+        other, result = self.generate(8)
+        self.assertEqual(self.rows(first), self.rows(second))
+        self.assertNotEqual(self.rows(first), self.rows(other))
+
+    def test_counts_distributions_and_indexes(self):
+        engine, result = self.generate(1, open_ratio=0.5, admins=2)
+        self.assertEqual(result['tasks'], 500)
+        self.assertEqual(engine.execute(
+            "SELECT count(*) FROM users WHERE role = 'admin'").scalar(), 2)
+        open_tasks = engine.execute(
+            "SELECT count(*) FROM tasks WHERE status = 1").scalar()
+        self.assertTrue(200 < open_tasks < 300)
+        self.assertEqual(engine.execute("SELECT min(priority), "
+            "max(priority) FROM tasks").first(), (1, 10))
+        names = set(i['name'] for i in inspect(engine).get_indexes('tasks'))
+        self.assertIn('ix_tasks_status_due_date_task_id', names)
+        self.assertIn('ix_tasks_user_id_status_due_date', names)
+
+    def test_data_is_appended_after_existing_rows(self):
+        engine, result = self.generate(1)
+        generate(engine, 5, 10, 'hash', seed=2)
+        self.assertEqual(engine.execute(
+            "SELECT count(*), max(task_id) FROM tasks").first(), (510, 510))
+        self.assertEqual(engine.execute(
+            "SELECT count(DISTINCT name) FROM users").scalar(), 25)
+        self.assertEqual(engine.execute("SELECT version FROM data_versions "
+            "WHERE scope = 'tasks'").scalar(), 2)
+
+    def test_archived_and_deleted_task_ids_are_not_reused(self):
+        engine, result = self.generate(1)
+        engine.execute("INSERT INTO tasks_archive SELECT *, "
+                "'2018-01-01 00:00:00' FROM tasks WHERE task_id > 480")
+        engine.execute("DELETE FROM tasks WHERE task_id > 480")
+        generate(engine, 1, 10, 'hash', seed=2)
+        self.assertEqual(engine.execute(
+            "SELECT min(task_id) FROM tasks WHERE task_id > 480").scalar(),
+            501)
+
+        engine.execute("DELETE FROM tasks WHERE task_id > 500")
+        engine.execute("DELETE FROM tasks_archive")
+        generate(engine, 1, 10, 'hash', seed=3)
+        self.assertEqual(engine.execute(
+            "SELECT min(task_id) FROM tasks WHERE task_id > 480").scalar(),
+            511)
+        self.assertEqual(engine.execute("SELECT seq FROM sqlite_sequence "
+            "WHERE name = 'tasks'").scalar(), 520)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+'''
+project/tests/test_logwriter.py
+
+Tests for the background log writer.
+
+Tyler Huntington, 2018
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from project.logwriter import AsyncLogWriter, format_record
+
+
+class LogWriterTests(unittest.TestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'test.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    #------HELPER METHODS------#
+    def read_lines(self, path=None):
+        with open(path or self.path) as f:
+            return f.read().splitlines()
+
+    #------TESTS------#
+    def test_format_record_quotes_values(self):
+        line = format_record(0, [('status', 404),
+                ('url', 'http://localhost/a b'), ('note', None)])
+        self.assertEqual(line, '1970-01-01T00:00:00Z status=404 '
+                'url="http://localhost/a b" note=""\n')
+
+    def test_records_are_written_in_order(self):
+        log = AsyncLogWriter(self.path, flush_interval=0.05)
+        for i in range(50):
+            log.write(event='error', n=i)
+        log.flush()
+
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 50)
+        self.assertTrue(lines[0].endswith('event=error n=0'))
+        self.assertTrue(lines[-1].endswith('event=error n=49'))
+        self.assertEqual(log.stats()['written'], 50)
+
+    def test_rotates_by_size_and_keeps_backups(self):
+        log = AsyncLogWriter(self.path, max_bytes=200, backup_count=2,
+                batch_size=1, flush_interval=0.05)
+        for i in range(30):
+            log.write(event='error', n=i)
+        log.flush()
+
+        names = set(os.listdir(self.tmp))
+        self.assertIn('test.log.1', names)
+        self.assertIn('test.log.2', names)
+        self.assertNotIn('test.log.3', names)
+        self.assertLessEqual(os.path.getsize(self.path + '.1'), 300)
+
+    def test_rotates_by_the_age_of_the_first_record(self):
+        # a file started before a restart is as old as its first record
+        with open(self.path, 'w') as f:
+            f.write(format_record(time.time() - 7200, [('n', 0)]))
+        log = AsyncLogWriter(self.path, rotate_seconds=3600,
+                flush_interval=0.05)
+        log.write(n=1)
+        log.flush()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(len(self.read_lines(self.path + '.1')), 2)
+
+        log.write(n=2)
+        log.flush()
+        self.assertEqual(len(self.read_lines()), 1)
+
+    def test_file_is_rotated_once_by_concurrent_writers(self):
+        first = AsyncLogWriter(self.path, max_bytes=0)
+        second = AsyncLogWriter(self.path, max_bytes=0)
+        first._write_batch([(0, [('n', 1)])])
+        second._write_batch([(0, [('n', 2)])])
+        # both find the file full; the second one to get the lock finds
+        # it already rotated
+        second._rotate()
+        first._rotate()
+
+        self.assertEqual(len(self.read_lines(self.path + '.1')), 2)
+        self.assertFalse(os.path.exists(self.path + '.2'))
+        first._write_batch([(0, [('n', 3)])])
+        self.assertEqual(len(self.read_lines()), 1)
+        self.assertEqual((first.written, first.dropped), (2, 0))
+
+    def test_full_queue_drops_records(self):
+        log = AsyncLogWriter(self.path)
+        # stand in for a writer thread that has fallen behind
+        log._pid = os.getpid()
+        log._queue = queue.Queue(1)
+
+        log.write(event='error', n=1)
+        log.write(event='error', n=2)
+        self.assertEqual(log.dropped, 1)
+        self.assertEqual(log.stats()['queued'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
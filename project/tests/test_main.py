@@ -7,35 +7,31 @@ Tyler Huntington, 2018
 '''
 
 import os
+import shutil
+import tempfile
 import unittest
 
-from project import app, db
-from project._config import basedir
-from project.models import User
+from sqlalchemy import create_engine
 
-TEST_DB = 'test.db'
+from project import app, db, error_log
+from project.models import User
+from project.tests.base import DocketTestCase
 
 
-class MainTests(unittest.TestCase):
+class MainTests(DocketTestCase):
 
     #------SETUP AND TEARDOWN------#
 
     # executed prior to each test
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = False
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + \
-                os.path.join(basedir, TEST_DB)
-        self.app = app.test_client()
-        db.create_all()
+        super(MainTests, self).setUp()
 
-        self.assertEquals(app.debug, False)
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+        self.addCleanup(setattr, error_log, 'path', error_log.path)
+        error_log.path = os.path.join(self.log_dir, 'error.log')
 
-    # executed after each test
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        self.assertEquals(app.debug, False)
 
     #------HELPER METHODS------#
     def login(self, name, password):
@@ -49,6 +45,15 @@ class MainTests(unittest.TestCase):
         self.assertEquals(response.status_code, 404)
         self.assertIn(b"Sorry, there\'s nothing here.", response.data)
 
+    def test_404_error_is_logged(self):
+        self.app.get('/this-route-does-not-exist/')
+        error_log.flush()
+        with open(error_log.path) as f:
+            line = f.read()
+        self.assertIn('event=error', line)
+        self.assertIn('status=404', line)
+        self.assertIn('/this-route-does-not-exist/', line)
+
     def test_500_error(self):
         bad_user = User(
                 name='tylertarr',
@@ -66,6 +71,17 @@ class MainTests(unittest.TestCase):
         except(ValueError):
             pass
 
+    def test_only_the_app_engine_gets_the_pragmas(self):
+        cache_size = dict(app.config['SQLITE_PRAGMAS'])['cache_size']
+        self.assertEqual(db.session.execute('PRAGMA cache_size').scalar(),
+                cache_size)
+
+        # other engines in the process keep sqlite's defaults
+        engine = create_engine('sqlite://')
+        self.addCleanup(engine.dispose)
+        self.assertNotEqual(engine.execute('PRAGMA cache_size').scalar(),
+                cache_size)
+
 
     if __name__ == "__main__":
         unittest.main()
@@ -0,0 +1,81 @@
+'''
+Unit tests for the request metrics of Docket app.
+'''
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from project.metrics import RequestStats, MetricsStore, render_prometheus
+
+BUCKETS = (0.1, 1.0)
+
+
+class RequestStatsTests(unittest.TestCase):
+
+    def test_requests_fall_into_fixed_buckets(self):
+        stats = RequestStats(BUCKETS)
+        for seconds in (0.05, 0.1, 0.5, 3):
+            stats.observe('tasks.tasks', 'GET', 200, seconds)
+        [row] = stats.rows()
+        self.assertEqual(row[:4], ['tasks.tasks', 'GET', 200, 4])
+        self.assertEqual(row[5], [2, 1, 1])
+
+    def test_prometheus_text(self):
+        stats = RequestStats(BUCKETS)
+        stats.observe('tasks.tasks', 'GET', 200, 0.05)
+        stats.observe('tasks.tasks', 'GET', 500, 0.5)
+        text = render_prometheus(stats)
+        self.assertIn('docket_http_requests_total{endpoint="tasks.tasks",'
+                'method="GET",status="500"} 1', text)
+        self.assertIn('docket_http_request_errors_total{endpoint='
+                '"tasks.tasks",method="GET"} 1', text)
+        self.assertIn('docket_http_request_duration_seconds_bucket{endpoint='
+                '"tasks.tasks",le="1",method="GET"} 2', text)
+        self.assertIn('docket_http_request_duration_seconds_bucket{endpoint='
+                '"tasks.tasks",le="+Inf",method="GET"} 2', text)
+
+
+class MetricsStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = MetricsStore(self.directory, BUCKETS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # helper method to write the counters of another worker
+    def write_worker(self, pid, count):
+        stats = RequestStats(BUCKETS)
+        for i in range(count):
+            stats.observe('tasks.tasks', 'GET', 200, 0.01)
+        with open(os.path.join(self.directory,
+                'requests_{}.json'.format(pid)), 'w') as f:
+            json.dump(stats.dump(), f)
+
+    def count(self, stats):
+        return sum(row[3] for row in stats.rows())
+
+    def test_counters_of_all_workers_are_added_up(self):
+        self.store.observe('tasks.tasks', 'GET', 200, 0.01)
+        self.write_worker(os.getppid(), 2)
+        self.assertEqual(self.count(self.store.collect()), 3)
+
+    def test_exited_workers_are_archived(self):
+        child = subprocess.Popen([sys.executable, '-c', 'pass'])
+        child.wait()
+        self.write_worker(child.pid, 2)
+
+        self.assertEqual(self.count(self.store.collect()), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                'requests_{}.json'.format(child.pid))))
+        self.assertEqual(self.count(self.store.collect()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,233 @@
+'''
+Unit tests for the schema migrations of Docket app.
+'''
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from project.migrations import Migrator, MIGRATIONS
+
+
+class MigrationTests(unittest.TestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'docket.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    #------HELPER METHODS------#
+
+    # builds a database with the schema from before users had roles
+    def create_old_database(self, users):
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("""CREATE TABLE users (id INTEGER PRIMARY KEY,
+                name VARCHAR NOT NULL UNIQUE, email VARCHAR NOT NULL UNIQUE,
+                password VARCHAR NOT NULL)""")
+            connection.execute("""CREATE TABLE tasks (task_id INTEGER
+                PRIMARY KEY, name VARCHAR NOT NULL, due_date DATE NOT NULL,
+                priority INTEGER NOT NULL, status INTEGER, user_id INTEGER,
+                posted_date DATE)""")
+            connection.executemany("""INSERT INTO users (id, name, email,
+                password) VALUES (?, ?, ?, 'x')""", [(i * 2, 'user{}'.format(i),
+                'user{}@docket.test'.format(i)) for i in range(1, users + 1)])
+
+    def query(self, sql):
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute(sql).fetchall()
+
+    #------TESTS------#
+    def test_old_databases_are_migrated_in_batches(self):
+        self.create_old_database(25)
+        batches = []
+        migrator = Migrator(self.path, batch_size=10,
+                progress=lambda *args: batches.append(args[1:3]))
+        migrator.migrate()
+        self.assertEqual(migrator.version(), MIGRATIONS[-1].version)
+        migrator.close()
+
+        self.assertEqual([copied for table, copied in batches
+            if table == 'users'], [10, 20, 25])
+        self.assertEqual(self.query("""SELECT count(*), min(id), max(id),
+            min(role) FROM users"""), [(25, 2, 50, 'user')])
+        self.assertEqual(self.query("""SELECT count(*) FROM sqlite_master
+            WHERE name LIKE 'ix_tasks_%' AND tbl_name = 'tasks'"""), [(2,)])
+        self.assertEqual(self.query(
+            "SELECT count(*) FROM migration_checkpoints"), [(0,)])
+
+    def test_interrupted_copies_resume(self):
+        self.create_old_database(25)
+
+        def interrupt(migration, table, copied, total, rate):
+            if copied == 20:
+                raise KeyboardInterrupt
+        migrator = Migrator(self.path, batch_size=10, progress=interrupt)
+        self.assertRaises(KeyboardInterrupt, migrator.migrate)
+        migrator.close()
+        self.assertEqual(self.query("SELECT count(*) FROM users_new"),
+                [(20,)])
+
+        migrator = Migrator(self.path, batch_size=10)
+        migrator.migrate()
+        migrator.close()
+        self.assertEqual(self.query("""SELECT count(*), count(DISTINCT id)
+            FROM users"""), [(25, 25)])
+
+    def test_writes_during_a_copy_are_kept(self):
+        self.create_old_database(25)
+        app = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(app.close)
+
+        # the app keeps writing to rows on both sides of the copy
+        def write(migration, table, copied, total, rate):
+            if table != 'users':
+                return
+            if copied == 10:
+                app.execute("UPDATE users SET name = 'renamed' WHERE id = 4")
+                app.execute("UPDATE users SET name = 'later' WHERE id = 30")
+                app.execute('DELETE FROM users WHERE id IN (6, 40)')
+                app.execute("""INSERT INTO users (id, name, email, password)
+                    VALUES (3, 'new', 'new@docket.test', 'x')""")
+            elif copied == 20:
+                app.execute("UPDATE users SET email = 'moved@docket.test' "
+                        "WHERE id = 4")
+        migrator = Migrator(self.path, batch_size=10, progress=write)
+        migrator.migrate(1)
+        migrator.close()
+
+        rows = self.query('SELECT id, name, email, role FROM users')
+        self.assertEqual(len(rows), 24)
+        rows = dict((row[0], row[1:]) for row in rows)
+        self.assertEqual(rows[4], ('renamed', 'moved@docket.test', 'user'))
+        self.assertEqual(rows[30][0], 'later')
+        self.assertEqual(rows[3], ('new', 'new@docket.test', 'user'))
+        self.assertNotIn(6, rows)
+        self.assertNotIn(40, rows)
+        self.assertEqual(self.query("""SELECT count(*) FROM sqlite_master
+            WHERE type = 'trigger' AND name LIKE 'users_migration_%'"""),
+            [(0,)])
+        self.assertEqual(self.query(
+            "SELECT count(*) FROM migration_changes"), [(0,)])
+
+    def test_new_databases_are_created_and_adopted(self):
+        migrator = Migrator(self.path)
+        self.assertEqual(migrator.migrate(), [])
+        self.assertEqual(migrator.version(), MIGRATIONS[-1].version)
+        migrator.close()
+        self.assertIn('role', [row[1] for row in
+            self.query('PRAGMA table_info(users)')])
+
+    def test_migrations_stop_at_the_target(self):
+        self.create_old_database(3)
+        migrator = Migrator(self.path)
+        migrator.migrate(target=1)
+        self.assertEqual(migrator.version(), 1)
+        self.assertEqual([m.version for m in migrator.pending()], [2, 3, 4, 5, 6])
+        migrator.close()
+
+    def test_existing_tasks_are_indexed_for_search(self):
+        self.create_old_database(1)
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany("""INSERT INTO tasks (name, due_date,
+                priority, status, user_id) VALUES (?, '2018-01-23', 4, 1, 2)""",
+                [('Go to the bank',), ('Buy groceries',)])
+        migrator = Migrator(self.path)
+        migrator.migrate()
+        migrator.close()
+        self.assertEqual(self.query("""SELECT rowid FROM tasks_fts
+            WHERE tasks_fts MATCH 'groc*'"""), [(2,)])
+
+        # new tasks are indexed by the triggers
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("""INSERT INTO tasks (name, due_date,
+                priority, status, user_id) VALUES ('Bank holiday',
+                '2018-01-23', 4, 1, 2)""")
+        self.assertEqual(self.query("""SELECT rowid FROM tasks_fts
+            WHERE tasks_fts MATCH 'bank' ORDER BY rowid"""), [(1,), (3,)])
+
+    def test_tasks_are_rebuilt_with_an_archive(self):
+        self.create_old_database(1)
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany("""INSERT INTO tasks (name, due_date,
+                priority, status, user_id) VALUES (?, '2018-01-23', 4, 0, 2)""",
+                [('Go to the bank',), ('Buy groceries',)])
+        migrator = Migrator(self.path, batch_size=1)
+        migrator.migrate()
+        migrator.close()
+        self.assertEqual(self.query("""SELECT count(*) FROM sqlite_master
+            WHERE name LIKE 'ix_tasks_archive_%'"""), [(2,)])
+        self.assertEqual(self.query("""SELECT count(*) FROM sqlite_master
+            WHERE type = 'trigger' AND name LIKE 'tasks_fts_%'"""), [(3,)])
+
+        # the ids of deleted (or archived) tasks are not handed out again
+        with sqlite3.connect(self.path) as connection:
+            connection.execute('DELETE FROM tasks WHERE task_id = 2')
+            connection.execute("""INSERT INTO tasks (name, due_date,
+                priority, status, user_id) VALUES ('Bank holiday',
+                '2018-01-23', 4, 1, 2)""")
+        self.assertEqual(self.query("""SELECT task_id FROM tasks
+            ORDER BY task_id"""), [(1,), (3,)])
+        self.assertEqual(self.query("""SELECT rowid FROM tasks_fts
+            WHERE tasks_fts MATCH 'bank' ORDER BY rowid"""), [(1,), (3,)])
+
+    def test_task_writes_during_the_archive_migration_are_kept(self):
+        self.create_old_database(1)
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany("""INSERT INTO tasks (name, due_date,
+                priority, status, user_id) VALUES (?, '2018-01-23', 4, 1, 2)""",
+                [('Go to the bank',), ('Buy groceries',), ('Call mom',)])
+        app = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(app.close)
+
+        def write(migration, table, copied, total, rate):
+            if table == 'tasks' and copied == 2:
+                app.execute('UPDATE tasks SET status = 0 WHERE task_id = 1')
+                app.execute('DELETE FROM tasks WHERE task_id = 2')
+                app.execute("""UPDATE tasks SET name = 'Call the bank'
+                    WHERE task_id = 3""")
+                app.execute("""INSERT INTO tasks (name, due_date, priority,
+                    status, user_id) VALUES ('Pay rent', '2018-01-24', 4, 1,
+                    2)""")
+        migrator = Migrator(self.path, batch_size=1, progress=write)
+        migrator.migrate()
+        migrator.close()
+
+        self.assertEqual(self.query("""SELECT task_id, name, status
+            FROM tasks ORDER BY task_id"""), [(1, 'Go to the bank', 0),
+                (3, 'Call the bank', 1), (4, 'Pay rent', 1)])
+        self.assertEqual(self.query("""SELECT rowid FROM tasks_fts
+            WHERE tasks_fts MATCH 'bank' ORDER BY rowid"""), [(1,), (3,)])
+        self.assertEqual(self.query("""SELECT user_id, status, count
+            FROM task_stats ORDER BY status"""), [(2, 0, 1), (2, 1, 2)])
+
+    def test_task_counters_are_built_from_existing_tasks(self):
+        self.create_old_database(2)
+        with sqlite3.connect(self.path) as connection:
+            connection.executemany("""INSERT INTO tasks (name, due_date,
+                priority, status, user_id) VALUES ('Task', ?, 4, ?, ?)""",
+                [('2018-01-23', 1, 2), ('2018-01-23', 1, 2),
+                    ('2018-01-24', 0, 2), ('2018-01-24', 1, 4)])
+        migrator = Migrator(self.path)
+        migrator.migrate()
+        migrator.close()
+        self.assertEqual(self.query("""SELECT user_id, priority, status,
+            count FROM task_stats ORDER BY 1, 3"""),
+            [(2, 4, 0, 1), (2, 4, 1, 2), (4, 4, 1, 1)])
+        self.assertEqual(self.query("""SELECT user_id, due_month, count
+            FROM task_due_stats ORDER BY 1"""),
+            [(2, '2018-01', 2), (4, '2018-01', 1)])
+        self.assertEqual(self.query("""SELECT status, count FROM task_totals
+            ORDER BY 1"""), [(0, 1), (1, 3)])
+        self.assertEqual(self.query("""SELECT due_date, count
+            FROM task_due_totals ORDER BY 1"""),
+            [('2018-01-23', 2), ('2018-01-24', 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+'''
+Unit tests for the task search of Docket app.
+'''
+
+import datetime
+import unittest
+
+from project import app, db
+from project.commands import rebuild_search_command
+from project.models import Task
+from project.tasks.search import parse_query, search_tasks, words
+from project.tests.base import DocketTestCase
+
+
+class SearchTests(DocketTestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        super(SearchTests, self).setUp()
+        self.add_user("tylertarr")
+        self.add_user("tessajo")
+        self.create_task("Go to the bank", 1, 4, 1)
+        self.create_task("Buy groceries", 1, 2, 1)
+        self.create_task("Bank statement for the bank", 0, 4, 2)
+        self.create_task("Call the plumber", 1, 4, 2)
+
+    #------HELPER METHODS------#
+    def create_task(self, name, status, priority, user_id):
+        db.session.add(Task(name, datetime.date(2018, 1, 23), priority,
+            datetime.date(2018, 1, 1), status, user_id))
+        db.session.commit()
+
+    def names(self, tasks):
+        return [task.name for task in tasks]
+
+    #------TESTS------#
+    def test_parse_query(self):
+        self.assertEqual(parse_query("Bank stat"),
+                'name : ("bank"* "stat"*)')
+        self.assertEqual(parse_query('a "b" OR c*'),
+                'name : ("a" "b" "or"* "c")')
+        self.assertEqual(parse_query("one two three", max_terms=2),
+                'name : ("one"* "two"*)')
+        self.assertEqual(parse_query("statements", status=1, user_id=12),
+                'name : ("statem"*) AND filters : (u12 s1)')
+        self.assertIsNone(parse_query(" -*- "))
+        self.assertEqual(words(u"Caf\u00e9 au_lait"), ['cafe', 'au', 'lait'])
+
+    def test_results_are_ranked_and_match_prefixes(self):
+        self.assertEqual(self.names(search_tasks("bank")),
+                ["Bank statement for the bank", "Go to the bank"])
+        self.assertEqual(self.names(search_tasks("groc")), ["Buy groceries"])
+        self.assertEqual(self.names(search_tasks("the ban")),
+                ["Bank statement for the bank", "Go to the bank"])
+        self.assertEqual(search_tasks("dentist"), [])
+        self.assertEqual(search_tasks(""), [])
+
+        # words longer than the indexed prefixes are checked in full
+        self.create_task("Statistics homework", 1, 4, 1)
+        self.assertEqual(self.names(search_tasks("statem")),
+                ["Bank statement for the bank"])
+        self.assertEqual(self.names(search_tasks("statistic")),
+                ["Statistics homework"])
+
+    def test_results_can_be_filtered(self):
+        self.assertEqual(self.names(search_tasks("bank", status=1)),
+                ["Go to the bank"])
+        self.assertEqual(sorted(self.names(search_tasks("the", priority=4,
+            user_id=2))), ["Bank statement for the bank", "Call the plumber"])
+        ranked = self.names(search_tasks("the"))
+        self.assertEqual(len(ranked), 3)
+        self.assertEqual(self.names(search_tasks("the", limit=1, offset=2)),
+                ranked[2:])
+
+    def test_results_past_the_candidates_are_paged_to(self):
+        # "the" matches tasks 1, 3 and 4; the newest two are ranked first
+        self.assertEqual(self.names(search_tasks("the", candidates=2)),
+                ["Call the plumber", "Bank statement for the bank",
+                    "Go to the bank"])
+        self.assertEqual(self.names(search_tasks("the", limit=2, offset=1,
+            candidates=2)), ["Bank statement for the bank", "Go to the bank"])
+        self.assertEqual(self.names(search_tasks("the", offset=2,
+            candidates=2)), ["Go to the bank"])
+        self.assertEqual(search_tasks("the", offset=3, candidates=2), [])
+        self.assertEqual(self.names(search_tasks("the", candidates=1)),
+                ["Call the plumber", "Bank statement for the bank",
+                    "Go to the bank"])
+
+    def test_index_follows_task_writes(self):
+        self.login("tylertarr")
+        self.app.get('complete/1/')
+        self.assertEqual(search_tasks("bank", status=1), [])
+
+        task = db.session.query(Task).get(2)
+        task.name = "Buy flowers"
+        db.session.commit()
+        self.assertEqual(search_tasks("groceries"), [])
+        self.assertEqual(self.names(search_tasks("flow")), ["Buy flowers"])
+
+        self.app.get('delete/2/')
+        self.assertEqual(search_tasks("flowers"), [])
+
+    def test_search_page(self):
+        self.login("tylertarr")
+        response = self.app.get('tasks/')
+        self.assertIn(b'action="/search/"', response.data)
+
+        response = self.app.get('search/?q=bank&status=open')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Go to the bank", response.data)
+        self.assertNotIn(b"Bank statement", response.data)
+
+        response = self.app.get('search/?q=the&mine=1')
+        self.assertIn(b"Go to the bank", response.data)
+        self.assertNotIn(b"Call the plumber", response.data)
+
+    def test_search_page_is_paged(self):
+        self.addCleanup(app.config.__setitem__, 'SEARCH_RESULTS_PER_PAGE',
+                app.config['SEARCH_RESULTS_PER_PAGE'])
+        app.config['SEARCH_RESULTS_PER_PAGE'] = 1
+        self.login("tylertarr")
+        response = self.app.get('search/?q=bank')
+        self.assertIn(b"Bank statement", response.data)
+        self.assertIn(b"page=2", response.data)
+        response = self.app.get('search/?q=bank&page=2')
+        self.assertIn(b"Go to the bank", response.data)
+        self.assertNotIn(b"page=3", response.data)
+
+    def test_api_search(self):
+        self.login("tessajo")
+        response = self.app.get('api/v1/tasks/search/?q=bank&per_page=1')
+        self.assertEqual(response.status_code, 200)
+        body = self.json(response)
+        self.assertEqual([t['name'] for t in body['tasks']],
+                ["Bank statement for the bank"])
+        self.assertEqual(body['next_page'], 2)
+
+        response = self.app.get('api/v1/tasks/search/?q=ban&status=open'
+                '&user_id=1')
+        body = self.json(response)
+        self.assertEqual([t['name'] for t in body['tasks']],
+                ["Go to the bank"])
+        self.assertIsNone(body['next_page'])
+
+        etag = response.headers['ETag']
+        response = self.app.get('api/v1/tasks/search/?q=ban&status=open'
+                '&user_id=1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.app.get('api/v1/tasks/search/?q=+').status_code,
+                400)
+        self.assertEqual(self.app.get(
+            'api/v1/tasks/search/?q=bank&status=done').status_code, 400)
+
+    def test_rebuild_search_command(self):
+        db.session.execute(
+                "INSERT INTO tasks_fts (tasks_fts) VALUES ('delete-all')")
+        db.session.commit()
+        self.assertEqual(search_tasks("bank"), [])
+
+        result = self.invoke(rebuild_search_command)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Indexed 4 tasks", result.output)
+        self.assertEqual(len(search_tasks("bank")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
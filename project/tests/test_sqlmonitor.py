@@ -0,0 +1,91 @@
+'''
+Unit tests for the SQL instrumentation of Docket app.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Response, g
+from sqlalchemy.exc import OperationalError
+
+from project import app, db, bcrypt, sql_log, sql_monitor
+from project.models import User, Task
+from project.sqlmonitor import statement_shape
+from project.tests.base import DocketTestCase
+
+
+class QueryMonitorTests(DocketTestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    # executed prior to each test
+    def setUp(self):
+        super(QueryMonitorTests, self).setUp()
+
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+        self.addCleanup(setattr, sql_log, 'path', sql_log.path)
+        sql_log.path = os.path.join(self.log_dir, 'sql.log')
+
+    #------HELPER METHODS------#
+    def login_new_user(self):
+        db.session.add(User(name='tylertarr', email='tyler@tarr.com',
+                password=bcrypt.generate_password_hash('tylerhuntington')))
+        db.session.commit()
+        self.app.post('/', data=dict(name='tylertarr',
+                password='tylerhuntington'))
+
+    #------TESTS------#
+    def test_statement_shapes_ignore_in_list_lengths(self):
+        self.assertEqual(
+                statement_shape("SELECT * FROM tasks WHERE task_id IN (?, ?)"),
+                statement_shape("SELECT *  FROM tasks\nWHERE task_id IN (?)"))
+
+    def test_responses_report_query_count_and_time(self):
+        self.login_new_user()
+        response = self.app.get('tasks/')
+        self.assertGreater(int(response.headers['X-DB-Query-Count']), 0)
+        self.assertGreaterEqual(float(response.headers['X-DB-Query-Time']), 0)
+
+    def test_repeated_statements_are_reported(self):
+        self.addCleanup(app.config.__setitem__, 'SQL_NPLUSONE_THRESHOLD',
+                app.config['SQL_NPLUSONE_THRESHOLD'])
+        app.config['SQL_NPLUSONE_THRESHOLD'] = 2
+        with app.test_request_context('/tasks/'):
+            sql_monitor._start()
+            for task_id in range(3):
+                db.session.query(Task).get(task_id + 1)
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                sql_monitor._finish(Response())
+        self.assertIn('same statement 3 times', logs.output[0])
+
+    def test_slow_queries_are_logged_with_their_plan(self):
+        self.addCleanup(app.config.__setitem__, 'SQL_SLOW_QUERY_MS',
+                app.config['SQL_SLOW_QUERY_MS'])
+        app.config['SQL_SLOW_QUERY_MS'] = 0.0001
+        self.login_new_user()
+        self.app.get('tasks/')
+        app.config['SQL_SLOW_QUERY_MS'] = 0
+        sql_log.flush()
+        with open(sql_log.path) as f:
+            log = f.read()
+        self.assertIn('event=slow_query', log)
+        self.assertIn('FROM tasks', log)
+        self.assertIn('USING INDEX', log)
+
+    def test_failed_statements_leave_no_timers_behind(self):
+        connection = db.session.connection()
+        with app.test_request_context('/tasks/'):
+            sql_monitor._start()
+            for attempt in range(3):
+                self.assertRaises(OperationalError, connection.execute,
+                        'SELECT * FROM no_such_table')
+            connection.execute('SELECT 1')
+            self.assertEqual(g.sql_queries.count, 1)
+        self.assertFalse(connection.info.get('query_started'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+'''
+Unit tests for the task counters and dashboard of Docket app.
+'''
+
+import datetime
+import unittest
+
+from project import app, db, cache
+from project.commands import reconcile_stats_command
+from project.models import Task
+from project.tasks.archive import archive_tasks
+from project.tasks.stats import count_tasks, find_stats_drift, TaskCounts
+from project.tests.base import DocketTestCase
+
+YESTERDAY = datetime.date.today() - datetime.timedelta(days=1)
+TOMORROW = datetime.date.today() + datetime.timedelta(days=1)
+
+
+class StatsTests(DocketTestCase):
+
+    #------SETUP AND TEARDOWN------#
+
+    def setUp(self):
+        super(StatsTests, self).setUp()
+        self.add_user("tylertarr")
+        self.add_user("tessajo")
+        self.add_user("boss", "admin")
+        self.create_task("Pay rent", YESTERDAY, 4, 1, 1)
+        self.create_task("Call mom", TOMORROW, 4, 1, 1)
+        self.create_task("Buy milk", YESTERDAY, 2, 0, 1)
+        self.create_task("Fix car", YESTERDAY, 2, 1, 2)
+
+    #------HELPER METHODS------#
+    def create_task(self, name, due_date, priority, status, user_id):
+        db.session.add(Task(name, due_date, priority,
+            datetime.date(2018, 1, 1), status, user_id))
+        db.session.commit()
+
+    #------TESTS------#
+    def test_counters_follow_task_writes(self):
+        self.assertEqual(count_tasks(user_ids=[1]),
+                [TaskCounts(2, 0, 1, 0), TaskCounts(4, 2, 0, 1)])
+
+        self.login("tylertarr")
+        self.app.post('add/', data=dict(name="Water plants",
+            due_date="01/02/2018", priority="4"))
+        self.app.get('complete/2/')
+        self.app.get('delete/3/')
+        self.assertEqual(count_tasks(user_ids=[1]),
+                [TaskCounts(4, 2, 1, 2)])
+        self.assertEqual(count_tasks('user_id'),
+                [TaskCounts(1, 2, 1, 2), TaskCounts(2, 1, 0, 1)])
+
+        # archived tasks still count as closed
+        archive_tasks(0)
+        self.assertEqual(count_tasks(user_ids=[1]),
+                [TaskCounts(4, 2, 1, 2)])
+        self.assertEqual(find_stats_drift(db.session.connection()), [])
+
+    def test_overdue_counts_span_months(self):
+        for due_date in (datetime.date(2018, 1, 31),
+                datetime.date(2018, 2, 3), datetime.date(2018, 2, 10)):
+            self.create_task("Old", due_date, 3, 1, 2)
+        today = datetime.date(2018, 2, 10)
+        self.assertEqual(count_tasks(user_ids=[2], today=today),
+                [TaskCounts(2, 1, 0, 0), TaskCounts(3, 3, 0, 2)])
+        self.assertEqual(count_tasks(today=today)[1:],
+                [TaskCounts(3, 3, 0, 2), TaskCounts(4, 2, 0, 0)])
+        self.assertEqual(count_tasks('user_id', today=today),
+                [TaskCounts(1, 2, 1, 0), TaskCounts(2, 4, 0, 2)])
+
+    def test_dashboard_page(self):
+        self.login("tylertarr")
+        response = self.app.get('dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"My tasks", response.data)
+        self.assertNotIn(b"Tasks per user", response.data)
+
+        self.login("boss")
+        response = self.app.get('dashboard/')
+        self.assertIn(b"All tasks", response.data)
+        self.assertIn(b"tessajo", response.data)
+
+    def test_dashboard_users_are_paged(self):
+        self.addCleanup(app.config.__setitem__, 'DASHBOARD_USERS_PER_PAGE',
+                app.config['DASHBOARD_USERS_PER_PAGE'])
+        app.config['DASHBOARD_USERS_PER_PAGE'] = 2
+        self.login("boss")
+        response = self.app.get('api/v1/dashboard/')
+        body = self.json(response)
+        self.assertEqual(body['totals'],
+                {'open': 3, 'closed': 1, 'overdue': 2})
+        self.assertEqual([(u['name'], u['open']) for u in body['users']],
+                [("boss", 0), ("tessajo", 1)])
+        self.assertEqual(body['next_page'], 2)
+        body = self.json(self.app.get('api/v1/dashboard/?page=2'))
+        self.assertEqual([u['name'] for u in body['users']], ["tylertarr"])
+        self.assertIsNone(body['next_page'])
+
+    def test_api_dashboard(self):
+        self.login("tylertarr")
+        body = self.json(self.app.get('api/v1/dashboard/'))
+        self.assertEqual(body['user_id'], 1)
+        self.assertEqual(body['priorities'], [
+            {'priority': 2, 'open': 0, 'closed': 1, 'overdue': 0},
+            {'priority': 4, 'open': 2, 'closed': 0, 'overdue': 1}])
+        self.assertNotIn('users', body)
+        self.assertEqual(self.app.get(
+            'api/v1/dashboard/?user_id=2').status_code, 403)
+
+        # the cached counts are dropped when the tasks change
+        self.app.get('complete/1/')
+        body = self.json(self.app.get('api/v1/dashboard/'))
+        self.assertEqual(body['totals'],
+                {'open': 1, 'closed': 2, 'overdue': 0})
+
+        self.login("boss")
+        body = self.json(self.app.get('api/v1/dashboard/?user_id=2'))
+        self.assertEqual(body['totals'],
+                {'open': 1, 'closed': 0, 'overdue': 1})
+
+    def test_totals_are_cached_for_a_while(self):
+        self.login("boss")
+        totals = self.json(self.app.get('api/v1/dashboard/'))['totals']
+        self.assertEqual(totals['open'], 3)
+
+        # any user's write would drop them, so the totals expire instead
+        self.create_task("Water plants", TOMORROW, 4, 1, 2)
+        self.assertEqual(self.json(self.app.get('api/v1/dashboard/'))
+                ['totals'], totals)
+        cache.clear()
+        self.assertEqual(self.json(self.app.get('api/v1/dashboard/'))
+                ['totals']['open'], 4)
+
+    def test_reconcile_command(self):
+        result = self.invoke(reconcile_stats_command, '--check')
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("0 counters drifted", result.output)
+
+        db.session.execute("UPDATE task_stats SET count = 7 "
+                "WHERE user_id = 2")
+        db.session.execute("DELETE FROM task_due_totals WHERE priority = 4")
+        db.session.commit()
+        result = self.invoke(reconcile_stats_command, '--check')
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("task_stats 2, 2, 1: expected 1, found 7",
+                result.output)
+        self.assertIn("3 counters drifted", result.output)
+
+        result = self.invoke(reconcile_stats_command)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Rebuilt the task counters", result.output)
+        self.assertEqual(find_stats_drift(db.session.connection()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
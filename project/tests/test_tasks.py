@@ -4,18 +4,22 @@ the `tasks` blueprint.
 '''
 
 import unittest
-import os
+import re
+import html
+import datetime
 
-from project import app, db, bcrypt
-from project._config import basedir
-from project.models import User, Task
+from sqlalchemy import event, tuple_
 
-TEST_DB = 'test.db'
+from project import app, db, bcrypt, cache
+from project.models import User, Task
+from project.tasks.views import open_tasks, closed_tasks, fragment_cache
+from project.tests.base import DocketTestCase
+from project.versions import bump_versions
 
 '''
 Test suite for setup and takedown.
 '''
-class TasksTests(unittest.TestCase):
+class TasksTests(DocketTestCase):
 
     #-------------------------------------------------------------------------#
     '''
@@ -24,21 +28,10 @@ class TasksTests(unittest.TestCase):
     #-------------------------------------------------------------------------#
     # executed prior to each test
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = False
-        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///" + os.path.join(
-                basedir, TEST_DB)
-        self.app = app.test_client()
-        db.create_all()
+        super(TasksTests, self).setUp()
 
         self.assertEquals(app.debug, False)
 
-    # executed after each test
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-
     # helper method to attempt login
     def login(self, name, password):
         return self.app.post('/', data=dict(name=name, password=password), 
@@ -212,6 +205,232 @@ class TasksTests(unittest.TestCase):
         self.assertIn(b'delete/1/', response.data)
         self.assertIn(b'complete/2/', response.data)
         self.assertIn(b'delete/2/', response.data)
+
+    # helper method to pull a pager link out of the tasks page
+    def pager_link(self, response, label):
+        match = re.search(r'<a href="([^"]+)">' + label, 
+                response.data.decode('utf-8'))
+        self.assertIsNotNone(match)
+        return html.unescape(match.group(1))
+
+    def test_open_tasks_are_paginated_by_cursor(self):
+        app.config['OPEN_TASKS_PER_PAGE'] = 2
+        self.addCleanup(app.config.__setitem__, 'OPEN_TASKS_PER_PAGE', 25)
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        for i in range(3):
+            self.create_task()
+
+        response = self.app.get('tasks/')
+        self.assertIn(b'complete/1/', response.data)
+        self.assertIn(b'complete/2/', response.data)
+        self.assertNotIn(b'complete/3/', response.data)
+        self.assertNotIn(b'Previous', response.data)
+
+        response = self.app.get(self.pager_link(response, 'Next'))
+        self.assertNotIn(b'complete/1/', response.data)
+        self.assertIn(b'complete/3/', response.data)
+        self.assertNotIn(b'Next', response.data)
+
+        response = self.app.get(self.pager_link(response, '&larr; Previous'))
+        self.assertIn(b'complete/1/', response.data)
+        self.assertIn(b'complete/2/', response.data)
+        self.assertNotIn(b'complete/3/', response.data)
+
+    def test_open_and_closed_tasks_page_independently(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        for i in range(3):
+            self.create_task()
+        self.app.get('complete/1/')
+        self.app.get('complete/2/')
+
+        response = self.app.get('tasks/?open_per_page=1&closed_per_page=1')
+        self.assertIn(b'delete/1/', response.data)
+        self.assertNotIn(b'delete/2/', response.data)
+        self.assertIn(b'delete/3/', response.data)
+
+        response = self.app.get(self.pager_link(response, 'Next'))
+        self.assertNotIn(b'delete/1/', response.data)
+        self.assertIn(b'delete/2/', response.data)
+        self.assertIn(b'delete/3/', response.data)
+
+    # helper method to add tasks posted by users other than the viewer
+    def create_tasks_by_other_users(self, first, last):
+        for i in range(first, last):
+            user = User(name="user{}".format(i), 
+                    email="user{}@docket.com".format(i), password="x")
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Task("Task {}".format(i), datetime.date(2018, 1, 23),
+                4, datetime.date(2018, 1, 1), 1, user.id))
+            # like the views, so the cached task lists are not served
+            bump_versions(user.id)
+        db.session.commit()
+        db.session.remove()
+
+    # helper method to count the SQL statements run by a GET request;
+    # returns the count and the response
+    def count_queries(self, url):
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.app.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200)
+        return len(statements), response
+
+    def test_task_list_query_count_does_not_grow_with_tasks(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+
+        self.create_tasks_by_other_users(0, 2)
+        few, response = self.count_queries('tasks/')
+        self.assertIn(b"Task 1", response.data)
+        self.create_tasks_by_other_users(2, 12)
+        many, response = self.count_queries('tasks/')
+        self.assertIn(b"Task 11", response.data)
+        self.assertIn(b"user11", response.data)
+
+        self.assertEqual(few, many)
+
+    # helper method to get the sqlite query plan of an ORM query
+    def query_plan(self, query):
+        compiled = query.statement.compile(db.engine)
+        params = [compiled.params[name] for name in compiled.positiontup]
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+        finally:
+            connection.close()
+
+    def test_task_list_queries_use_status_index(self):
+        live, archived = closed_tasks().queries
+        for query, index in ((open_tasks(), 'ix_tasks_status_due_date_task_id'),
+                (live, 'ix_tasks_status_due_date_task_id'),
+                (archived, 'ix_tasks_archive_due_date_task_id')):
+            entity = query.column_descriptions[0]['entity']
+            page_query = query.filter(tuple_(entity.due_date, entity.task_id)
+                    > (datetime.date(2018, 1, 23), 1)).order_by(
+                        entity.due_date, entity.task_id).limit(26)
+            plan = self.query_plan(page_query)
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_user_task_queries_use_user_index(self):
+        query = db.session.query(Task).filter_by(user_id=1, status=1) \
+                .order_by(Task.due_date.asc())
+        plan = self.query_plan(query)
+        self.assertIn('ix_tasks_user_id_status_due_date', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_task_status_is_stored_as_integer(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        self.create_task()
+        self.app.get('complete/1/')
+        types = db.session.execute(
+                "SELECT DISTINCT typeof(status) FROM tasks").fetchall()
+        self.assertEqual([t[0] for t in types], ['integer'])
+
+    def test_users_can_bulk_complete_their_own_tasks(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        self.create_task()
+        self.logout()
+        self.create_user("tessajo", "tessa@jo.com", "tessasternberg")
+        self.login("tessajo", "tessasternberg")
+        self.create_task()
+
+        response = self.app.post('bulk/', data=dict(action='complete',
+            task_ids=['1', '3', '7']), follow_redirects=True)
+        self.assertIn(b'1 task(s) successfully marked as complete',
+                response.data)
+        self.assertIn(b'Skipped task(s): 1, 7', response.data)
+        statuses = dict(db.session.query(Task.task_id, Task.status).all())
+        self.assertEqual(statuses, {1: 1, 2: 1, 3: 0})
+
+    def test_admin_users_can_bulk_delete_all_tasks(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        self.create_task()
+        self.logout()
+        self.create_admin('superman', 'super@man.com', 'allpowerful')
+        self.login('superman', 'allpowerful')
+        response = self.app.post('bulk/', data=dict(action='delete',
+            task_ids=['1', '2']), follow_redirects=True)
+        self.assertIn(b'2 task(s) successfully removed', response.data)
+        self.assertEqual(db.session.query(Task).count(), 0)
+
+    def test_bulk_actions_refuse_out_of_range_ids(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        response = self.app.post('bulk/', data=dict(action='complete',
+            task_ids=['1', str(2 ** 64)]), follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'not valid task ids', response.data)
+        self.assertEqual(db.session.query(Task.status).scalar(), 1)
+
+    def test_task_tables_are_served_from_the_fragment_cache(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        fragment_cache.clear()
+        cache.clear()
+        self.app.get('tasks/')
+        self.assertEqual(fragment_cache.stats()['misses'], 2)
+
+        # a second view reuses both tables without querying the tasks
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.app.get('tasks/')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertIn(b'complete/1/', response.data)
+        self.assertEqual(fragment_cache.stats()['hits'], 2)
+        self.assertFalse([s for s in statements if 'FROM tasks' in s])
+
+        # writes invalidate the cached tables
+        self.app.get('complete/1/')
+        response = self.app.get('tasks/')
+        self.assertNotIn(b'complete/1/', response.data)
+        self.assertIn(b'delete/1/', response.data)
+
+    def test_fragment_cache_is_keyed_by_viewer(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        response = self.app.get('tasks/')
+        self.assertIn(b'complete/1/', response.data)
+        self.logout()
+        self.create_user("tessajo", "tessa@jo.com", "tessasternberg")
+        self.login("tessajo", "tessasternberg")
+        response = self.app.get('tasks/')
+        self.assertNotIn(b'complete/1/', response.data)
+
+    def test_invalid_cursor_shows_first_page(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.create_task()
+        response = self.app.get('tasks/?open_cursor=garbage')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'complete/1/', response.data)
+        response = self.app.get(
+                'tasks/?open_cursor=2018-01-01_99999999999999999999999')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'complete/1/', response.data)
     
         
 
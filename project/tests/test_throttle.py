@@ -0,0 +1,97 @@
+'''
+Unit tests for the token-bucket rate limiter of Docket app.
+'''
+
+import shutil
+import tempfile
+import unittest
+
+from project.throttle import MemoryBucketStore, FileBucketStore, \
+        TokenBucketLimiter, LoginThrottle
+
+'''
+Tests shared by every bucket store.
+'''
+class LimiterTestsMixin(object):
+
+    def test_burst_is_allowed_then_limited(self):
+        limiter = TokenBucketLimiter(self.store, rate=1, burst=3)
+        self.assertEqual([limiter.consume('k', now=100) for i in range(3)],
+                [0, 0, 0])
+        self.assertAlmostEqual(limiter.consume('k', now=100), 1.0)
+
+    def test_tokens_refill_over_time(self):
+        limiter = TokenBucketLimiter(self.store, rate=0.5, burst=1)
+        self.assertEqual(limiter.consume('k', now=100), 0)
+        self.assertAlmostEqual(limiter.consume('k', now=101), 1.0)
+        self.assertEqual(limiter.consume('k', now=103), 0)
+
+    def test_keys_have_separate_buckets(self):
+        limiter = TokenBucketLimiter(self.store, rate=1, burst=1)
+        self.assertEqual(limiter.consume('a', now=100), 0)
+        self.assertEqual(limiter.consume('b', now=100), 0)
+        self.assertNotEqual(limiter.consume('a', now=100), 0)
+
+
+class MemoryStoreTests(LimiterTestsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryBucketStore()
+
+    def test_idle_buckets_are_dropped(self):
+        limiter = TokenBucketLimiter(self.store, rate=1, burst=2)
+        limiter.consume('a', now=100)
+        limiter.consume('b', now=101)
+        limiter.consume('c', now=102.5)
+        self.assertEqual(len(self.store), 2)
+
+
+class FileStoreTests(LimiterTestsMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = FileBucketStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_buckets_are_shared_between_stores(self):
+        first = TokenBucketLimiter(self.store, rate=1, burst=1)
+        second = TokenBucketLimiter(FileBucketStore(self.directory),
+                rate=1, burst=1)
+        self.assertEqual(first.consume('k', now=100), 0)
+        self.assertNotEqual(second.consume('k', now=100), 0)
+
+
+class LoginThrottleTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def create_throttle(self, backend):
+        app = type('App', (object,), {})()
+        app.config = dict(LOGIN_THROTTLE_BACKEND=backend,
+                LOGIN_THROTTLE_DIR=self.directory,
+                LOGIN_THROTTLE_IP_RATE=1.0, LOGIN_THROTTLE_IP_BURST=20,
+                LOGIN_THROTTLE_USER_RATE=0.2, LOGIN_THROTTLE_USER_BURST=5)
+        return LoginThrottle(app)
+
+    def test_limiters_expire_buckets_after_their_own_ttl(self):
+        for backend in ('memory', 'file'):
+            throttle = self.create_throttle(backend)
+            throttle.by_user.store.prune_interval = 1
+            for i in range(5):
+                throttle.by_user.consume('user:bob', now=100)
+
+            # the ip limiter's 20s ttl must not reset bob's 25s bucket
+            throttle.by_ip.consume('ip:1.2.3.4', now=120.5)
+            for i in range(4):
+                self.assertEqual(throttle.by_user.consume('user:bob',
+                    now=120.5), 0)
+            self.assertNotEqual(throttle.by_user.consume('user:bob',
+                now=120.5), 0, backend)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,19 +2,23 @@
 Unit tests for user-related functionality of Docket app. Tests pertain to 
 the `tasks` blueprint.
 '''
+import threading
 import unittest
-import os
 
-from project import app, db, bcrypt
-from project._config import basedir
-from project.models import User, Task
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+from sqlalchemy import event
 
-TEST_DB = 'test.db'
+from project import app, db, bcrypt, hasher, throttle
+from project.models import User, Task
+from project.commands import bcrypt_cost_command
+from project.passwords import hash_cost
+from project.tests.base import DocketTestCase
 
 '''
 Test suite for setup and takedown.
 '''
-class UsersTests(unittest.TestCase):
+class UsersTests(DocketTestCase):
 
     #-------------------------------------------------------------------------#
     '''
@@ -23,21 +27,10 @@ class UsersTests(unittest.TestCase):
     #-------------------------------------------------------------------------#
         # executed prior to each test
     def setUp(self):
-        app.config['TESTING'] = True
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['DEBUG'] = False
-        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///" + os.path.join(
-                basedir, TEST_DB)
-        self.app = app.test_client()
-        db.create_all()
+        super(UsersTests, self).setUp()
 
         self.assertEquals(app.debug, False)
 
-    # executed after each test
-    def tearDown(self):
-        db.session.remove()
-        db.drop_all()
-
     # helper method to attempt login
     def login(self, name, password):
         return self.app.post('/', data=dict(name=name, password=password), 
@@ -201,6 +194,106 @@ class UsersTests(unittest.TestCase):
         self.assertIn(b'Task successfully removed from your Docket', 
             response.data)
 
+    def test_login_user_lookup_is_cached(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.login("tylertarr", "tylerhuntington")
+        self.logout()
+
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.login("tylertarr", "tylerhuntington")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertIn(b"Welcome", response.data)
+        self.assertFalse([s for s in statements if 'FROM users' in s])
+
+    def test_old_password_hashes_are_upgraded_on_login(self):
+        self.addCleanup(app.config.__setitem__, 'BCRYPT_LOG_ROUNDS',
+                app.config['BCRYPT_LOG_ROUNDS'])
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        db.session.add(User("tylertarr", "tyler@tarr.com",
+            bcrypt.generate_password_hash("tylerhuntington", 4)))
+        db.session.commit()
+
+        response = self.login("tylertarr", "tylerhuntington")
+        self.assertIn(b"Welcome", response.data)
+        user = db.session.query(User).filter_by(name="tylertarr").one()
+        self.assertEqual(hash_cost(user.password), 5)
+        self.logout()
+        response = self.login("tylertarr", "tylerhuntington")
+        self.assertIn(b"Welcome", response.data)
+
+    def test_login_returns_503_when_hashing_pool_is_full(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        executor, slots = hasher._pool()
+        taken = 0
+        while slots.acquire(False):
+            taken += 1
+        try:
+            response = self.login("tylertarr", "tylerhuntington")
+        finally:
+            for i in range(taken):
+                slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_login_returns_503_when_hashing_times_out(self):
+        self.create_user("tylertarr", "tyler@tarr.com", "tylerhuntington")
+        self.addCleanup(app.config.__setitem__, 'PASSWORD_HASH_TIMEOUT',
+                app.config['PASSWORD_HASH_TIMEOUT'])
+        app.config['PASSWORD_HASH_TIMEOUT'] = 0.05
+
+        # keep every hashing thread busy so the login's job has to wait
+        executor, slots = hasher._pool()
+        release = threading.Event()
+        for i in range(app.config['PASSWORD_HASH_WORKERS']):
+            executor.submit(release.wait)
+        try:
+            response = self.login("tylertarr", "tylerhuntington")
+        finally:
+            release.set()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_bcrypt_cost_command(self):
+        result = CliRunner().invoke(bcrypt_cost_command,
+                ['--min-rounds', '4', '--max-rounds', '5',
+                    '--target-ms', '100000'],
+                obj=ScriptInfo(create_app=lambda info: app))
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Recommended BCRYPT_LOG_ROUNDS = 5", result.output)
+
+    def test_repeated_logins_are_throttled_before_any_query(self):
+        app.config['LOGIN_THROTTLE_ENABLED'] = True
+        app.config['LOGIN_THROTTLE_USER_BURST'] = 2
+        throttle.init_app(app)
+        def reset():
+            app.config['LOGIN_THROTTLE_USER_BURST'] = 5
+            throttle.init_app(app)
+        self.addCleanup(reset)
+
+        self.login("tylertarr", "wrongpassword")
+        self.login("tylertarr", "wrongpassword")
+
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.login("tylertarr", "wrongpassword")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(b"Too many attempts", response.data)
+        self.assertEqual(statements, [])
+
+        # other user names are limited separately
+        response = self.login("tessajo", "wrongpassword")
+        self.assertEqual(response.status_code, 200)
+
     def test_task_template_displays_logged_in_user_name(self):
         self.register('william', 'william@shakespeare.com',
             'william', 'william')
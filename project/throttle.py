@@ -0,0 +1,213 @@
+"""
+project/throttle.py
+
+Token-bucket rate limiting for the login and registration forms. Each
+key (a client IP or a user name) has a bucket of `burst` tokens that
+refills at `rate` tokens per second; every attempt takes a token and
+attempts on an empty bucket are refused. A bucket is two numbers, and
+buckets that have been idle long enough to refill completely are
+dropped, since they are no different from a new bucket.
+
+Buckets live in a pluggable store: MemoryBucketStore keeps them in the
+process, FileBucketStore keeps them in a local directory (one locked
+file per key) so every worker on the host shares the same limits.
+A store expires every bucket after the same idle time, so each limiter
+has a store of its own.
+
+Tyler Huntington, 2018
+"""
+
+import errno
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBucketStore(object):
+    """
+    In-process bucket store. Buckets are kept in order of last use, so
+    expired ones are always at the front and can be dropped without
+    scanning the rest. This only holds while every update passes the
+    same `ttl`, so limiters must not share a store.
+    """
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, key, fn, now, ttl):
+        with self._lock:
+            while self._buckets:
+                oldest_key, (tokens, updated) = next(
+                        iter(self._buckets.items()))
+                if updated + ttl > now:
+                    break
+                del self._buckets[oldest_key]
+
+            state = self._buckets.pop(key, None)
+            state, result = fn(state)
+            self._buckets[key] = state
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class FileBucketStore(object):
+    """
+    Bucket store shared by the processes on a host. Each bucket is a
+    16 byte file updated under an exclusive lock; files of expired
+    buckets are removed every `prune_interval` updates, using the `ttl`
+    of the update, so limiters must not share a directory.
+    """
+
+    record = struct.Struct('!dd')
+
+    prune_interval = 1000
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._updates = 0
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def _path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.bucket')
+
+    def update(self, key, fn, now, ttl):
+        fd = os.open(self._path(key), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.read(fd, self.record.size)
+            state = None
+            if len(data) == self.record.size:
+                state = self.record.unpack(data)
+                if state[1] + ttl <= now:
+                    state = None
+            state, result = fn(state)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, self.record.pack(*state))
+        finally:
+            os.close(fd)
+
+        self._updates += 1
+        if self._updates % self.prune_interval == 0:
+            self.prune(now, ttl)
+        return result
+
+    def prune(self, now, ttl):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) + ttl <= now:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class TokenBucketLimiter(object):
+    """
+    Allows `burst` attempts at once per key, refilled at `rate`
+    attempts per second.
+    """
+
+    def __init__(self, store, rate, burst):
+        self.store = store
+        self.rate = float(rate)
+        self.burst = float(burst)
+
+    @property
+    def ttl(self):
+        # an idle bucket is full again after this many seconds
+        return self.burst / self.rate
+
+    def consume(self, key, now=None):
+        """
+        Takes a token from the bucket of `key`.
+
+        Returns:
+            0 if the attempt is allowed, otherwise the number of seconds
+            until a token is available
+        """
+        now = time.time() if now is None else now
+
+        def take(state):
+            tokens, updated = state if state is not None else (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                return (tokens - 1, now), 0
+            return (tokens, now), (1 - tokens) / self.rate
+
+        return self.store.update(key, take, now, self.ttl)
+
+
+class LoginThrottle(object):
+    """
+    Limits login and registration attempts per client IP and per user
+    name. Configured with:
+
+        LOGIN_THROTTLE_ENABLED     turn the limits on or off
+        LOGIN_THROTTLE_BACKEND     'memory' or 'file'
+        LOGIN_THROTTLE_DIR         directory of the 'file' backend
+        LOGIN_THROTTLE_IP_RATE     attempts per second per IP
+        LOGIN_THROTTLE_IP_BURST    attempts an IP may make at once
+        LOGIN_THROTTLE_USER_RATE   attempts per second per user name
+        LOGIN_THROTTLE_USER_BURST  attempts a user name may get at once
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        config = app.config
+        self.by_ip = TokenBucketLimiter(self._store('ip'),
+                config['LOGIN_THROTTLE_IP_RATE'],
+                config['LOGIN_THROTTLE_IP_BURST'])
+        self.by_user = TokenBucketLimiter(self._store('user'),
+                config['LOGIN_THROTTLE_USER_RATE'],
+                config['LOGIN_THROTTLE_USER_BURST'])
+
+    def _store(self, name):
+        # one store per limiter, as the limiters expire buckets at
+        # different ages
+        config = self.app.config
+        if config['LOGIN_THROTTLE_BACKEND'] == 'file':
+            return FileBucketStore(os.path.join(
+                config['LOGIN_THROTTLE_DIR'], name))
+        return MemoryBucketStore()
+
+    def check(self, ip, name=None):
+        """
+        Records an attempt from `ip` for user `name`.
+
+        Returns:
+            0 if the attempt may go ahead, otherwise the number of seconds
+            the client should wait
+        """
+        if not self.app.config['LOGIN_THROTTLE_ENABLED']:
+            return 0
+        wait = self.by_ip.consume('ip:{}'.format(ip))
+        if wait or not name:
+            return wait
+        return self.by_user.consume('user:{}'.format(name.lower()))
@@ -8,21 +8,77 @@ Tyler Huntington, 2018
 """
 # imports
 import datetime
+import math
+from collections import namedtuple
 from .forms import RegisterForm, LoginForm
 from functools import wraps
 from flask import Flask, flash, redirect, url_for, session, \
-        request, render_template, Blueprint
+        request, render_template, Blueprint, current_app
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.exc import IntegrityError
-from project import db, bcrypt
+from project import db, cache, hasher, throttle
 from project.models import User
+from project.passwords import HasherBusy
 
 # configuration
 users_blueprint = Blueprint('users', __name__)
 
 
+# plain, picklable copy of the user fields needed to log in
+UserRow = namedtuple('UserRow', ['id', 'name', 'password', 'role'])
+
+
 # helper functions
 
+"""
+find_user(name)
+
+Looks up a user by name through the shared cache. Only existing users
+are cached, so a name registered after a failed login is found right
+away.
+
+Args:
+    name: the user name
+
+Returns:
+    a UserRow, or None if there is no such user
+"""
+def find_user(name):
+    key = 'user:name:{}'.format(name)
+    user = cache.get(key)
+    if user is None:
+        found = User.query.filter_by(name=name).first()
+        if found is None:
+            return None
+        user = UserRow(found.id, found.name, found.password, found.role)
+        cache.set(key, user,
+                timeout=current_app.config['USER_CACHE_TIMEOUT'])
+    return user
+
+"""
+upgrade_password_hash(user, password)
+
+Re-hashes a user's password with the current work factor after a
+successful login, if their stored hash was made with a lower one. The
+upgrade is skipped when the hashing pool is busy; it will be retried
+on a later login.
+
+Args:
+    user: the UserRow that just logged in
+    password: the password they logged in with
+"""
+def upgrade_password_hash(user, password):
+    if not hasher.needs_rehash(user.password):
+        return
+    try:
+        pw_hash = hasher.generate(password)
+    except HasherBusy:
+        return
+    db.session.query(User).filter_by(id=user.id) \
+        .update({"password": pw_hash})
+    db.session.commit()
+    cache.delete('user:name:{}'.format(user.name))
+
 """
 login_required(test)
 
@@ -52,6 +108,24 @@ def login_required(test):
 
     return wrap
 
+"""
+throttled_error(wait)
+
+Builds the error message shown when an attempt is rate limited.
+"""
+def throttled_error(wait):
+    return "Too many attempts. Please try again in {} seconds.".format(
+            int(math.ceil(wait)))
+
+"""
+throttled_response(template, form, error, wait)
+
+Renders a form page with a 429 status and a Retry-After header.
+"""
+def throttled_response(template, form, error, wait):
+    return (render_template(template, form=form, error=error), 429,
+            {'Retry-After': str(int(math.ceil(wait)))})
+
 
 # route handlers
 @users_blueprint.route('/', methods = ['GET', 'POST'])
@@ -59,6 +133,7 @@ def login():
     
     # init error message var
     error = None
+    wait = 0
 
     # init logged_in variable for this session
     session["logged_in"] = None
@@ -66,10 +141,16 @@ def login():
     form = LoginForm(request.form)
 
     if request.method == 'POST':
-        if form.validate_on_submit():
-            user = User.query.filter_by(name=request.form['name']).first()
-            if (user is not None and bcrypt.check_password_hash(
+
+        # refuse attempts over the limit before any query or hash
+        wait = throttle.check(request.remote_addr, request.form.get('name'))
+        if wait:
+            error = throttled_error(wait)
+        elif form.validate_on_submit():
+            user = find_user(request.form['name'])
+            if (user is not None and hasher.check(
                 user.password, request.form['password'])):
+                upgrade_password_hash(user, request.form['password'])
                 session['logged_in'] = True
                 session['user_id'] = user.id
                 session['role'] = user.role
@@ -83,6 +164,8 @@ def login():
     if session['logged_in']:
         session.pop('logged_in', None)
    
+    if wait:
+        return(throttled_response("login.html", form, error, wait))
     return(render_template("login.html", form=form, error=error))
 
 @users_blueprint.route('/logout/')
@@ -105,11 +188,18 @@ def register():
     form = RegisterForm(request.form)
 
     if request.method == 'POST':
+
+        # refuse attempts over the limit before any query or hash
+        wait = throttle.check(request.remote_addr, request.form.get('name'))
+        if wait:
+            return(throttled_response('register.html', form,
+                throttled_error(wait), wait))
+
         if form.validate_on_submit():
             new_user = User(
                     form.name.data,
                     form.email.data,
-                    bcrypt.generate_password_hash(form.password.data)
+                    hasher.generate(form.password.data)
             )
             try:
                 db.session.add(new_user)
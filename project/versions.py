@@ -0,0 +1,57 @@
+"""
+project/versions.py
+
+Helpers for reading and bumping the data versions recorded in the
+data_versions table. Views that write tasks bump the versions in the
+same transaction as the write, so every worker process sees the new
+version as soon as the write is committed.
+
+Tyler Huntington, 2018
+"""
+
+from project import db
+from project.models import DataVersion
+
+# scope covering every task in the database
+TASKS_SCOPE = 'tasks'
+
+
+"""
+user_scope(user_id)
+
+Returns the name of the scope covering the tasks posted by a user.
+"""
+def user_scope(user_id):
+    return 'user:{}'.format(user_id)
+
+
+"""
+get_version(scope)
+
+Returns the current version of a scope (0 if it was never bumped).
+"""
+def get_version(scope):
+    row = db.session.query(DataVersion.version) \
+        .filter_by(scope=scope).first()
+    return row[0] if row is not None else 0
+
+
+"""
+bump_versions(*user_ids)
+
+Increments the version of the global task scope and of the scopes of
+the given users. The caller is responsible for committing.
+
+Args:
+    user_ids: ids of the users whose tasks were written
+"""
+def bump_versions(*user_ids):
+    scopes = [TASKS_SCOPE] + [user_scope(u) for u in set(user_ids)
+            if u is not None]
+    for scope in scopes:
+        updated = db.session.query(DataVersion).filter_by(scope=scope) \
+            .update({DataVersion.version: DataVersion.version + 1},
+                    synchronize_session=False)
+        if not updated:
+            db.session.add(DataVersion(scope, 1))
+    db.session.flush()
@@ -0,0 +1,53 @@
+"""
+wsgi.py
+
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn_config.py wsgi:app
+
+Tyler Huntington, 2018
+"""
+import gc
+
+from flask import url_for
+
+from project import app, db
+
+
+"""
+warm_up()
+
+Does the per-process setup work that every worker would otherwise
+repeat on its first requests: compiling the Jinja templates and
+building the url map. Run in the gunicorn master before the workers are
+forked, so the workers share the results copy-on-write. No database
+connection is opened here.
+"""
+def warm_up():
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.test_request_context():
+        url_for('static', filename='css/main.css')
+
+
+"""
+freeze_heap()
+
+Moves every object allocated so far out of the garbage collector's
+reach. Collections in the workers then stop touching (and so copying)
+the pages they share with the master.
+"""
+def freeze_heap():
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+"""
+after_fork()
+
+Drops the database connections inherited from the master; SQLite
+connections must not be shared between processes.
+"""
+def after_fork():
+    db.get_engine(app).dispose()